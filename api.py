@@ -1,134 +1,256 @@
-# api.py
-import logging
-import config # Import config to access APP_DEBUG
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import db_handler
-import netsuite_handler
-# import mqtt_service # No longer needed as we fetch from DB
-
-# Configure logging based on APP_DEBUG flag
-log_level = logging.DEBUG if config.APP_DEBUG else logging.INFO
-logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
-# You might want to get a specific logger instance for more control:
-# logger = logging.getLogger(__name__)
-# logger.setLevel(log_level)
-
-
-app = FastAPI()
-
-# Allow all origins for simplicity in development
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-class AssignmentPayload(BaseModel):
-    machine_id: int
-    work_order_id: int
-    is_printing_active: bool
-
-class NetSuiteFetchPayload(BaseModel):
-    created_at_min: str
-
-@app.get("/api/dashboard-data")
-async def get_dashboard_data():
-    """Endpoint for the frontend to get all necessary data."""
-    assignments_data = await db_handler.get_all_assignments()
-    if config.APP_DEBUG:
-        print(f"DEBUG: Fetched assignments_data: {assignments_data}")
-    assignments_with_summary = []
-    for assignment_row in assignments_data:
-        assignment = dict(assignment_row) # Ensure it's a mutable dict
-        if config.APP_DEBUG:
-            print(f"DEBUG: Processing assignment: {assignment}")
-        
-        default_summary = {
-            "total_coils_produced": 0,
-            "recent_coil_serial_number": "N/A",
-            "recent_coil_quantity": "N/A",
-            "total_quantity_made": 0,
-            "recent_print_status": "N/A", # Ensure these are part of default
-            "recent_error_message": "N/A"
-        }
-        # Start with default summary, update if WO is assigned
-        current_summary = default_summary.copy()
-
-        assigned_wo_no = assignment.get("work_order_no")
-        machine_id = assignment.get("machine_id")
-        if config.APP_DEBUG:
-            print(f"DEBUG: For machine_id {machine_id}, assigned_wo_no is {assigned_wo_no}")
-
-        if assigned_wo_no and machine_id is not None:
-            if config.APP_DEBUG:
-                print(f"DEBUG: Calling get_production_summary for WO: {assigned_wo_no}, Machine: {machine_id}")
-            fetched_summary = await db_handler.get_production_summary_for_assignment(
-                work_order_no=assigned_wo_no,
-                machine_id=machine_id
-            )
-            if config.APP_DEBUG:
-                print(f"DEBUG: Summary returned from DB: {fetched_summary}")
-            current_summary.update(fetched_summary)
-        
-        assignment.update(current_summary) # Merge summary into the assignment object
-        assignments_with_summary.append(assignment)
-        
-    work_orders = await db_handler.get_available_work_orders()
-    return {"assignments": assignments_with_summary, "work_orders": work_orders}
-
-@app.get("/api/mqtt-log")
-async def get_mqtt_log():
-    """Endpoint to get recent MQTT messages."""
-    log_entries = await db_handler.get_recent_raw_mqtt_messages()
-    # Format for frontend if needed, or send as is
-    # The current frontend expects a list of strings.
-    # db_handler.get_recent_raw_mqtt_messages returns a list of dicts.
-    formatted_log = [f"{entry['timestamp']} - Topic: {entry['topic']} | Payload: {entry['payload']}" for entry in log_entries]
-    return {"log": formatted_log}
-
-@app.post("/api/fetch-netsuite-orders")
-async def fetch_netsuite_orders(payload: NetSuiteFetchPayload):
-    """Endpoint triggered by the 'Refresh' button on the UI."""
-    result = await netsuite_handler.main(created_at_min=payload.created_at_min)
-    return result
-
-@app.post("/api/update-assignment")
-async def update_machine_assignment(payload: AssignmentPayload):
-    """Endpoint to assign a WO to a machine or toggle printing."""
-    success = await db_handler.update_assignment(
-        machine_id=payload.machine_id,
-        work_order_id=payload.work_order_id,
-        is_active=payload.is_printing_active
-    )
-    if success:
-        return {"status": "success", "message": "Assignment updated."}
-    else:
-        return {"status": "error", "message": "Failed to update assignment."}
-
-@app.get("/api/debug/print-log")
-async def debug_get_print_log():
-    """Debug endpoint to fetch all print log entries."""
-    async with db_handler.engine.connect() as conn:
-        result = await conn.execute(db_handler.text("SELECT * FROM print_log ORDER BY id DESC"))
-        logs = [dict(row._mapping) for row in result.all()]
-        return logs
-
-@app.get("/api/failed-prints")
-async def get_failed_prints():
-    """Endpoint to fetch failed print log entries."""
-    async with db_handler.engine.connect() as conn:
-        # Fetch relevant columns for failed prints, including zpl_content
-        stmt = db_handler.text("""
-            SELECT id, serial_number, work_order_no, machine_id, print_timestamp, error_message, zpl_content
-            FROM print_log
-            WHERE print_status = 'FAILED'
-            ORDER BY print_timestamp DESC
-            LIMIT 50
-        """) # Limit to last 50 failed prints for performance
-        result = await conn.execute(stmt)
-        failed_prints = [dict(row._mapping) for row in result.all()]
-        return failed_prints
\ No newline at end of file
+# api.py
+import csv
+import io
+import json
+import logging
+from datetime import date, datetime, timezone
+from typing import List, Literal, Optional
+import config # Import config to access APP_DEBUG
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel
+import db_handler
+import dashboard_service
+import event_stream
+import netsuite_handler
+from sync_jobs import sync_jobs
+# import mqtt_service # No longer needed as we fetch from DB
+
+# Configure logging based on APP_DEBUG flag
+log_level = logging.DEBUG if config.APP_DEBUG else logging.INFO
+logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+# You might want to get a specific logger instance for more control:
+# logger = logging.getLogger(__name__)
+# logger.setLevel(log_level)
+
+
+app = FastAPI()
+
+# Allow all origins for simplicity in development
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+@app.on_event("startup")
+async def startup():
+    sync_jobs.start_scheduler()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await sync_jobs.stop()
+    await db_handler.writer.stop() # Commits anything still queued
+    await netsuite_handler.close_http_client()
+
+class AssignmentPayload(BaseModel):
+    machine_id: int
+    work_order_id: int
+    is_printing_active: bool
+
+class NetSuiteFetchPayload(BaseModel):
+    created_at_min: Optional[str] = None # None: incremental, from the last complete sync
+
+class PrinterPayload(BaseModel):
+    name: str
+    transport: str = "tcp" # "tcp" or "win32"
+    address: str # host[:port] for tcp, UNC path for win32
+    is_enabled: bool = True
+
+class PrinterRoutePayload(BaseModel):
+    printer_id: int
+    priority: int = 0 # Lowest is tried first; equal priorities share the load
+
+class MachinePrinterRoutesPayload(BaseModel):
+    machine_id: int
+    printers: List[PrinterRoutePayload]
+
+def _snapshot_response(snapshot: dashboard_service.Snapshot, request: Request) -> Response:
+    """Sends a cached snapshot, or just 304 Not Modified if the client already has it."""
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"} # Browsers revalidate with If-None-Match
+    if snapshot.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+@app.get("/api/dashboard-data")
+async def get_dashboard_data(request: Request):
+    """Endpoint for the frontend to get all necessary data."""
+    return _snapshot_response(await dashboard_service.dashboard_snapshot.get(), request)
+
+@app.get("/api/mqtt-log")
+async def get_mqtt_log(request: Request):
+    """Endpoint to get recent MQTT messages."""
+    return _snapshot_response(await dashboard_service.mqtt_log_snapshot.get(), request)
+
+@app.get("/api/work-orders")
+async def get_work_orders(
+    q: Optional[str] = None, # Words to find in the full-text index
+    customer: Optional[str] = None,
+    part_code: Optional[str] = None, # MCPL or customer part code
+    wire_type: Optional[str] = None,
+    process: Optional[str] = None,
+    location: Optional[str] = None,
+    date_from: Optional[date] = None, # YYYY-MM-DD
+    date_to: Optional[date] = None,
+    after: Optional[str] = None, # next_cursor of the previous page
+    limit: int = Query(50, ge=1, le=500),
+    include_raw: bool = False # Include the full NetSuite record (raw_json_data)
+):
+    """Pages through the cached work orders, filtered on the server."""
+    return await db_handler.search_work_orders(
+        search=q, customer=customer, part_code=part_code, wire_type=wire_type, process=process, location=location,
+        date_from=date_from, date_to=date_to, after=after, limit=limit, include_raw=include_raw
+    )
+
+@app.get("/api/events")
+async def stream_events(request: Request, last_event_id: Optional[str] = None):
+    """
+    Server-Sent Events stream of changes: mqtt_message, print, assignment, printer_status,
+    dashboard (reload /api/dashboard-data) and reset (reload everything). Reconnecting
+    browsers resume with the Last-Event-ID header; ?last_event_id= does the same.
+    """
+    resume_from = event_stream.parse_event_id(request.headers.get("last-event-id", last_event_id))
+    subscription = await event_stream.broker.subscribe(resume_from)
+    return StreamingResponse(
+        event_stream.broker.stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"} # No buffering by proxies
+    )
+
+@app.post("/api/fetch-netsuite-orders", status_code=202)
+async def fetch_netsuite_orders(payload: NetSuiteFetchPayload):
+    """
+    Endpoint triggered by the 'Refresh' button on the UI. Starts a background sync and
+    returns its job at once; a sync of the same window already queued or running is reused.
+    """
+    job, coalesced = sync_jobs.submit(payload.created_at_min)
+    return {**job.to_dict(), "coalesced": coalesced}
+
+@app.get("/api/sync-jobs")
+async def list_sync_jobs():
+    """Recent NetSuite sync jobs, newest first."""
+    return {"jobs": sync_jobs.recent(), "counters": sync_jobs.counters}
+
+@app.get("/api/sync-jobs/{job_id}")
+async def get_sync_job(job_id: str):
+    """Phase, record counts and timing of one NetSuite sync job."""
+    job = sync_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown sync job (it may have been dropped from the history).")
+    return job.to_dict()
+
+@app.post("/api/update-assignment")
+async def update_machine_assignment(payload: AssignmentPayload):
+    """Endpoint to assign a WO to a machine or toggle printing."""
+    success = await db_handler.update_assignment(
+        machine_id=payload.machine_id,
+        work_order_id=payload.work_order_id,
+        is_active=payload.is_printing_active
+    )
+    if success:
+        return {"status": "success", "message": "Assignment updated."}
+    else:
+        return {"status": "error", "message": "Failed to update assignment."}
+
+@app.get("/api/printers")
+async def get_printers():
+    """Lists the configured printers and each machine's printer routes."""
+    printers = await db_handler.get_printers()
+    _, routes = await db_handler.get_printer_routes()
+    return {"printers": printers, "routes": routes}
+
+@app.post("/api/printers")
+async def save_printer(payload: PrinterPayload):
+    """Adds a printer, or updates the printer with the same name."""
+    if payload.transport not in ("tcp", "win32"):
+        return {"status": "error", "message": "transport must be 'tcp' or 'win32'."}
+    printer_id = await db_handler.upsert_printer(payload.name, payload.transport, payload.address, payload.is_enabled)
+    return {"status": "success", "printer_id": printer_id}
+
+@app.post("/api/printer-routes")
+async def save_printer_routes(payload: MachinePrinterRoutesPayload):
+    """Replaces the printers a machine prints to. An empty list falls back to PRINTER_IP."""
+    await db_handler.set_machine_printer_routes(
+        payload.machine_id,
+        [(route.printer_id, route.priority) for route in payload.printers]
+    )
+    return {"status": "success", "message": "Printer routes updated."}
+
+def _utc_timestamp(value: Optional[datetime]) -> Optional[str]:
+    """Formats a datetime like print_log.print_timestamp (UTC); naive values are taken as UTC."""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+def print_log_filters(
+    machine_id: Optional[int] = None,
+    work_order_no: Optional[str] = None,
+    status: Optional[Literal["PENDING", "SUCCESS", "FAILED"]] = None,
+    since: Optional[datetime] = None, # Inclusive
+    until: Optional[datetime] = None, # Exclusive
+    after_id: Optional[int] = None, # next_after_id of the previous page
+    fields: Optional[str] = None # Comma-separated columns; mqtt_payload and zpl_content only when named
+) -> dict:
+    """Query parameters shared by the print log page and export endpoints."""
+    columns = db_handler.PRINT_LOG_DEFAULT_COLUMNS
+    if fields:
+        columns = tuple(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+        unknown = [column for column in columns if column not in db_handler.PRINT_LOG_COLUMNS]
+        if unknown or not columns:
+            raise HTTPException(status_code=400, detail=f"Unknown print_log field(s): {', '.join(unknown)}. Choose from: {', '.join(db_handler.PRINT_LOG_COLUMNS)}")
+    return {
+        "columns": columns,
+        "machine_id": machine_id,
+        "work_order_no": work_order_no,
+        "status": status,
+        "since": _utc_timestamp(since),
+        "until": _utc_timestamp(until),
+        "after_id": after_id,
+    }
+
+@app.get("/api/print-log")
+async def get_print_log(filters: dict = Depends(print_log_filters), limit: int = Query(100, ge=1, le=1000)):
+    """One page of print_log, newest first. Pass next_after_id back as after_id for the next page."""
+    return await db_handler.get_print_log_page(limit=limit, **filters)
+
+async def _ndjson_lines(chunks):
+    async for chunk in chunks:
+        yield "".join(json.dumps(row, default=str) + "\n" for row in chunk)
+
+async def _csv_lines(chunks, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    async for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([row[column] for column in columns] for row in chunk)
+        yield buffer.getvalue()
+
+@app.get("/api/print-log/export")
+async def export_print_log(filters: dict = Depends(print_log_filters), format: Literal["ndjson", "csv"] = "ndjson"):
+    """Streams every matching print_log row, newest first, as NDJSON or CSV."""
+    chunks = db_handler.stream_print_log(**filters)
+    if format == "csv":
+        body, media_type = _csv_lines(chunks, filters["columns"]), "text/csv"
+    else:
+        body, media_type = _ndjson_lines(chunks), "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f"attachment; filename=print_log.{format}"})
+
+@app.get("/api/debug/print-log")
+async def debug_get_print_log(after_id: Optional[int] = None, limit: int = Query(100, ge=1, le=1000)):
+    """Debug endpoint to fetch print log entries with every column, newest first, a page at a time."""
+    page = await db_handler.get_print_log_page(db_handler.PRINT_LOG_COLUMNS, after_id=after_id, limit=limit)
+    return page["print_log"]
+
+@app.get("/api/failed-prints")
+async def get_failed_prints(after_id: Optional[int] = None, limit: int = Query(50, ge=1, le=500)):
+    """Endpoint to fetch failed print log entries, newest first; after_id continues from an earlier page."""
+    page = await db_handler.get_print_log_page(db_handler.FAILED_PRINT_COLUMNS, status="FAILED", after_id=after_id, limit=limit)
+    return page["print_log"]
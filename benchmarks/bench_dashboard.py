@@ -0,0 +1,183 @@
+# benchmarks/bench_dashboard.py
+"""
+Cost of building /api/dashboard-data as the number of machines grows.
+
+Compares dashboard_service.get_dashboard_data (one set-based machine query and two
+fixed lookups on one connection) with the per-machine assembly it replaced
+(assignments, then a summary query per machine, each on its own connection), and
+checks that both build the same response. Each machine gets a work order, printed
+labels and, for every other machine, two routed printers.
+
+    python benchmarks/bench_dashboard.py --machines 5 50 500 --polls 50
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _setup_database(db_path: str, machines: int, labels_per_machine: int):
+    import create_db
+    create_db.create_database(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("DELETE FROM machine_assignments;")
+    printer_ids = [
+        conn.execute("INSERT INTO printers (name, transport, address) VALUES (?, 'tcp', ?)", (f"P-{n}", f"10.0.0.{n}")).lastrowid
+        for n in range(1, 5)
+    ]
+    for machine_id in range(1, machines + 1):
+        work_order_no = f"WO-BENCH-{machine_id}"
+        raw = {"work_order_no": work_order_no, "mcpl_part_code": f"PART-{machine_id}"}
+        work_order_id = conn.execute(
+            "INSERT INTO work_orders (work_order_no, mcpl_part_code, total_quantity, raw_json_data) VALUES (?, ?, '1000', ?)",
+            (work_order_no, raw["mcpl_part_code"], json.dumps(raw))
+        ).lastrowid
+        conn.execute(
+            "INSERT INTO machine_assignments (machine_id, equipment_name, assigned_work_order_id, is_printing_active) VALUES (?, ?, ?, 1)",
+            (machine_id, f"Autocoiler-{machine_id}", work_order_id)
+        )
+        conn.executemany(
+            "INSERT INTO print_log (serial_number, machine_id, work_order_no, product_id, actual_length, print_status) VALUES (?, ?, ?, ?, ?, 'SUCCESS')",
+            [(f"260101-{machine_id}-{n:04d}", machine_id, work_order_no, raw["mcpl_part_code"], 2000 + n) for n in range(labels_per_machine)]
+        )
+        if machine_id % 2:
+            for priority, printer_id in enumerate(printer_ids[machine_id % 3:][:2]):
+                conn.execute("INSERT INTO machine_printer_routes (machine_id, printer_id, priority) VALUES (?, ?, ?)", (machine_id, printer_id, priority))
+    conn.commit()
+    conn.close()
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    create_db.rebuild_production_summary(conn.cursor())
+    conn.close()
+
+
+# The per-machine lookups the dashboard was assembled from before dashboard_service,
+# each on its own connection as db_handler ran them
+
+async def _all_assignments():
+    from sqlalchemy import text
+    from db_handler import engine
+    async with engine.connect() as conn:
+        result = await conn.execute(text("""
+            SELECT ma.machine_id, ma.equipment_name, ma.is_printing_active, wo.id AS work_order_id,
+                   wo.work_order_no, wo.mcpl_part_code, wo.total_quantity
+            FROM machine_assignments ma
+            LEFT JOIN work_orders wo ON ma.assigned_work_order_id = wo.id
+            ORDER BY ma.machine_id;
+        """))
+        return [row._asdict() for row in result.all()]
+
+
+async def _printer_statuses() -> dict:
+    from sqlalchemy import text
+    from db_handler import engine
+    async with engine.connect() as conn:
+        result = await conn.execute(text("""
+            SELECT printer, reachable, paper_out, head_up, paused, error_message, last_checked,
+                   (julianday('now') - julianday(last_checked)) * 86400 AS age_seconds
+            FROM printer_status
+        """))
+        return {row.printer: dict(row._mapping) for row in result}
+
+
+async def _production_summary(work_order_no: str, machine_id: int) -> dict:
+    from sqlalchemy import text
+    from db_handler import engine
+    summary = {"total_coils_produced": 0, "recent_coil_serial_number": None, "recent_coil_quantity": None,
+               "total_quantity_made": 0, "recent_print_status": None, "recent_error_message": None}
+    async with engine.connect() as conn:
+        result = await conn.execute(text("""
+            SELECT coil_count, total_length, last_serial_number, last_length, last_status, last_error
+            FROM production_summary
+            WHERE work_order_no = :wo_no AND machine_id = :m_id;
+        """), {"wo_no": work_order_no, "m_id": machine_id})
+        row = result.first()
+    if row:
+        summary.update(total_coils_produced=row.coil_count, total_quantity_made=row.total_length,
+                       recent_coil_serial_number=row.last_serial_number, recent_coil_quantity=row.last_length,
+                       recent_print_status=row.last_status, recent_error_message=row.last_error)
+    return summary
+
+
+async def per_machine_dashboard():
+    """The dashboard as it was assembled before dashboard_service: 2 queries per machine plus 4."""
+    import config
+    import db_handler
+    import printer_transport
+    from dashboard_service import printer_health
+
+    assignments_data = await _all_assignments()
+    printer_statuses = await _printer_statuses()
+    _, printer_routes = await db_handler.get_printer_routes()
+    default_printer = printer_transport.get_transport().describe() if config.PRINTER_IP else None
+    assignments = []
+    for assignment in assignments_data:
+        summary = {"total_coils_produced": 0, "recent_coil_serial_number": "N/A", "recent_coil_quantity": "N/A",
+                   "total_quantity_made": 0, "recent_print_status": "N/A", "recent_error_message": "N/A"}
+        if assignment.get("work_order_no"):
+            summary.update(await _production_summary(assignment["work_order_no"], assignment["machine_id"]))
+        assignment.update(summary)
+        routed = [printer_transport.get_transport(p["transport"], p["address"]).describe() for p in printer_routes.get(assignment["machine_id"], [])]
+        printers = routed or ([default_printer] if default_printer else [])
+        assignment["printer_route"] = [printer_health(printer, printer_statuses) for printer in printers]
+        assignment["printer_status"] = assignment["printer_route"][0] if printers else None
+        assignments.append(assignment)
+    return {"assignments": assignments}
+
+
+async def _time(build, polls: int) -> list:
+    timings = []
+    for _ in range(polls):
+        started = time.perf_counter()
+        await build()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+async def run(polls: int, machines: int):
+    import dashboard_service
+    import db_handler
+
+    expected = await per_machine_dashboard()
+    actual = await dashboard_service.get_dashboard_data()
+    if actual != expected:
+        raise SystemExit(f"dashboard_service output differs from the per-machine assembly at {machines} machine(s)")
+
+    for name, build in (("per machine", per_machine_dashboard), ("dashboard_service", dashboard_service.get_dashboard_data)):
+        timings = await _time(build, polls)
+        print(f"  {name:<18} p50 {statistics.median(timings) * 1000:8.2f} ms   max {max(timings) * 1000:8.2f} ms")
+    await db_handler.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--machines", type=int, nargs="+", default=[5, 50, 500])
+    parser.add_argument("--polls", type=int, default=50)
+    parser.add_argument("--labels", type=int, default=200, help="print_log rows per machine")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    for machines in args.machines:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "bench.db")
+            _setup_database(db_path, machines, args.labels)
+            # Each size gets its own database, so reload the modules that bind to it
+            os.environ["SQLITE_DB_PATH"] = db_path
+            os.environ["DB_NAME"] = db_path
+            os.environ.setdefault("PRINTER_TRANSPORT", "tcp")
+            for module in ("config", "db_handler", "dashboard_service", "printer_transport"):
+                sys.modules.pop(module, None)
+            print(f"{machines} machine(s), {args.labels} labels each")
+            asyncio.run(run(args.polls, machines))
+
+
+if __name__ == "__main__":
+    main()
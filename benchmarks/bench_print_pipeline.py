@@ -0,0 +1,204 @@
+# benchmarks/bench_print_pipeline.py
+"""
+End-to-end print benchmark against the fake Zebra printer in fake_zebra.py.
+
+Two scenarios, each with full labels and with printer-stored formats:
+
+- direct: print_coil_label() called back to back, as a single caller would.
+- pipeline: MQTT triggers handed to the ingest queue from a separate thread (like
+  the paho network thread), through assignment lookup, serial allocation, the
+  print spool and print_log, against a scratch database.
+
+Reports labels per second and p50/p95/p99 latency from the trigger (or call) to
+the label's bytes arriving at the printer.
+
+    python benchmarks/bench_print_pipeline.py --labels 500 --machines 5 --latency-ms 5
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_zebra import FakeZebra, job_serial  # noqa: E402
+
+SAMPLE_LABEL = {
+    "product_id": "M05A1153924",
+    "customer_product_code": "CP-1153924",
+    "customer_name": "ACME AUTOMOTIVE",
+    "actual_length": 2198,
+    "defect_type": "None",
+}
+
+
+def _report(name: str, latencies: list, elapsed: float, fake: FakeZebra):
+    labels = len(latencies)
+    if labels < 2:
+        print(f"{name:<26} only {labels} label(s) received")
+        return
+    cuts = statistics.quantiles(latencies, n=100)
+    print(f"{name:<26} {labels / elapsed:9,.0f} labels/s   "
+          f"p50 {cuts[49] * 1000:7.2f} ms   p95 {cuts[94] * 1000:7.2f} ms   p99 {cuts[98] * 1000:7.2f} ms   "
+          f"{fake.bytes_received / labels:7.0f} bytes/label")
+
+
+def _setup_database(db_path: str, machines: int):
+    import create_db
+    create_db.create_database(db_path)
+    conn = sqlite3.connect(db_path)
+    for machine_id in range(1, machines + 1):
+        work_order_no = f"WO-BENCH-{machine_id}"
+        raw = {"work_order_no": work_order_no, "mcpl_part_code": SAMPLE_LABEL["product_id"],
+               "customer_part_code": SAMPLE_LABEL["customer_product_code"], "customer_name": SAMPLE_LABEL["customer_name"]}
+        cursor = conn.execute(
+            "INSERT INTO work_orders (work_order_no, mcpl_part_code, customer_part_code, customer_name, raw_json_data) VALUES (?, ?, ?, ?, ?)",
+            (work_order_no, raw["mcpl_part_code"], raw["customer_part_code"], raw["customer_name"], json.dumps(raw))
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO machine_assignments (machine_id, equipment_name, assigned_work_order_id, is_printing_active) VALUES (?, ?, ?, 1)",
+            (machine_id, f"Autocoiler-{machine_id}", cursor.lastrowid)
+        )
+    conn.commit()
+    conn.close()
+
+
+def _use_stored_formats(stored: bool):
+    import config
+    import printer_transport
+    config.PRINTER_STORED_FORMATS = stored
+    printer_transport.close_all() # New transports pick up (or drop) the stored-format preamble
+
+
+def run_direct(fake: FakeZebra, labels: int, stored: bool):
+    from label_printer import print_coil_label
+
+    _use_stored_formats(stored)
+    print_coil_label(dict(SAMPLE_LABEL, serial_number="000000-0-0000")) # Warm-up: connect and send the preamble
+    fake.wait_for_labels(1, timeout=10)
+    fake.reset()
+
+    sent_at = {}
+    started = time.perf_counter()
+    for index in range(labels):
+        serial = f"260101-1-{index + 1:04d}"
+        sent_at[serial] = time.perf_counter()
+        ok, error, _ = print_coil_label(dict(SAMPLE_LABEL, serial_number=serial))
+        if not ok:
+            raise RuntimeError(error)
+    fake.wait_for_labels(labels, timeout=60)
+    elapsed = time.perf_counter() - started
+    latencies = [job.received_at - sent_at[job_serial(job)] for job in fake.labels() if job_serial(job) in sent_at]
+    _report(f"direct ({'stored' if stored else 'full'})", latencies, elapsed, fake)
+
+
+async def _pipeline_round(loop, fake: FakeZebra, labels: int, machines: int, rate: float, stored: bool):
+    import config
+    import mqtt_service
+    import print_spool
+    from ingest_queue import MachineIngestQueue
+
+    _use_stored_formats(stored)
+    ingest = MachineIngestQueue(
+        handler=mqtt_service.on_message_received,
+        maxsize=config.MQTT_INGEST_QUEUE_SIZE,
+        max_concurrency=config.MQTT_INGEST_MAX_CONCURRENCY,
+        put_timeout=config.MQTT_INGEST_PUT_TIMEOUT
+    )
+    ingest.start(loop)
+    fake.reset()
+
+    triggers = defaultdict(list) # machine_id -> trigger times, in submission order
+    payload = json.dumps({"d": {"pre_coil_length": [SAMPLE_LABEL["actual_length"]], "spark": [False], "diameter": [False]}})
+
+    def produce():
+        # Stands in for the paho network thread
+        interval = 1 / rate if rate else 0
+        for index in range(labels):
+            machine_id = index % machines + 1
+            topic = f"malhotra/Print_AutoCoiler{machine_id}"
+            triggers[machine_id].append(time.perf_counter())
+            ingest.submit_threadsafe(topic, topic, payload)
+            if interval:
+                time.sleep(interval)
+
+    started = time.perf_counter()
+    producer = threading.Thread(target=produce, name="bench-producer")
+    producer.start()
+    await loop.run_in_executor(None, producer.join)
+    await loop.run_in_executor(None, fake.wait_for_labels, labels, 120)
+    elapsed = time.perf_counter() - started
+
+    await ingest.drain(config.MQTT_INGEST_DRAIN_TIMEOUT)
+    await print_spool.drain_all(config.PRINT_SPOOL_DRAIN_TIMEOUT)
+    if mqtt_service.pending_print_logs:
+        await asyncio.gather(*mqtt_service.pending_print_logs, return_exceptions=True)
+
+    # The k-th trigger from a machine gets that machine's k-th serial number
+    received = defaultdict(list)
+    for job in fake.labels():
+        serial = job_serial(job)
+        if serial:
+            _, machine_id, sequence = serial.split("-")
+            received[int(machine_id)].append((int(sequence), job.received_at))
+    latencies = []
+    for machine_id, jobs in received.items():
+        jobs.sort()
+        latencies.extend(received_at - triggered for (_, received_at), triggered in zip(jobs, triggers[machine_id]))
+    _report(f"pipeline ({'stored' if stored else 'full'})", latencies, elapsed, fake)
+
+
+def run_pipeline(fake: FakeZebra, labels: int, machines: int, rate: float):
+    from db_handler import raw_log_writer
+
+    async def run_all():
+        loop = asyncio.get_running_loop()
+        await raw_log_writer.start()
+        for stored in (False, True):
+            await _pipeline_round(loop, fake, labels, machines, rate, stored)
+        await raw_log_writer.stop()
+
+    asyncio.run(run_all())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--labels", type=int, default=500)
+    parser.add_argument("--machines", type=int, default=5)
+    parser.add_argument("--rate", type=float, default=0, help="Triggers per second in the pipeline scenario (0 = as fast as possible)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated printer time per job")
+    parser.add_argument("--scenario", choices=("direct", "pipeline", "all"), default="all")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp, FakeZebra(latency=args.latency_ms / 1000) as fake:
+        db_path = os.path.join(tmp, "bench.db")
+        os.environ["SQLITE_DB_PATH"] = db_path
+        os.environ.setdefault("DB_NAME", db_path)
+        os.environ["PRINTER_TRANSPORT"] = "tcp"
+        os.environ["PRINTER_IP"] = fake.address
+        _setup_database(db_path, args.machines)
+
+        print(f"{args.labels} labels, {args.machines} machine(s), printer latency {args.latency_ms} ms/job")
+        if args.scenario in ("direct", "all"):
+            for stored in (False, True):
+                run_direct(fake, args.labels, stored)
+        if args.scenario in ("pipeline", "all"):
+            run_pipeline(fake, args.labels, args.machines, args.rate)
+
+        import printer_transport
+        printer_transport.close_all()
+
+
+if __name__ == "__main__":
+    main()
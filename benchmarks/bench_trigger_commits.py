@@ -0,0 +1,142 @@
+# benchmarks/bench_trigger_commits.py
+"""
+Database work per print trigger: separate writes compared with batched ones.
+
+- separate: the raw message and a per-label serial reservation committed on their
+  own and awaited in turn, then the finished print_log row committed on its own,
+  as triggers were first handled.
+- batched raw log: the raw message buffered by RawMqttLogWriter, the serial from
+  the SerialAllocator's blocks and the finished print_log row written with
+  log_print_event once the result is known.
+- batched trigger: the serial from the allocator's blocks, then record_print_trigger
+  and complete_print_event, which put the raw message, the PENDING print_log row and
+  the result into RawMqttLogWriter's batches (the result folded into the row when
+  that is still buffered).
+
+Each machine sends its triggers one after another, waiting only until the label could
+go to the printer; as in mqtt_service, the result is stored by a background task. The
+machines run concurrently against a scratch database, and the printer is left out, so
+the result is known at once. Reports triggers per second until everything (raw messages
+included) is committed, commits per label and p50/p95/p99 latency until the label can
+be sent to the printer and until its result is stored.
+
+    python benchmarks/bench_trigger_commits.py --labels 2000 --machines 1 5
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_print_pipeline import SAMPLE_LABEL, _setup_database  # noqa: E402
+
+PAYLOAD = json.dumps({"d": {"pre_coil_length": [SAMPLE_LABEL["actual_length"]], "spark": [False], "diameter": [False]}})
+
+
+def _cuts(latencies: list) -> str:
+    if len(latencies) < 2:
+        return "n/a"
+    cuts = statistics.quantiles(latencies, n=100)
+    return f"p50 {cuts[49] * 1000:6.2f} / p95 {cuts[94] * 1000:6.2f} / p99 {cuts[98] * 1000:6.2f} ms"
+
+
+async def _separate(machine_id: int, topic: str, timestamp: str):
+    import db_handler
+
+    await db_handler.log_raw_mqtt_message(timestamp, topic, PAYLOAD)
+    # One serial per transaction, as before the SerialAllocator reserved them in blocks
+    sequence = await db_handler.reserve_serial_block(date.today(), 1)
+    label_data = dict(SAMPLE_LABEL, serial_number=f"{time.strftime('%y%m%d')}-{machine_id}-{sequence:04d}")
+    return db_handler.log_print_event(machine_id, f"WO-BENCH-{machine_id}", label_data, PAYLOAD, True, None, "^XA^XZ", "bench", "primary")
+
+
+async def _batched_raw_log(machine_id: int, topic: str, timestamp: str):
+    import db_handler
+    from label_printer import generate_serial_number
+
+    await db_handler.raw_log_writer.log(timestamp, topic, PAYLOAD)
+    label_data = dict(SAMPLE_LABEL, serial_number=await generate_serial_number(machine_id))
+    return db_handler.log_print_event(machine_id, f"WO-BENCH-{machine_id}", label_data, PAYLOAD, True, None, "^XA^XZ", "bench", "primary")
+
+
+async def _batched_trigger(machine_id: int, topic: str, timestamp: str):
+    import db_handler
+    from label_printer import generate_serial_number
+
+    label_data = dict(SAMPLE_LABEL, serial_number=await generate_serial_number(machine_id))
+    recorded = db_handler.record_print_trigger(timestamp, topic, PAYLOAD, machine_id, f"WO-BENCH-{machine_id}", label_data)
+
+    async def store():
+        await db_handler.complete_print_event(label_data["serial_number"], True, None, "^XA^XZ", "bench", "primary")
+        await recorded
+    return store()
+
+
+async def _run(name: str, trigger, labels: int, machines: int):
+    import db_handler
+
+    ready_latencies, done_latencies, stores = [], [], []
+
+    async def stored(store, started: float):
+        await store
+        done_latencies.append(time.perf_counter() - started)
+
+    async def machine(machine_id: int, count: int):
+        topic = f"malhotra/Print_AutoCoiler{machine_id}"
+        for _ in range(count):
+            started = time.perf_counter()
+            store = await trigger(machine_id, topic, time.strftime('%Y-%m-%d %H:%M:%S'))
+            ready_latencies.append(time.perf_counter() - started)
+            stores.append(asyncio.create_task(stored(store, started)))
+
+    transactions = db_handler.writer.counters["transactions"]
+    started = time.perf_counter()
+    await asyncio.gather(*(machine(m + 1, labels // machines) for m in range(machines)))
+    await asyncio.gather(*stores)
+    await db_handler.raw_log_writer.flush()
+    elapsed = time.perf_counter() - started
+    count = len(done_latencies)
+    commits = (db_handler.writer.counters["transactions"] - transactions) / count
+    print(f"  {name:<18} {count / elapsed:8,.0f} triggers/s   {commits:4.2f} commits/label   "
+          f"ready {_cuts(ready_latencies)}   stored {_cuts(done_latencies)}")
+
+
+async def run_all(labels: int, machine_counts: list):
+    import db_handler
+
+    await db_handler.raw_log_writer.start()
+    for machines in machine_counts:
+        print(f"{labels} labels, {machines} machine(s)")
+        await _run("separate", _separate, labels, machines)
+        await _run("batched raw log", _batched_raw_log, labels, machines)
+        await _run("batched trigger", _batched_trigger, labels, machines)
+    await db_handler.raw_log_writer.stop()
+    await db_handler.writer.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--labels", type=int, default=2000)
+    parser.add_argument("--machines", type=int, nargs="+", default=[1, 5])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        os.environ["SQLITE_DB_PATH"] = db_path
+        os.environ.setdefault("DB_NAME", db_path)
+        _setup_database(db_path, max(args.machines))
+        asyncio.run(run_all(args.labels, args.machines))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# benchmarks/bench_zpl.py
+"""
+Micro-benchmark: labels rendered per second by the precompiled coil layout in
+zpl_templates.py versus the per-label f-string that print_coil_label used to build,
+and the bytes sent per label with and without printer-stored formats.
+
+    python benchmarks/bench_zpl.py --labels 50000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from label_printer import render_coil_label  # noqa: E402
+from zpl_templates import session_preamble  # noqa: E402
+
+SAMPLE_LABEL = {
+    "serial_number": "250619-3-0038",
+    "product_id": "M05A1153924",
+    "customer_product_code": "CP-1153924",
+    "customer_name": "ACME AUTOMOTIVE",
+    "actual_length": 2198,
+    "defect_type": "None",
+    "wire_type": "FLRY-A T2 (7/0.21)",
+}
+
+
+def legacy_render(label_data: dict) -> bytes:
+    """The pre-template implementation: parse the wire type and rebuild the whole f-string per label."""
+    plant_code = label_data.get("plant_code", "N/A")
+    wire_type = label_data.get("wire_type", "N/A")
+    fg_part_no = label_data.get("product_id", "N/A")
+    description = label_data.get("description", "N/A")
+    size_str = str(label_data.get("size", "0"))
+    size_uom = label_data.get("size_uom", "mm")
+    color = label_data.get("color", "N/A")
+    lot_no = label_data.get("lot_no", "N/A")
+    length = label_data.get("actual_length", 0)
+    length_uom = label_data.get("length_uom", "mtr")
+    po_no = label_data.get("po_no", "N/A")
+    operator_name = label_data.get("operator_name", "System")
+    print_date = datetime.now().strftime("%d-%m-%Y")
+    serial_no = label_data.get("serial_number", "ERROR_SN")
+    client_name = label_data.get("customer_name", "N/A")
+    qa_text = "" if label_data.get("defect_type", "None") == "None" else " (QA HOLD)"
+    try:
+        parts = wire_type.split('/')
+        strands = parts[0][-1]
+        diameter = parts[1].split(')')[0]
+        type_str = f"{wire_type} ({strands}/{diameter})"
+    except Exception:
+        type_str = wire_type
+    zpl_string = f"""
+    ^XA~TA000~JSN^LT0^MNW^MTT^PON^PMN^LH0,0^JMA^PRA,8~SD15^JUS^LRN^CI27^PA0,1,1,0^XZ
+    ^XA
+    ^MMT
+    ^PW799
+    ^LL400
+    ^LS0
+    ^FO17,43^GB690,351,2^FS
+    ^FT31,73^A0N,23,23^FH^CI28^FD{description}^FS^CI27
+    ^FT257,73^A0N,23,25^FH^CI28^FD{type_str}^FS^CI27
+    ^FT31,132^A0N,23,23^FH^CI28^FDSIZE^FS^CI27
+    ^FT257,130^A0N,23,23^FH^CI28^FD{size_str} {size_uom}^FS^CI27
+    ^FT31,161^A0N,23,23^FH^CI28^FDCOLOUR^FS^CI27
+    ^FT257,161^A0N,23,23^FH^CI28^FD{color}^FS^CI27
+    ^FT31,217^A0N,23,23^FH^CI28^FDCUSTOMER^FS^CI27
+    ^FT255,217^A0N,23,23^FH^CI28^FD{client_name}^FS^CI27
+    ^FT31,187^A0N,23,23^FH^CI28^FDLOT NO^FS^CI27
+    ^FT257,187^A0N,23,23^FH^CI28^FD{lot_no}^FS^CI27
+    ^FT31,246^A0N,23,23^FH^CI28^FDCOIL LENGTH^FS^CI27
+    ^FT257,246^A0N,23,19^FH^CI28^FD{length} {length_uom}{qa_text}^FS^CI27
+    ^FT31,306^A0N,23,23^FH^CI28^FDP.O No^FS^CI27
+    ^FT255,306^A0N,23,23^FH^CI28^FD{po_no}^FS^CI27
+    ^FT31,277^A0N,23,23^FH^CI28^FDOPERATOR^FS^CI27
+    ^FT257,275^A0N,23,23^FH^CI28^FD{operator_name}^FS^CI27
+    ^FT32,367^A0N,20,13^FH^CI28^FDMfg By^FS^CI27
+    ^BY1,3,50^FT477,105^BCN,,N,N^FH^FD{fg_part_no}^FS
+    ^FT257,96^A0N,23,20^FH^CI28^FD{fg_part_no}^FS^CI27
+    ^FT31,337^A0N,23,23^FH^CI28^FDDATE^FS^CI27
+    ^FT257,337^A0N,23,23^FH^CI28^FD{print_date}^FS^CI27
+    ^FT257,370^A0N,23,23^FH^CI28^FD{serial_no}^FS^CI27
+    ^FT31,103^A0N,23,23^FH^CI28^FDFG PART NO^FS^CI27
+    ^FT480,390^BQN,2,4^FH^FDPLAP{fg_part_no}|Q{length}|S{serial_no}|D{print_date}|L{lot_no}^FS
+    ^BY1,3,41^FT480,180^BCN,,N,N^FH^FD{length} {length_uom}^FS
+    ^FO248,54^GB0,335,3^FS
+    ^FO708,84^GFA,257,3540,12,:Z64:eJztlzEOwjAMRV2CVIklNyA7l8jR2qNk7iXIcTpmRCgCYsexu7AxMDhLn37V99qxAJetnRXohHc7HcE3fMGPdvOb3/zmN7/5zW9+85vf/H/sv213ZPozoJXveEZ8YmaubXfMj8YTc0ER8468dM7IsXOSLIe96Eeg0u5EPwKlv7PqOZA7R9F//95Z9D3wZJ5UT4F98CJ6CqTBQfQYGHoMVNmd6DFQDiz6FsjKMSkHRbiuyufDfuLrBxF0zD0=:0104^FS
+    ^FT712,28^A0N,20,20^FH^CI28^FDINSERT^FS^CI27
+    ^FT723,49^A0N,20,20^FH^CI28^FDTHIS^FS^CI27
+    ^FT723,70^A0N,20,20^FH^CI28^FDWAY^FS^CI27
+    ^FT78,370^A0N,27,20^FH^CI28^FDMCPL - {plant_code}^FS^CI27
+    ^FT408,33^A0N,25,25^FH^CI28^FDFINISH GOODS BARCODE^FS^CI27
+    ^FT62,33^A0N,25,25^FH^CI28^FDMALHOTRA CABLES^FS^CI27
+    ^PQ1,0,1,Y
+    ^XZ
+    """
+    return zpl_string.encode("utf-8")
+
+
+def template_render(label_data: dict) -> bytes:
+    """The label_printer path: resolve field values and render the precompiled layout."""
+    return render_coil_label(label_data)
+
+
+def _measure(name: str, render, labels: int, rounds: int) -> float:
+    """Best of several rounds, to keep scheduler noise out of the comparison."""
+    best = float("inf")
+    size = 0
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(labels):
+            size = len(render())
+        best = min(best, time.perf_counter() - started)
+    rate = labels / best
+    print(f"{name:<22} {rate:>12,.0f} labels/s   {best * 1e6 / labels:8.2f} us/label   {size:5d} bytes/label")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--labels", type=int, default=50000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    legacy = _measure("legacy f-string", lambda: legacy_render(SAMPLE_LABEL), args.labels, args.rounds)
+    compiled = _measure("compiled template", lambda: template_render(SAMPLE_LABEL), args.labels, args.rounds)
+    print(f"speed-up: {compiled / legacy:.2f}x")
+
+    # The legacy path never escaped field data; this shows the cost when a value needs ^FH escaping
+    escaped_label = dict(SAMPLE_LABEL, customer_name="ACME_AUTOMOTIVE^LTD")
+    _measure("compiled + escaping", lambda: template_render(escaped_label), args.labels, args.rounds)
+
+    # Stored formats: the setup block and ^DF download go out once per connection, then only the ^XF recall
+    _measure("stored-format recall", lambda: render_coil_label(SAMPLE_LABEL, stored_format=True), args.labels, args.rounds)
+    full_size = len(template_render(SAMPLE_LABEL))
+    recall_size = len(render_coil_label(SAMPLE_LABEL, stored_format=True))
+    preamble_size = len(session_preamble())
+    print(f"\nbytes per label: full {full_size}, recall {recall_size} ({recall_size / full_size:.0%}), "
+          f"preamble {preamble_size} once per connection")
+    for per_connection in (1, 10, 100, 1000):
+        session = preamble_size + recall_size * per_connection
+        print(f"  {per_connection:5d} labels/connection: {session / per_connection:8.1f} bytes/label on the wire "
+              f"vs {full_size} ({session / (full_size * per_connection) - 1:+.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# benchmarks/fake_zebra.py
+"""
+Local stand-in for a network Zebra printer on a raw TCP port.
+
+Accepts ZPL, splits it into ^XA...^XZ jobs and records when each job arrived.
+It can simulate a slow printer (per-job latency), a stall, dropped connections
+and paper-out / pause / head-up conditions reported through ~HS status replies.
+
+    python benchmarks/fake_zebra.py --port 9100 --latency-ms 50
+"""
+import argparse
+import re
+import socket
+import socketserver
+import threading
+import time
+from typing import List, Optional
+
+_HS = b"~HS"
+_JOB_START = b"^XA"
+_JOB_END = b"^XZ"
+
+
+class ReceivedJob:
+    """One ^XA...^XZ job as the fake printer received it."""
+
+    __slots__ = ("received_at", "data", "connection")
+
+    def __init__(self, received_at: float, data: bytes, connection: int):
+        self.received_at = received_at # time.perf_counter() when the closing ^XZ arrived
+        self.data = data
+        self.connection = connection
+
+    @property
+    def kind(self) -> str:
+        """'download' (^DF), 'recall' (^XF), 'setup' (no fields printed) or 'label'."""
+        if b"^DF" in self.data:
+            return "download"
+        if b"^XF" in self.data:
+            return "recall"
+        if b"^FD" not in self.data and b"^FN" not in self.data:
+            return "setup"
+        return "label"
+
+
+class FakeZebra:
+    """
+    Threaded fake printer. Use as a context manager or call start()/stop().
+
+    latency: seconds spent "printing" each job before reading further, so a slow
+        printer pushes back on the sender through TCP flow control.
+    stall_after / stall_seconds: after this many jobs (in total), stop reading for a while.
+    disconnect_after: close each connection after this many jobs, as a restarting printer would.
+    paper_out / paused / head_up: flags reported in ~HS replies; can be changed while running.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 stall_after: Optional[int] = None, stall_seconds: float = 0.0,
+                 disconnect_after: Optional[int] = None):
+        self.latency = latency
+        self.stall_after = stall_after
+        self.stall_seconds = stall_seconds
+        self.disconnect_after = disconnect_after
+        self.paper_out = False
+        self.paused = False
+        self.head_up = False
+        self.jobs: List[ReceivedJob] = []
+        self.bytes_received = 0
+        self.connections = 0
+        self.status_queries = 0
+        self._stalled = False
+        self._sockets = set()
+        self._changed = threading.Condition()
+        self._server = _Server((host, port), _Handler)
+        self._server.fake = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self) -> "FakeZebra":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-zebra", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops listening and drops open connections, like a printer being switched off."""
+        self._server.shutdown()
+        self._server.server_close()
+        for sock in list(self._sockets):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+                sock.close()
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def status_reply(self) -> bytes:
+        """A ~HS reply: three STX...ETX framed strings, with the paper out, pause and head up flags set."""
+        string1 = f"030,{int(self.paper_out)},{int(self.paused)},1245,000,0,0,0,000,0,0,0"
+        string2 = f"000,0,{int(self.head_up)},0,0,2,6,0,00000000,1,000"
+        string3 = "1234,0"
+        return b"".join(b"\x02" + s.encode("ascii") + b"\x03\r\n" for s in (string1, string2, string3))
+
+    def labels(self) -> List[ReceivedJob]:
+        """Jobs that print a label (full labels and stored-format recalls)."""
+        return [job for job in self.jobs if job.kind in ("label", "recall")]
+
+    def wait_for_labels(self, count: int, timeout: float) -> bool:
+        """Blocks until at least `count` labels have been received. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while len(self.labels()) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+        return True
+
+    def reset(self):
+        with self._changed:
+            self.jobs.clear()
+            self.bytes_received = 0
+            self.status_queries = 0
+
+    def _record(self, job: ReceivedJob):
+        with self._changed:
+            self.jobs.append(job)
+            self._changed.notify_all()
+            total = len(self.jobs)
+        if self.stall_after is not None and total == self.stall_after and not self._stalled:
+            self._stalled = True
+            time.sleep(self.stall_seconds)
+        elif self.latency:
+            time.sleep(self.latency)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        fake: FakeZebra = self.server.fake
+        fake.connections += 1
+        connection = fake.connections
+        sock: socket.socket = self.request
+        fake._sockets.add(sock)
+        try:
+            self._serve(fake, sock, connection)
+        finally:
+            fake._sockets.discard(sock)
+
+    def _serve(self, fake: FakeZebra, sock: socket.socket, connection: int):
+        jobs_on_connection = 0
+        buffer = b""
+        while True:
+            try:
+                chunk = sock.recv(65536)
+            except OSError:
+                return
+            if not chunk:
+                return
+            fake.bytes_received += len(chunk)
+            buffer += chunk
+            while True:
+                start = buffer.find(_JOB_START)
+                status = buffer.find(_HS)
+                # ~HS outside a job is answered straight away, like the printer does with ~ commands
+                if status != -1 and (start == -1 or status < start):
+                    fake.status_queries += 1
+                    sock.sendall(fake.status_reply())
+                    buffer = buffer[status + len(_HS):]
+                    continue
+                if start == -1:
+                    buffer = b""
+                    break
+                end = buffer.find(_JOB_END, start)
+                if end == -1:
+                    buffer = buffer[start:]
+                    break
+                end += len(_JOB_END)
+                fake._record(ReceivedJob(time.perf_counter(), buffer[start:end], connection))
+                buffer = buffer[end:]
+                jobs_on_connection += 1
+                if fake.disconnect_after and jobs_on_connection >= fake.disconnect_after:
+                    sock.close()
+                    return
+
+
+_SERIAL_RE = re.compile(rb"\d{6}-\d+-\d{4,}")
+
+
+def job_serial(job: ReceivedJob) -> Optional[str]:
+    """The coil serial number printed by a job, if any."""
+    match = _SERIAL_RE.search(job.data)
+    return match.group(0).decode("ascii") if match else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--disconnect-after", type=int, default=None)
+    parser.add_argument("--paper-out", action="store_true")
+    args = parser.parse_args()
+
+    fake = FakeZebra(args.host, args.port, latency=args.latency_ms / 1000, disconnect_after=args.disconnect_after)
+    fake.paper_out = args.paper_out
+    with fake:
+        print(f"Fake Zebra listening on {fake.address}. Ctrl+C to stop.")
+        try:
+            seen = 0
+            while True:
+                time.sleep(1)
+                if len(fake.jobs) != seen:
+                    seen = len(fake.jobs)
+                    print(f"{seen} job(s), {len(fake.labels())} label(s), {fake.bytes_received} bytes, "
+                          f"{fake.connections} connection(s), {fake.status_queries} status queries")
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# benchmarks/stress_serial_allocator.py
+"""
+Stress check for serial_allocator.SerialAllocator.
+
+Runs several processes, each with many concurrent coroutines per machine, against a
+scratch database and fails if any serial number is handed out twice. Each process
+crosses a simulated midnight halfway through and half of them use per-machine
+sequences, so rollover and mixed counter modes are covered as well.
+
+    python benchmarks/stress_serial_allocator.py --processes 4 --machines 5 --per-machine-count 400
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _worker(db_path: str, per_machine: bool, machines: int, count: int, block_size: int, result_queue):
+    os.environ["SQLITE_DB_PATH"] = db_path
+    os.environ.setdefault("DB_NAME", db_path)
+    from serial_allocator import SerialAllocator
+
+    day_one = date(2026, 1, 1)
+    issued = {"n": 0}
+    total = machines * count
+
+    def today():
+        # Roll over to the next day once half of this process's serials are out
+        return day_one if issued["n"] < total // 2 else day_one + timedelta(days=1)
+
+    allocator = SerialAllocator(block_size=block_size, per_machine=per_machine, today=today)
+
+    async def allocate(machine_id: int):
+        serials = []
+        for _ in range(count):
+            serial_date, sequence = await allocator.next_sequence(machine_id)
+            issued["n"] += 1
+            serials.append(f"{serial_date:%y%m%d}-{machine_id}-{sequence:04d}")
+            await asyncio.sleep(0)
+        return serials
+
+    async def run():
+        results = await asyncio.gather(*(allocate(m) for m in range(1, machines + 1)))
+        return [s for serials in results for s in serials], allocator.reservations
+
+    serials, reservations = asyncio.run(run())
+    result_queue.put((serials, reservations))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--machines", type=int, default=5)
+    parser.add_argument("--per-machine-count", type=int, default=400)
+    parser.add_argument("--block-size", type=int, default=50)
+    args = parser.parse_args()
+
+    from create_db import create_database
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "stress_serials.db")
+        create_database(db_path)
+
+        ctx = multiprocessing.get_context("spawn")
+        result_queue = ctx.Queue()
+        procs = [
+            ctx.Process(target=_worker, args=(db_path, i % 2 == 1, args.machines, args.per_machine_count, args.block_size, result_queue))
+            for i in range(args.processes)
+        ]
+        started = time.perf_counter()
+        for p in procs:
+            p.start()
+        results = [result_queue.get() for _ in procs]
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - started
+
+    serials = [s for batch, _ in results for s in batch]
+    reservations = sum(r for _, r in results)
+    duplicates = len(serials) - len(set(serials))
+    print(f"Issued {len(serials)} serials in {elapsed:.2f}s ({len(serials) / elapsed:.0f}/s) "
+          f"with {reservations} block reservations (block size {args.block_size}).")
+    if duplicates or len(serials) != args.processes * args.machines * args.per_machine_count:
+        print(f"FAILED: {duplicates} duplicate serial(s).")
+        sys.exit(1)
+    print("OK: all serial numbers are unique.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,110 @@
-# config.py
-
-import os
-from dotenv import load_dotenv
-
-load_dotenv(verbose=True, override=True) # Added verbose and override for debugging
-
-# Application Settings
-APP_DEBUG = os.getenv("APP_DEBUG", "False").lower() == "true"
-
-# MQTT Settings
-MQTT_BROKER_HOST = os.getenv("MQTT_BROKER_HOST")
-MQTT_BROKER_PORT = int(os.getenv("MQTT_BROKER_PORT", 1883))
-MQTT_USERNAME = os.getenv("MQTT_BROKER_USERNAME")
-MQTT_PASSWORD = os.getenv("MQTT_BROKER_PASSWORD")
-MQTT_PRINT_TOPICS = [
-    "malhotra/Print_AutoCoiler1",
-    "malhotra/Print_AutoCoiler2",
-    "malhotra/Print_AutoCoiler3",
-    "malhotra/Print_AutoCoiler4",
-    "malhotra/Print_AutoCoiler5"
-]
-
-# --- Database Settings ---
-# Load individual components from .env
-DB_USER = os.getenv("DB_USER", "root")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "")
-DB_HOST = os.getenv("DB_HOST", "127.0.0.1")
-DB_PORT = os.getenv("DB_PORT", "3306")
-DB_NAME = os.getenv("DB_NAME")
-DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
-
-# Construct the DATABASE_URL dynamically for SQLAlchemy
-if not DB_NAME:
-    raise ValueError("DB_NAME not found in .env file. Please set it.")
-    
-DATABASE_URL = f"sqlite+aiosqlite:///labelprinting.db"
-
-
-# NetSuite API Settings
-NS_ACCOUNT_ID = os.getenv("ACCOUNT_ID")
-NS_CONSUMER_KEY = os.getenv("CONSUMER_KEY")
-NS_CERTIFICATE_ID = os.getenv("CERTIFICATE_ID")
-NS_SCRIPT_ID = os.getenv("SCRIPT_ID")
-NS_DEPLOY_ID = os.getenv("DEPLOY_ID")
-NS_CREATED_AT_MIN = os.getenv("CREATED_AT_MIN")
-NS_PRIVATE_KEY_PATH = os.getenv("PRIVATE_KEY_PATH")
-NS_JWT_GENERATOR_PATH = os.getenv("JWT_GENERATOR_PATH", "jwt_generator.js")
-
-# Printer Settings
-PRINTER_IP = os.getenv("PRINTER_IP")
-PRINTER_PORT = int(os.getenv("PRINTER_PORT", 9100))
-
-# Graylog Logger Settings (Optional)
-GRAYLOG_HOST = os.getenv("GRAYLOG_HOST", "localhost")
+# config.py
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv(verbose=True, override=True) # Added verbose and override for debugging
+
+# Application Settings
+APP_DEBUG = os.getenv("APP_DEBUG", "False").lower() == "true"
+
+# MQTT Settings
+MQTT_BROKER_HOST = os.getenv("MQTT_BROKER_HOST")
+MQTT_BROKER_PORT = int(os.getenv("MQTT_BROKER_PORT", 1883))
+MQTT_USERNAME = os.getenv("MQTT_BROKER_USERNAME")
+MQTT_PASSWORD = os.getenv("MQTT_BROKER_PASSWORD")
+MQTT_PRINT_TOPICS = [
+    "malhotra/Print_AutoCoiler1",
+    "malhotra/Print_AutoCoiler2",
+    "malhotra/Print_AutoCoiler3",
+    "malhotra/Print_AutoCoiler4",
+    "malhotra/Print_AutoCoiler5"
+]
+# Ingest stage: one bounded queue and worker per topic (machine)
+MQTT_INGEST_QUEUE_SIZE = int(os.getenv("MQTT_INGEST_QUEUE_SIZE", 100))
+MQTT_INGEST_MAX_CONCURRENCY = int(os.getenv("MQTT_INGEST_MAX_CONCURRENCY", 2))
+MQTT_INGEST_PUT_TIMEOUT = float(os.getenv("MQTT_INGEST_PUT_TIMEOUT", 5)) # Seconds the MQTT thread waits on a full queue before dropping
+MQTT_INGEST_DRAIN_TIMEOUT = float(os.getenv("MQTT_INGEST_DRAIN_TIMEOUT", 30)) # Seconds to finish queued messages on shutdown
+# Raw message log: buffered and written in batches off the print path
+MQTT_RAW_LOG_BATCH_SIZE = int(os.getenv("MQTT_RAW_LOG_BATCH_SIZE", 50))
+MQTT_RAW_LOG_FLUSH_MS = int(os.getenv("MQTT_RAW_LOG_FLUSH_MS", 200))
+MQTT_RAW_LOG_MAX_BUFFER = int(os.getenv("MQTT_RAW_LOG_MAX_BUFFER", 1000)) # Beyond this, messages are written synchronously
+
+# --- Database Settings ---
+# Load individual components from .env
+DB_USER = os.getenv("DB_USER", "root")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "")
+DB_HOST = os.getenv("DB_HOST", "127.0.0.1")
+DB_PORT = os.getenv("DB_PORT", "3306")
+DB_NAME = os.getenv("DB_NAME")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+
+# Construct the DATABASE_URL dynamically for SQLAlchemy
+if not DB_NAME:
+    raise ValueError("DB_NAME not found in .env file. Please set it.")
+    
+SQLITE_DB_PATH = os.getenv("SQLITE_DB_PATH", "labelprinting.db")
+DATABASE_URL = f"sqlite+aiosqlite:///{SQLITE_DB_PATH}"
+
+# SQLite tuning: one writer connection per process in WAL mode (see db_writer.py)
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", 5000)) # How long a connection waits for another process's write lock
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL").upper() # NORMAL is durable across crashes in WAL mode; FULL also survives power loss
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", 16384))
+DB_WRITE_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", 100)) # Most queued writes committed together in one transaction
+
+# Serial numbers: sequences are reserved from the DB in blocks and handed out from memory
+SERIAL_BLOCK_SIZE = int(os.getenv("SERIAL_BLOCK_SIZE", 50))
+SERIAL_PER_MACHINE = os.getenv("SERIAL_PER_MACHINE", "False").lower() == "true" # Separate daily sequence per machine
+
+
+# NetSuite API Settings
+NS_ACCOUNT_ID = os.getenv("ACCOUNT_ID")
+NS_CONSUMER_KEY = os.getenv("CONSUMER_KEY")
+NS_CERTIFICATE_ID = os.getenv("CERTIFICATE_ID")
+NS_SCRIPT_ID = os.getenv("SCRIPT_ID")
+NS_DEPLOY_ID = os.getenv("DEPLOY_ID")
+NS_CREATED_AT_MIN = os.getenv("CREATED_AT_MIN")
+NS_PRIVATE_KEY_PATH = os.getenv("PRIVATE_KEY_PATH")
+NS_JWT_GENERATOR_PATH = os.getenv("JWT_GENERATOR_PATH", "jwt_generator.js")
+
+# Printer Settings
+PRINTER_IP = os.getenv("PRINTER_IP")
+PRINTER_PORT = int(os.getenv("PRINTER_PORT", 9100))
+PRINTER_TRANSPORT = os.getenv("PRINTER_TRANSPORT", "win32").lower() # "win32" (Windows shared printer) or "tcp" (raw port 9100)
+PRINTER_CONNECT_TIMEOUT = float(os.getenv("PRINTER_CONNECT_TIMEOUT", 5))
+PRINTER_WRITE_TIMEOUT = float(os.getenv("PRINTER_WRITE_TIMEOUT", 10))
+PRINTER_RECONNECT_BACKOFF_MAX = float(os.getenv("PRINTER_RECONNECT_BACKOFF_MAX", 30)) # Seconds between reconnect attempts to an offline printer, at most
+# Send printer setup and stored label formats once per connection, then only the field data per label
+PRINTER_STORED_FORMATS = os.getenv("PRINTER_STORED_FORMATS", "True" if PRINTER_TRANSPORT == "tcp" else "False").lower() == "true"
+
+# Print spool settings (one queue and worker per printer)
+PRINT_SPOOL_QUEUE_SIZE = int(os.getenv("PRINT_SPOOL_QUEUE_SIZE", 200))
+PRINT_SPOOL_COALESCE_MS = float(os.getenv("PRINT_SPOOL_COALESCE_MS", 20)) # Labels arriving this close together go out in one write
+PRINT_SPOOL_MAX_BATCH = int(os.getenv("PRINT_SPOOL_MAX_BATCH", 10))
+PRINT_SPOOL_DRAIN_TIMEOUT = float(os.getenv("PRINT_SPOOL_DRAIN_TIMEOUT", 30))
+PRINT_RETRY_ATTEMPTS = int(os.getenv("PRINT_RETRY_ATTEMPTS", 3))
+PRINT_RETRY_BACKOFF = float(os.getenv("PRINT_RETRY_BACKOFF", 1)) # Seconds before the first retry, doubled on each further attempt
+PRINT_RETRY_BACKOFF_MAX = float(os.getenv("PRINT_RETRY_BACKOFF_MAX", 10))
+PRINTER_HEALTH_INTERVAL = float(os.getenv("PRINTER_HEALTH_INTERVAL", 5)) # Seconds between ~HS status polls (0 disables monitoring)
+PRINTER_HEALTH_TIMEOUT = float(os.getenv("PRINTER_HEALTH_TIMEOUT", 2))
+PRINTER_STATUS_HEARTBEAT = float(os.getenv("PRINTER_STATUS_HEARTBEAT", 60)) # Seconds between saves of an unchanged printer status
+PRINTER_ROUTES_CHECK_INTERVAL = float(os.getenv("PRINTER_ROUTES_CHECK_INTERVAL", 1)) # Seconds between checks of the printer routes' version while printing
+
+# API response caching
+DASHBOARD_CACHE_MAX_AGE = float(os.getenv("DASHBOARD_CACHE_MAX_AGE", 5)) # Seconds a dashboard snapshot is reused while nothing changes
+
+# Live events (/api/events)
+EVENTS_POLL_INTERVAL_MS = int(os.getenv("EVENTS_POLL_INTERVAL_MS", 250)) # How often the API reads new events while clients are connected
+EVENTS_CLIENT_BUFFER = int(os.getenv("EVENTS_CLIENT_BUFFER", 256)) # Events queued per client before it is disconnected as too slow
+EVENTS_RETENTION = int(os.getenv("EVENTS_RETENTION", 10000)) # Newest events kept for clients resuming with Last-Event-ID
+EVENTS_STREAM_MAX_AGE = float(os.getenv("EVENTS_STREAM_MAX_AGE", 30)) # Seconds before a stream is closed and the client reconnects
+
+# NetSuite sync jobs
+NETSUITE_SYNC_INTERVAL = float(os.getenv("NETSUITE_SYNC_INTERVAL", 0)) # Minutes between automatic syncs in the API; 0 syncs only on request
+NETSUITE_SYNC_LOOKBACK_DAYS = int(os.getenv("NETSUITE_SYNC_LOOKBACK_DAYS", 7)) # How far back the first incremental sync fetches, before there is a sync cursor
+NETSUITE_FULL_SYNC_INTERVAL = float(os.getenv("NETSUITE_FULL_SYNC_INTERVAL", 24)) # Hours between scheduled full syncs, which catch older orders changed since; 0 disables
+NETSUITE_FULL_SYNC_DAYS = int(os.getenv("NETSUITE_FULL_SYNC_DAYS", 90)) # How many days of orders, by creation date, a full sync fetches
+
+# Graylog Logger Settings (Optional)
+GRAYLOG_HOST = os.getenv("GRAYLOG_HOST", "localhost")
 GRAYLOG_PORT = int(os.getenv("GRAYLOG_PORT", 12201))
\ No newline at end of file
@@ -1,112 +1,459 @@
-import sqlite3
-import logging
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-DB_NAME = "labelprinting.db"
-
-# --- SQLite-compatible Schema ---
-# Note: MySQL-specific features have been adapted for SQLite.
-SQL_SCHEMA = """
--- Table to store a local, de-duplicated cache of NetSuite work orders
-CREATE TABLE IF NOT EXISTS `work_orders` (
-  `id` INTEGER PRIMARY KEY AUTOINCREMENT,
-  `work_order_no` TEXT NOT NULL UNIQUE,
-  `mcpl_part_code` TEXT,
-  `customer_part_code` TEXT,
-  `customer_name` TEXT,
-  `total_quantity` TEXT,
-  `mfg_process_name` TEXT,
-  `raw_json_data` TEXT NOT NULL,
-  `location` TEXT,
-  `wire_type` TEXT,
-  `guage` TEXT,
-  `main_color` TEXT,
-  `bi_color` TEXT,
-  `work_order_date` TEXT,
-  `last_fetched_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
-);
-
--- Table to manage the CURRENT state of machine assignments
-CREATE TABLE IF NOT EXISTS `machine_assignments` (
-  `machine_id` INTEGER PRIMARY KEY,
-  `equipment_name` TEXT NOT NULL,
-  `assigned_work_order_id` INTEGER,
-  `is_printing_active` INTEGER NOT NULL DEFAULT 0, -- Using INTEGER for BOOLEAN
-  `last_updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-  FOREIGN KEY (`assigned_work_order_id`) REFERENCES `work_orders`(`id`)
-);
-
--- Table to log every printed label for auditing
-CREATE TABLE IF NOT EXISTS `print_log` (
-  `id` INTEGER PRIMARY KEY AUTOINCREMENT,
-  `serial_number` TEXT NOT NULL UNIQUE,
-  `machine_id` INTEGER NOT NULL,
-  `work_order_no` TEXT NOT NULL,
-  `product_id` TEXT NOT NULL,
-  `actual_length` INTEGER,
-  `defect_type` TEXT,
-  `mqtt_payload` TEXT,
-  `print_timestamp` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-  `print_status` TEXT NOT NULL CHECK(print_status IN ('SUCCESS', 'FAILED')),
-  `error_message` TEXT,
-  `zpl_content` TEXT NULL
-);
-
--- Table for serial number generation
-CREATE TABLE IF NOT EXISTS `serial_number_counter` (
-    `counter_date` DATE PRIMARY KEY,
-    `last_sequence` INT NOT NULL
-);
-
--- Table for raw MQTT message logging
-CREATE TABLE IF NOT EXISTS `mqtt_raw_log` (
-  `id` INTEGER PRIMARY KEY AUTOINCREMENT,
-  `timestamp` TEXT NOT NULL,
-  `topic` TEXT NOT NULL,
-  `payload` TEXT NOT NULL
-);
-"""
-
-# --- Initial Data ---
-SQL_INITIAL_DATA = """
--- Pre-populate the assignment table with your 5 machines
-INSERT OR IGNORE INTO `machine_assignments` (machine_id, equipment_name) VALUES
-(1, 'Autocoiler-1'),
-(2, 'Autocoiler-2'),
-(3, 'Autocoiler-3'),
-(4, 'Autocoiler-4'),
-(5, 'Autocoiler-5');
-"""
-
-def create_database():
-    """Creates the SQLite database and tables."""
-    try:
-        logging.info(f"Creating database '{DB_NAME}'...")
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-
-        # Enable foreign key support
-        cursor.execute("PRAGMA foreign_keys = ON;")
-
-        # Execute the schema creation script
-        logging.info("Executing schema...")
-        cursor.executescript(SQL_SCHEMA)
-
-        # Insert initial data
-        logging.info("Inserting initial data...")
-        cursor.executescript(SQL_INITIAL_DATA)
-
-        conn.commit()
-        logging.info("Database and tables created successfully.")
-
-    except sqlite3.Error as e:
-        logging.error(f"Database error: {e}")
-    finally:
-        if conn:
-            conn.close()
-            logging.info("Database connection closed.")
-
-if __name__ == "__main__":
-    create_database()
\ No newline at end of file
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import logging
+
+import sql_queries
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DB_NAME = os.getenv("SQLITE_DB_PATH", "labelprinting.db")
+
+# --- SQLite-compatible Schema ---
+# Note: MySQL-specific features have been adapted for SQLite.
+SQL_SCHEMA = """
+-- Table to store a local, de-duplicated cache of NetSuite work orders
+CREATE TABLE IF NOT EXISTS `work_orders` (
+  `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+  `work_order_no` TEXT NOT NULL UNIQUE,
+  `mcpl_part_code` TEXT,
+  `customer_part_code` TEXT,
+  `customer_name` TEXT,
+  `total_quantity` TEXT,
+  `mfg_process_name` TEXT,
+  `raw_json_data` TEXT NOT NULL,
+  `location` TEXT,
+  `wire_type` TEXT,
+  `guage` TEXT,
+  `main_color` TEXT,
+  `bi_color` TEXT,
+  `work_order_date` TEXT,
+  `last_fetched_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Table to manage the CURRENT state of machine assignments
+CREATE TABLE IF NOT EXISTS `machine_assignments` (
+  `machine_id` INTEGER PRIMARY KEY,
+  `equipment_name` TEXT NOT NULL,
+  `assigned_work_order_id` INTEGER,
+  `is_printing_active` INTEGER NOT NULL DEFAULT 0, -- Using INTEGER for BOOLEAN
+  `last_updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  FOREIGN KEY (`assigned_work_order_id`) REFERENCES `work_orders`(`id`)
+);
+
+-- Table to log every printed label for auditing
+CREATE TABLE IF NOT EXISTS `print_log` (
+  `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+  `serial_number` TEXT NOT NULL UNIQUE,
+  `machine_id` INTEGER NOT NULL,
+  `work_order_no` TEXT NOT NULL,
+  `product_id` TEXT NOT NULL,
+  `actual_length` INTEGER,
+  `defect_type` TEXT,
+  `mqtt_payload` TEXT,
+  `print_timestamp` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `print_status` TEXT NOT NULL CHECK(print_status IN ('PENDING', 'SUCCESS', 'FAILED')), -- PENDING until the printer reports back
+  `error_message` TEXT,
+  `zpl_content` TEXT NULL,
+  `printer` TEXT,
+  `route` TEXT
+);
+
+-- Table for serial number generation
+CREATE TABLE IF NOT EXISTS `serial_number_counter` (
+    `counter_date` DATE PRIMARY KEY,
+    `last_sequence` INT NOT NULL
+);
+
+-- Per-machine serial sequences (used when SERIAL_PER_MACHINE is enabled)
+CREATE TABLE IF NOT EXISTS `serial_number_counter_machine` (
+    `counter_date` DATE NOT NULL,
+    `machine_id` INTEGER NOT NULL,
+    `last_sequence` INT NOT NULL,
+    PRIMARY KEY (`counter_date`, `machine_id`)
+);
+
+-- Change counters used to invalidate in-process caches across the API and MQTT processes
+CREATE TABLE IF NOT EXISTS `cache_versions` (
+  `name` TEXT PRIMARY KEY,
+  `version` INTEGER NOT NULL DEFAULT 0
+);
+
+-- Label printers the MQTT service can print to
+CREATE TABLE IF NOT EXISTS `printers` (
+  `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+  `name` TEXT NOT NULL UNIQUE,
+  `transport` TEXT NOT NULL DEFAULT 'tcp' CHECK(transport IN ('tcp', 'win32')),
+  `address` TEXT NOT NULL,
+  `is_enabled` INTEGER NOT NULL DEFAULT 1
+);
+
+-- Which printers serve each machine. The lowest priority is tried first; printers
+-- sharing a priority split the load, higher priorities are fallbacks.
+CREATE TABLE IF NOT EXISTS `machine_printer_routes` (
+  `machine_id` INTEGER NOT NULL,
+  `printer_id` INTEGER NOT NULL,
+  `priority` INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (`machine_id`, `printer_id`),
+  FOREIGN KEY (`machine_id`) REFERENCES `machine_assignments`(`machine_id`),
+  FOREIGN KEY (`printer_id`) REFERENCES `printers`(`id`) ON DELETE CASCADE
+);
+
+-- Latest health check of each printer, written by the MQTT service
+CREATE TABLE IF NOT EXISTS `printer_status` (
+  `printer` TEXT PRIMARY KEY,
+  `reachable` INTEGER,
+  `paper_out` INTEGER NOT NULL DEFAULT 0,
+  `head_up` INTEGER NOT NULL DEFAULT 0,
+  `paused` INTEGER NOT NULL DEFAULT 0,
+  `error_message` TEXT,
+  `last_checked` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Running totals of print_log per work order and machine, updated in the same
+-- transaction as every print_log write (see --rebuild-summary)
+CREATE TABLE IF NOT EXISTS `production_summary` (
+  `work_order_no` TEXT NOT NULL,
+  `machine_id` INTEGER NOT NULL,
+  `coil_count` INTEGER NOT NULL DEFAULT 0,
+  `total_length` INTEGER NOT NULL DEFAULT 0,
+  `last_print_id` INTEGER,
+  `last_serial_number` TEXT,
+  `last_length` INTEGER,
+  `last_status` TEXT,
+  `last_error` TEXT,
+  PRIMARY KEY (`work_order_no`, `machine_id`)
+);
+
+-- Changes published to /api/events by both services, written in the same transaction
+-- as the change itself; ids are never reused, so clients can resume after one
+CREATE TABLE IF NOT EXISTS `events` (
+  `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+  `kind` TEXT NOT NULL,
+  `data` TEXT NOT NULL,
+  `created_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Table for raw MQTT message logging
+CREATE TABLE IF NOT EXISTS `mqtt_raw_log` (
+  `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+  `timestamp` TEXT NOT NULL,
+  `topic` TEXT NOT NULL,
+  `payload` TEXT NOT NULL
+);
+"""
+
+# --- Initial Data ---
+SQL_INITIAL_DATA = """
+-- Pre-populate the assignment table with your 5 machines
+INSERT OR IGNORE INTO `machine_assignments` (machine_id, equipment_name) VALUES
+(1, 'Autocoiler-1'),
+(2, 'Autocoiler-2'),
+(3, 'Autocoiler-3'),
+(4, 'Autocoiler-4'),
+(5, 'Autocoiler-5');
+
+INSERT OR IGNORE INTO `cache_versions` (name, version) VALUES ('assignments', 0), ('printer_routes', 0), ('dashboard', 0);
+"""
+
+# Columns added to existing tables before migrations were versioned: (table, column, definition).
+# Applied by migration 1; later schema changes are new entries in SQL_MIGRATIONS.
+SQL_ADDED_COLUMNS = [
+    ("print_log", "printer", "TEXT"),
+    ("print_log", "route", "TEXT"),
+]
+
+def add_missing_columns(cursor):
+    """Adds columns from SQL_ADDED_COLUMNS that a database created by an older version lacks."""
+    for table, column, definition in SQL_ADDED_COLUMNS:
+        existing = {row[1] for row in cursor.execute(f"PRAGMA table_info(`{table}`);")}
+        if column not in existing:
+            logging.info(f"Adding column {table}.{column}...")
+            cursor.execute(f"ALTER TABLE `{table}` ADD COLUMN `{column}` {definition};")
+
+# Tables whose definition changed in a way ALTER TABLE cannot apply (e.g. a CHECK
+# constraint), each with a fragment that only the current definition contains.
+# Applied by migration 1, like SQL_ADDED_COLUMNS.
+SQL_REBUILT_TABLES = [
+    ("print_log", "'PENDING'"),
+]
+
+def rebuild_changed_tables(cursor):
+    """Recreates tables from SQL_REBUILT_TABLES whose stored definition is outdated, keeping their rows."""
+    for table, marker in SQL_REBUILT_TABLES:
+        rows = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?;", (table,)).fetchall()
+        if not rows or marker in rows[0][0]:
+            continue
+        logging.info(f"Rebuilding table {table}...")
+        create_sql = re.search(rf"CREATE TABLE IF NOT EXISTS `{table}` \(.*?\n\);", SQL_SCHEMA, re.DOTALL).group(0)
+        old_columns = {r[1] for r in cursor.execute(f"PRAGMA table_info(`{table}`);")}
+        cursor.execute(f"DROP TABLE IF EXISTS `{table}_new`;")
+        cursor.execute(create_sql.replace(f"`{table}`", f"`{table}_new`", 1))
+        columns = ", ".join(f"`{r[1]}`" for r in cursor.execute(f"PRAGMA table_info(`{table}_new`);") if r[1] in old_columns)
+        cursor.execute(f"INSERT INTO `{table}_new` ({columns}) SELECT {columns} FROM `{table}`;")
+        cursor.execute(f"DROP TABLE `{table}`;")
+        cursor.execute(f"ALTER TABLE `{table}_new` RENAME TO `{table}`;")
+
+def _migrate_unversioned(cursor):
+    """Brings tables of a database created before migrations were versioned up to SQL_SCHEMA."""
+    rebuild_changed_tables(cursor)
+    add_missing_columns(cursor)
+
+# production_summary as computed from scratch: counts and lengths over all of print_log,
+# and the latest row (highest id) for the last_* columns
+SQL_PRODUCTION_SUMMARY_FROM_PRINT_LOG = """
+    SELECT g.work_order_no, g.machine_id, g.coil_count, g.total_length,
+           p.id, p.serial_number, p.actual_length, p.print_status, p.error_message
+    FROM (
+        SELECT work_order_no, machine_id, COUNT(*) AS coil_count,
+               COALESCE(SUM(actual_length), 0) AS total_length, MAX(id) AS last_print_id
+        FROM print_log
+        GROUP BY work_order_no, machine_id
+    ) g
+    JOIN print_log p ON p.id = g.last_print_id
+"""
+
+SQL_PRODUCTION_SUMMARY_COLUMNS = """
+    work_order_no, machine_id, coil_count, total_length,
+    last_print_id, last_serial_number, last_length, last_status, last_error
+"""
+
+def rebuild_production_summary(cursor):
+    """Recomputes production_summary from print_log."""
+    cursor.execute("DELETE FROM `production_summary`;")
+    cursor.execute(f"INSERT INTO `production_summary` ({SQL_PRODUCTION_SUMMARY_COLUMNS}) {SQL_PRODUCTION_SUMMARY_FROM_PRINT_LOG};")
+
+def check_production_summary(db_name: str = DB_NAME) -> list:
+    """Returns the production_summary rows that do not match print_log, each as (problem, row)."""
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    try:
+        conn.execute("BEGIN;") # One read transaction, so both comparisons see the same snapshot
+        stored = f"SELECT {SQL_PRODUCTION_SUMMARY_COLUMNS} FROM production_summary"
+        missing = conn.execute(f"{SQL_PRODUCTION_SUMMARY_FROM_PRINT_LOG} EXCEPT {stored}").fetchall()
+        wrong = conn.execute(f"{stored} EXCEPT {SQL_PRODUCTION_SUMMARY_FROM_PRINT_LOG}").fetchall()
+        conn.execute("ROLLBACK;")
+    finally:
+        conn.close()
+    return [("expected", row) for row in missing] + [("stored", row) for row in wrong]
+
+# --- Migrations ---
+# Applied in order to databases whose PRAGMA user_version is below their number, each in
+# its own transaction together with the user_version update. A migration is SQL or a
+# function taking a cursor. Never change a migration once released; add a new one.
+SQL_MIGRATIONS = [
+    (1, "upgrade tables created before versioned migrations", _migrate_unversioned),
+    (2, "indexes for the production summary and failed-print queries", """
+        -- The per-machine production summary query, before production_summary replaced it:
+        -- totals and the latest coil per work order and machine, from the index alone (dropped by migration 7)
+        CREATE INDEX IF NOT EXISTS `idx_print_log_wo_machine_time`
+            ON `print_log` (`work_order_no`, `machine_id`, `print_timestamp`, `actual_length`);
+        -- /api/failed-prints: only failed rows are indexed, newest first
+        CREATE INDEX IF NOT EXISTS `idx_print_log_failed_time`
+            ON `print_log` (`print_timestamp`) WHERE print_status = 'FAILED';
+    """),
+    (3, "fill production_summary from print_log", rebuild_production_summary),
+    (4, "work order search: ISO order date and full-text index", """
+        -- work_order_date as YYYY-MM-DD (NetSuite sends DD/MM/YYYY), for date filters
+        ALTER TABLE `work_orders` ADD COLUMN `work_order_day` TEXT GENERATED ALWAYS AS (
+            CASE
+                WHEN work_order_date GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]'
+                    THEN substr(work_order_date, 7, 4) || '-' || substr(work_order_date, 4, 2) || '-' || substr(work_order_date, 1, 2)
+                WHEN work_order_date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'
+                    THEN substr(work_order_date, 1, 10)
+            END
+        ) VIRTUAL;
+        CREATE INDEX IF NOT EXISTS `idx_work_orders_day` ON `work_orders` (`work_order_day`);
+
+        -- Free-text search over the work order fields shown on the dashboard. The index only
+        -- stores tokens (the text stays in work_orders); the triggers keep it in step with
+        -- every write, including the upserts of save_work_orders.
+        CREATE VIRTUAL TABLE IF NOT EXISTS `work_orders_fts` USING fts5(
+            work_order_no, mcpl_part_code, customer_part_code, customer_name, mfg_process_name,
+            location, wire_type, main_color, bi_color,
+            content = 'work_orders', content_rowid = 'id'
+        );
+        CREATE TRIGGER IF NOT EXISTS `work_orders_fts_insert` AFTER INSERT ON `work_orders` BEGIN
+            INSERT INTO work_orders_fts (rowid, work_order_no, mcpl_part_code, customer_part_code, customer_name, mfg_process_name, location, wire_type, main_color, bi_color)
+            VALUES (new.id, new.work_order_no, new.mcpl_part_code, new.customer_part_code, new.customer_name, new.mfg_process_name, new.location, new.wire_type, new.main_color, new.bi_color);
+        END;
+        CREATE TRIGGER IF NOT EXISTS `work_orders_fts_delete` AFTER DELETE ON `work_orders` BEGIN
+            INSERT INTO work_orders_fts (work_orders_fts, rowid, work_order_no, mcpl_part_code, customer_part_code, customer_name, mfg_process_name, location, wire_type, main_color, bi_color)
+            VALUES ('delete', old.id, old.work_order_no, old.mcpl_part_code, old.customer_part_code, old.customer_name, old.mfg_process_name, old.location, old.wire_type, old.main_color, old.bi_color);
+        END;
+        -- A sync rewrites every order it fetched; only re-index the ones whose text changed
+        CREATE TRIGGER IF NOT EXISTS `work_orders_fts_update` AFTER UPDATE ON `work_orders`
+        WHEN old.work_order_no IS NOT new.work_order_no OR old.mcpl_part_code IS NOT new.mcpl_part_code
+          OR old.customer_part_code IS NOT new.customer_part_code OR old.customer_name IS NOT new.customer_name
+          OR old.mfg_process_name IS NOT new.mfg_process_name OR old.location IS NOT new.location
+          OR old.wire_type IS NOT new.wire_type OR old.main_color IS NOT new.main_color OR old.bi_color IS NOT new.bi_color
+        BEGIN
+            INSERT INTO work_orders_fts (work_orders_fts, rowid, work_order_no, mcpl_part_code, customer_part_code, customer_name, mfg_process_name, location, wire_type, main_color, bi_color)
+            VALUES ('delete', old.id, old.work_order_no, old.mcpl_part_code, old.customer_part_code, old.customer_name, old.mfg_process_name, old.location, old.wire_type, old.main_color, old.bi_color);
+            INSERT INTO work_orders_fts (rowid, work_order_no, mcpl_part_code, customer_part_code, customer_name, mfg_process_name, location, wire_type, main_color, bi_color)
+            VALUES (new.id, new.work_order_no, new.mcpl_part_code, new.customer_part_code, new.customer_name, new.mfg_process_name, new.location, new.wire_type, new.main_color, new.bi_color);
+        END;
+        INSERT INTO work_orders_fts (work_orders_fts) VALUES ('rebuild');
+    """),
+    (5, "indexes for paging print_log by status and machine", """
+        -- Pages of print_log go newest id first. Every index also holds the rowid, so
+        -- "print_status = ? AND id < ? ORDER BY id DESC" is one range read of the index.
+        CREATE INDEX IF NOT EXISTS `idx_print_log_status` ON `print_log` (`print_status`);
+        CREATE INDEX IF NOT EXISTS `idx_print_log_machine` ON `print_log` (`machine_id`);
+        -- Failed prints are now paged by id through idx_print_log_status
+        DROP INDEX IF EXISTS `idx_print_log_failed_time`;
+    """),
+    (6, "incremental NetSuite sync: content hashes and sync cursors", """
+        -- db_handler.work_order_hash of the NetSuite record; a sync only rewrites orders whose
+        -- hash changed. Orders cached before this migration have none and are rewritten once.
+        ALTER TABLE `work_orders` ADD COLUMN `content_hash` TEXT;
+        -- One row per NetSuite query: the date its last complete sync started, from which
+        -- the next incremental sync fetches again (see sync_jobs)
+        CREATE TABLE IF NOT EXISTS `sync_cursors` (
+          `query_key` TEXT PRIMARY KEY,
+          `high_water` TEXT NOT NULL,
+          `last_synced_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          `last_counts` TEXT
+        );
+    """),
+    (7, "drop the print_log index production_summary replaced", """
+        -- Production totals are read from production_summary, so no query reads through this
+        -- index any more, but every print_log insert still had to update it. Only
+        -- --rebuild-summary/--check-summary group the whole of print_log, and they sort for that instead.
+        DROP INDEX IF EXISTS `idx_print_log_wo_machine_time`;
+    """),
+]
+
+def _split_statements(sql: str) -> list:
+    """Splits an SQL script into complete statements (trigger bodies stay whole)."""
+    statements, current = [], ""
+    for line in sql.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            statements.append(current.strip())
+            current = ""
+    if any(line.strip() and not line.strip().startswith("--") for line in current.splitlines()):
+        raise ValueError(f"Incomplete SQL statement: {current.strip()}")
+    return statements
+
+def apply_migrations(conn) -> int:
+    """Applies the migrations a database has not had yet and returns its new user_version."""
+    version = conn.execute("PRAGMA user_version;").fetchall()[0][0]
+    for number, description, migration in SQL_MIGRATIONS:
+        if number <= version:
+            continue
+        logging.info(f"Applying migration {number}: {description}...")
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE;")
+        try:
+            if callable(migration):
+                migration(cursor)
+            else:
+                for statement in _split_statements(migration):
+                    cursor.execute(statement)
+            cursor.execute(f"PRAGMA user_version = {number};")
+            cursor.execute("COMMIT;")
+        except Exception:
+            cursor.execute("ROLLBACK;")
+            raise
+        version = number
+    return version
+
+def create_database(db_name: str = DB_NAME):
+    """Creates the SQLite database and tables."""
+    conn = None
+    try:
+        logging.info(f"Creating database '{db_name}'...")
+        conn = sqlite3.connect(db_name, isolation_level=None) # Transactions are started explicitly
+        cursor = conn.cursor()
+
+        # Enable foreign key support
+        cursor.execute("PRAGMA foreign_keys = ON;")
+        # WAL lets the API read while the MQTT service writes; the setting is stored in the file
+        cursor.execute("PRAGMA journal_mode = WAL;").fetchall() # Read the reply so the statement is finished
+
+        # Execute the schema creation script
+        logging.info("Executing schema...")
+        cursor.executescript(SQL_SCHEMA)
+        version = apply_migrations(conn)
+        logging.info(f"Database schema is at version {version}.")
+
+        # Insert initial data
+        logging.info("Inserting initial data...")
+        cursor.executescript(SQL_INITIAL_DATA)
+
+        conn.commit()
+        logging.info("Database and tables created successfully.")
+
+    except sqlite3.Error as e:
+        logging.error(f"Database error: {e}")
+    finally:
+        if conn:
+            conn.close()
+            logging.info("Database connection closed.")
+
+# Queries on the print path and the dashboard, as issued by db_handler.py and api.py.
+# `python create_db.py --check-plans` fails if any of them reads a whole table.
+# The statements db_handler runs, from sql_queries, with sample parameters
+_RESULT_PARAMS = {"status": "SUCCESS", "err": None, "zpl": None, "printer": None, "route": None, "sn": "S/N"}
+SQL_HOT_QUERIES = [
+    ("work order page", *sql_queries.work_order_query(after="WO-1")),
+    ("failed prints", *sql_queries.print_log_query(sql_queries.FAILED_PRINT_COLUMNS, status="FAILED", after_id=1000, limit=51)),
+    ("print log page by machine", *sql_queries.print_log_query(sql_queries.PRINT_LOG_DEFAULT_COLUMNS, machine_id=1, after_id=1000, limit=101)),
+    ("production summary add", sql_queries.SUMMARY_ADD,
+     {"wo": "WO-1", "mid": 1, "len": 1, "sn": "S/N", "status": "PENDING", "err": None}),
+    ("print result update", sql_queries.PRINT_LOG_COMPLETE, _RESULT_PARAMS),
+    ("production summary result update", sql_queries.SUMMARY_COMPLETE, _RESULT_PARAMS),
+]
+
+def check_query_plans(db_name: str = DB_NAME) -> list:
+    """
+    Runs EXPLAIN QUERY PLAN for SQL_HOT_QUERIES and returns a description of each
+    step that scans a whole table or sorts the result in a temporary b-tree.
+    """
+    problems = []
+    conn = sqlite3.connect(db_name)
+    try:
+        for name, sql, params in SQL_HOT_QUERIES:
+            for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params):
+                detail = row[-1]
+                full_scan = detail.startswith("SCAN ") and " USING " not in detail
+                if full_scan or "TEMP B-TREE" in detail:
+                    problems.append(f"{name}: {detail}")
+                logging.info(f"{name}: {detail}")
+    finally:
+        conn.close()
+    return problems
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Creates or upgrades the SQLite database.")
+    parser.add_argument("--check-plans", action="store_true", help="After upgrading, fail if a hot query scans a whole table")
+    parser.add_argument("--rebuild-summary", action="store_true", help="After upgrading, recompute production_summary from print_log")
+    parser.add_argument("--check-summary", action="store_true", help="After upgrading, fail if production_summary does not match print_log")
+    args = parser.parse_args()
+    create_database()
+    failed = False
+    if args.check_plans:
+        problems = check_query_plans()
+        for problem in problems:
+            logging.error(f"Query plan check failed - {problem}")
+        failed = failed or bool(problems)
+    if args.rebuild_summary:
+        conn = sqlite3.connect(DB_NAME, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE;") # Print_log writes wait until the rebuilt table is committed
+            rebuild_production_summary(conn.cursor())
+            conn.execute("COMMIT;")
+        finally:
+            conn.close()
+        logging.info("Rebuilt production_summary from print_log.")
+    if args.check_summary or args.rebuild_summary:
+        mismatches = check_production_summary()
+        for side, row in mismatches:
+            logging.error(f"production_summary mismatch ({side}): {row}")
+        if not mismatches:
+            logging.info("production_summary matches print_log.")
+        failed = failed or bool(mismatches)
+    sys.exit(1 if failed else 0)
\ No newline at end of file
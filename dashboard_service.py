@@ -0,0 +1,206 @@
+# dashboard_service.py
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import text
+
+import config
+import printer_transport
+from db_handler import engine, get_dashboard_version, get_raw_mqtt_log_version, get_recent_raw_mqtt_messages
+
+# Every machine with its work order, production totals and enabled printers in routing
+# order: one row per routed printer, or a single row with NULL printer columns
+_MACHINES_QUERY = text("""
+    SELECT
+        ma.machine_id,
+        ma.equipment_name,
+        ma.is_printing_active,
+        wo.id AS work_order_id,
+        wo.work_order_no,
+        wo.mcpl_part_code,
+        wo.total_quantity,
+        ps.coil_count,
+        ps.total_length,
+        ps.last_serial_number,
+        ps.last_length,
+        ps.last_status,
+        ps.last_error,
+        p.transport AS printer_transport,
+        p.address AS printer_address
+    FROM machine_assignments ma
+    LEFT JOIN work_orders wo ON ma.assigned_work_order_id = wo.id
+    LEFT JOIN production_summary ps ON ps.work_order_no = wo.work_order_no AND ps.machine_id = ma.machine_id
+    LEFT JOIN machine_printer_routes r ON r.machine_id = ma.machine_id
+    LEFT JOIN printers p ON p.id = r.printer_id AND p.is_enabled = 1
+    ORDER BY ma.machine_id, r.priority, p.id;
+""")
+
+_PRINTER_STATUS_QUERY = text("""
+    SELECT printer, reachable, paper_out, head_up, paused, error_message, last_checked,
+           (julianday('now') - julianday(last_checked)) * 86400 AS age_seconds
+    FROM printer_status
+""")
+
+# Shown for machines without a work order
+_NO_WORK_ORDER_SUMMARY = {
+    "total_coils_produced": 0,
+    "recent_coil_serial_number": "N/A",
+    "recent_coil_quantity": "N/A",
+    "total_quantity_made": 0,
+    "recent_print_status": "N/A",
+    "recent_error_message": "N/A"
+}
+
+def printer_health(printer: str, statuses: dict) -> dict:
+    """Summarises a printer's last health check (saved by the MQTT service) for the dashboard."""
+    status = statuses.get(printer)
+    if status is None:
+        return {"printer": printer, "state": "unknown"}
+    health = {
+        "printer": printer,
+        "reachable": None if status["reachable"] is None else bool(status["reachable"]),
+        "paper_out": bool(status["paper_out"]),
+        "head_up": bool(status["head_up"]),
+        "paused": bool(status["paused"]),
+        "error_message": status["error_message"],
+        "last_checked": status["last_checked"],
+    }
+    problems = [name for name in ("paper_out", "head_up", "paused") if health[name]]
+    # An unchanged status is only saved every PRINTER_STATUS_HEARTBEAT seconds
+    stale_after = max(config.PRINTER_HEALTH_INTERVAL, config.PRINTER_STATUS_HEARTBEAT) * 2
+    if config.PRINTER_HEALTH_INTERVAL > 0 and status["age_seconds"] > stale_after:
+        health["state"] = "stale" # The MQTT service has stopped checking
+    elif health["reachable"] is False:
+        health["state"] = "unreachable"
+    elif problems:
+        health["state"] = ", ".join(problems)
+    else:
+        health["state"] = "ready"
+    return health
+
+def _machine_entry(row) -> dict:
+    machine = {
+        "machine_id": row.machine_id,
+        "equipment_name": row.equipment_name,
+        "is_printing_active": row.is_printing_active,
+        "work_order_id": row.work_order_id,
+        "work_order_no": row.work_order_no,
+        "mcpl_part_code": row.mcpl_part_code,
+        "total_quantity": row.total_quantity,
+    }
+    if not row.work_order_no:
+        machine.update(_NO_WORK_ORDER_SUMMARY)
+    elif row.coil_count is None:
+        # Assigned, but nothing printed for this work order on this machine yet
+        machine.update(total_coils_produced=0, recent_coil_serial_number=None, recent_coil_quantity=None,
+                       total_quantity_made=0, recent_print_status=None, recent_error_message=None)
+    else:
+        machine.update(total_coils_produced=row.coil_count, recent_coil_serial_number=row.last_serial_number,
+                       recent_coil_quantity=row.last_length, total_quantity_made=row.total_length,
+                       recent_print_status=row.last_status, recent_error_message=row.last_error)
+    return machine
+
+async def get_dashboard_data() -> dict:
+    """
+    Builds the /api/dashboard-data response: every machine with its assignment,
+    production summary and printer health. Work orders are not included; pages
+    read them a page at a time from /api/work-orders.
+
+    Machines come from one set-based query, and everything is read on one connection,
+    so the number of round trips does not grow with the number of machines.
+    """
+    async with engine.connect() as conn:
+        machine_rows = (await conn.execute(_MACHINES_QUERY)).all()
+        statuses = {row.printer: dict(row._mapping) for row in await conn.execute(_PRINTER_STATUS_QUERY)}
+
+    default_printer = printer_transport.get_transport().describe() if config.PRINTER_IP else None
+    machines = {}
+    routed = {}
+    for row in machine_rows:
+        if row.machine_id not in machines:
+            machines[row.machine_id] = _machine_entry(row)
+            routed[row.machine_id] = []
+        if row.printer_transport is not None:
+            routed[row.machine_id].append(printer_transport.get_transport(row.printer_transport, row.printer_address).describe())
+
+    assignments = []
+    for machine_id, machine in machines.items():
+        # Printers in routing order; the first is the machine's primary printer
+        printers = routed[machine_id] or ([default_printer] if default_printer else [])
+        machine["printer_route"] = [printer_health(printer, statuses) for printer in printers]
+        machine["printer_status"] = machine["printer_route"][0] if printers else None
+        assignments.append(machine)
+    logging.debug(f"Built dashboard data for {len(assignments)} machine(s).")
+    return {"assignments": assignments}
+
+async def get_mqtt_log_data() -> dict:
+    """Builds the /api/mqtt-log response: the recent raw MQTT messages as display lines."""
+    log_entries = await get_recent_raw_mqtt_messages()
+    # The frontend expects a list of strings
+    return {"log": [f"{entry['timestamp']} - Topic: {entry['topic']} | Payload: {entry['payload']}" for entry in log_entries]}
+
+class Snapshot:
+    """A serialized response and the state version it was built from."""
+
+    __slots__ = ("version", "etag", "body", "built_at")
+
+    def __init__(self, version: int, body: bytes):
+        self.version = version
+        self.body = body
+        # The content digest keeps the ETag honest when a rebuild at the same version differs
+        # (printer health turns "stale" with time alone)
+        self.etag = f'"{version}-{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        self.built_at = time.monotonic()
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """True if an If-None-Match header names this snapshot, so a 304 can be sent."""
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or any(tag.removeprefix("W/") == self.etag for tag in tags)
+
+class SnapshotCache:
+    """
+    Keeps the last serialized response of an endpoint with the state version it was
+    built from. Requests only read the version; the response is rebuilt when the version
+    changed or the snapshot is older than max_age, and concurrent requests share one
+    rebuild. So the cost of a poll no longer depends on how many clients are polling.
+    """
+
+    def __init__(self, name: str, build: Callable[[], Awaitable[object]], version: Callable[[], Awaitable[int]], max_age: Optional[float] = None):
+        self.name = name
+        self._build = build
+        self._version = version
+        self.max_age = max_age
+        self._snapshot: Optional[Snapshot] = None
+        self._lock = asyncio.Lock()
+        self.counters = {"served": 0, "builds": 0}
+
+    def _fresh(self, version: int) -> bool:
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            return False
+        return self.max_age is None or time.monotonic() - snapshot.built_at < self.max_age
+
+    async def get(self) -> Snapshot:
+        """Returns the current snapshot, rebuilding it first if it is out of date."""
+        self.counters["served"] += 1
+        version = await self._version()
+        if self._fresh(version):
+            return self._snapshot
+        async with self._lock:
+            if not self._fresh(version):
+                data = await self._build()
+                self._snapshot = Snapshot(version, json.dumps(data, default=str).encode("utf-8"))
+                self.counters["builds"] += 1
+                logging.debug(f"Rebuilt {self.name} snapshot at version {version} ({len(self._snapshot.body)} bytes).")
+            return self._snapshot
+
+# Printer health is judged by the age of the last check, so the dashboard is rebuilt
+# at least every DASHBOARD_CACHE_MAX_AGE seconds even if nothing was written
+dashboard_snapshot = SnapshotCache("dashboard", get_dashboard_data, get_dashboard_version, max_age=config.DASHBOARD_CACHE_MAX_AGE)
+mqtt_log_snapshot = SnapshotCache("mqtt-log", get_mqtt_log_data, get_raw_mqtt_log_version)
@@ -1,248 +1,898 @@
-# db_handler.py
-import aiomysql
-from sqlalchemy.ext.asyncio import create_async_engine
-from sqlalchemy import text
-import json
-import logging
-from datetime import date
-from typing import Optional
-import config
-
-engine = create_async_engine(config.DATABASE_URL)
-
-async def get_next_serial_sequence() -> int:
-    """Atomically gets and increments the serial number for the current day."""
-    today = date.today()
-    async with engine.begin() as conn: # begin() starts a transaction
-        # Insert or update the counter for today
-        stmt_upsert = text("""
-            INSERT INTO serial_number_counter (counter_date, last_sequence)
-            VALUES (:today, 1)
-            ON CONFLICT(counter_date) DO UPDATE SET last_sequence = last_sequence + 1;
-        """)
-        await conn.execute(stmt_upsert, {"today": today})
-        
-        # Select the newly updated value
-        stmt_select = text("SELECT last_sequence FROM serial_number_counter WHERE counter_date = :today;")
-        result = await conn.execute(stmt_select, {"today": today})
-        sequence = result.scalar_one()
-        return sequence
-
-
-async def save_work_orders(work_orders: list) -> int:
-    """Saves a list of work orders from NetSuite into the local cache."""
-    if not work_orders:
-        return 0
-    
-    async with engine.begin() as conn:
-        saved_count = 0
-        for wo in work_orders:
-            stmt = text("""
-                INSERT INTO work_orders (
-                    work_order_no, mcpl_part_code, customer_part_code, customer_name,
-                    total_quantity, mfg_process_name, raw_json_data, location,
-                    wire_type, guage, main_color, bi_color, work_order_date
-                )
-                VALUES (:wo_no, :mcpl, :cust_part, :cust_name, :qty, :process, :raw_json, :location, :wire_type, :guage, :main_color, :bi_color, :work_order_date)
-                ON CONFLICT(work_order_no) DO UPDATE SET
-                    mcpl_part_code = excluded.mcpl_part_code,
-                    customer_part_code = excluded.customer_part_code,
-                    customer_name = excluded.customer_name,
-                    total_quantity = excluded.total_quantity,
-                    mfg_process_name = excluded.mfg_process_name,
-                    raw_json_data = excluded.raw_json_data,
-                    location = excluded.location,
-                    wire_type = excluded.wire_type,
-                    guage = excluded.guage,
-                    main_color = excluded.main_color,
-                    bi_color = excluded.bi_color,
-                    work_order_date = excluded.work_order_date,
-                    last_fetched_at = CURRENT_TIMESTAMP;
-            """)
-            # Extract additional fields from the raw work order data (wo)
-            # These might be nested, adjust .get() accordingly if needed
-            await conn.execute(stmt, {
-                "wo_no": wo.get("work_order_no"),
-                "mcpl": wo.get("mcpl_part_code"),
-                "cust_part": wo.get("customer_part_code"),
-                "cust_name": wo.get("customer_name"),
-                "qty": wo.get("total_quantity"),
-                "process": wo.get("mfg_process_name"),
-                "raw_json": json.dumps(wo), # Store the full original JSON
-                "location": wo.get("location"),
-                "wire_type": wo.get("wire_type"),
-                "guage": wo.get("guage"),
-                "main_color": wo.get("main_color"),
-                "bi_color": wo.get("bi_color"),
-                "work_order_date": wo.get("date") # Assuming 'date' from NetSuite is the work order date
-            })
-            saved_count += 1
-    logging.info(f"Upserted {saved_count} work orders into local cache.")
-    return saved_count
-
-async def get_assignment_for_machine(machine_id: int) -> Optional[dict]:
-    """Gets the currently assigned work order for a specific machine."""
-    async with engine.connect() as conn:
-        stmt = text("""
-            SELECT
-                ma.is_printing_active,
-                wo.raw_json_data
-            FROM machine_assignments ma
-            JOIN work_orders wo ON ma.assigned_work_order_id = wo.id
-            WHERE ma.machine_id = :machine_id;
-        """)
-        result = await conn.execute(stmt, {"machine_id": machine_id})
-        row = result.first()
-        if row:
-            return {
-                "is_printing_active": row.is_printing_active,
-                "work_order_data": json.loads(row.raw_json_data)
-            }
-
-async def get_all_assignments():
-    """Gets the current assignment status for all machines."""
-    async with engine.connect() as conn:
-        stmt = text("""
-            SELECT
-                ma.machine_id,
-                ma.equipment_name,
-                ma.is_printing_active,
-                wo.id as work_order_id,
-                wo.work_order_no,
-                wo.mcpl_part_code,
-                wo.total_quantity
-            FROM machine_assignments ma
-            LEFT JOIN work_orders wo ON ma.assigned_work_order_id = wo.id
-            ORDER BY ma.machine_id;
-        """)
-        result = await conn.execute(stmt)
-        return [row._asdict() for row in result.all()]
-
-async def get_available_work_orders():
-    """Gets all cached work orders."""
-    async with engine.connect() as conn:
-        stmt = text("""
-            SELECT *
-            FROM work_orders
-            ORDER BY work_order_no;
-        """)
-        result = await conn.execute(stmt)
-        return [row._asdict() for row in result.all()]
-
-async def update_assignment(machine_id: int, work_order_id: int, is_active: bool):
-    """Assigns a work order to a machine and sets its printing status."""
-    async with engine.begin() as conn:
-        stmt = text("""
-            UPDATE machine_assignments
-            SET assigned_work_order_id = :wo_id, is_printing_active = :is_active
-            WHERE machine_id = :machine_id;
-        """)
-        await conn.execute(stmt, {
-            "wo_id": work_order_id,
-            "is_active": is_active,
-            "machine_id": machine_id
-        })
-    logging.info(f"Updated assignment for machine {machine_id} to WO_ID {work_order_id}, printing: {is_active}")
-    return True
-
-async def log_print_event(machine_id: int, work_order_no: str, label_data: dict, payload_str: str, is_success: bool, error_message: Optional[str], zpl_content: Optional[str] = None):
-    """Logs the print event to the print_log table."""
-    async with engine.begin() as conn:
-        stmt = text("""
-            INSERT INTO print_log (
-                serial_number, machine_id, work_order_no, product_id,
-                actual_length, defect_type, mqtt_payload,
-                print_status, error_message, zpl_content
-            )
-            VALUES (:sn, :mid, :wo, :pid, :len, :defect, :payload, :status, :err, :zpl)
-        """)
-        await conn.execute(stmt, {
-            "sn": label_data["serial_number"],
-            "mid": machine_id,
-            "wo": work_order_no,
-            "pid": label_data["product_id"],
-            "len": label_data["actual_length"],
-            "defect": label_data["defect_type"],
-            "payload": payload_str,
-            "status": "SUCCESS" if is_success else "FAILED",
-            "err": error_message,
-            "zpl": zpl_content
-        })
-    logging.info(f"Logged print event for S/N: {label_data['serial_number']}")
-async def get_production_summary_for_assignment(work_order_no: str, machine_id: int) -> dict:
-    """
-    Calculates production summary for a given work order and machine
-    from the print_log table.
-    """
-    summary = {
-        "total_coils_produced": 0,
-        "recent_coil_serial_number": None,
-        "recent_coil_quantity": None,
-        "total_quantity_made": 0,
-        "recent_print_status": None,
-        "recent_error_message": None
-    }
-    if not work_order_no: # Cannot get summary if no WO is assigned
-        logging.debug(f"DEBUG_SUMMARY: No work_order_no provided, returning default summary.")
-        return summary
-    
-    logging.debug(f"DEBUG_SUMMARY: Getting summary for WO: {work_order_no}, Machine: {machine_id}")
-
-    async with engine.connect() as conn:
-        # Get total coils and total quantity
-        stmt_totals = text("""
-            SELECT
-                COUNT(*) as total_coils,
-                SUM(actual_length) as total_qty
-            FROM print_log
-            WHERE work_order_no = :wo_no AND machine_id = :m_id;
-        """)
-        totals_result = await conn.execute(stmt_totals, {"wo_no": work_order_no, "m_id": machine_id})
-        totals_row = totals_result.first()
-        logging.debug(f"DEBUG_SUMMARY: Totals query row: {totals_row}")
-        
-        if totals_row:
-            summary["total_coils_produced"] = totals_row.total_coils if totals_row.total_coils is not None else 0
-            summary["total_quantity_made"] = totals_row.total_qty if totals_row.total_qty is not None else 0
-
-        # Get recent coil details
-        stmt_recent = text("""
-            SELECT serial_number, actual_length, print_status, error_message
-            FROM print_log
-            WHERE work_order_no = :wo_no AND machine_id = :m_id
-            ORDER BY print_timestamp DESC
-            LIMIT 1;
-        """)
-        recent_result = await conn.execute(stmt_recent, {"wo_no": work_order_no, "m_id": machine_id})
-        recent_row = recent_result.first()
-        logging.debug(f"DEBUG_SUMMARY: Recent coil query row: {recent_row}")
-
-        if recent_row:
-            summary["recent_coil_serial_number"] = recent_row.serial_number
-            summary["recent_coil_quantity"] = recent_row.actual_length
-            summary["recent_print_status"] = recent_row.print_status
-            summary["recent_error_message"] = recent_row.error_message
-            
-    logging.debug(f"DEBUG_SUMMARY: Final summary for WO {work_order_no}, Machine {machine_id}: {summary}")
-    return summary
-async def log_raw_mqtt_message(timestamp: str, topic: str, payload: str):
-    """Logs a raw MQTT message to the mqtt_raw_log table."""
-    async with engine.begin() as conn:
-        stmt = text("""
-            INSERT INTO mqtt_raw_log (timestamp, topic, payload)
-            VALUES (:ts, :topic, :payload)
-        """)
-        await conn.execute(stmt, {"ts": timestamp, "topic": topic, "payload": payload})
-
-async def get_recent_raw_mqtt_messages(limit: int = 50) -> list:
-    """Gets the most recent raw MQTT messages from the log."""
-    async with engine.connect() as conn:
-        stmt = text("""
-            SELECT timestamp, topic, payload
-            FROM mqtt_raw_log
-            ORDER BY id DESC
-            LIMIT :limit
-        """)
-        result = await conn.execute(stmt, {"limit": limit})
-        # Return as a list of dicts, but convert RowProxy to dict first
-        return [dict(row._mapping) for row in result.all()]
\ No newline at end of file
+# db_handler.py
+import aiomysql
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy import text
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import date
+from typing import Optional
+import config
+import printer_transport
+from db_writer import DatabaseWriter, apply_sqlite_pragmas
+import sql_queries
+from sql_queries import FAILED_PRINT_COLUMNS, PRINT_LOG_COLUMNS, PRINT_LOG_DEFAULT_COLUMNS, PRINT_LOG_STATUSES
+
+# Reads go through a pool of query-only connections and never hold the write lock.
+engine = create_async_engine(config.DATABASE_URL)
+apply_sqlite_pragmas(engine, {"busy_timeout": config.DB_BUSY_TIMEOUT_MS, "query_only": "ON"})
+
+# Writes go through `writer`, which owns the single connection of write_engine (see db_writer.py).
+write_engine = create_async_engine(config.DATABASE_URL, pool_size=1, max_overflow=0)
+apply_sqlite_pragmas(write_engine, {
+    "journal_mode": "WAL", # Readers see the last commit while a write is in progress
+    "synchronous": config.DB_SYNCHRONOUS,
+    "busy_timeout": config.DB_BUSY_TIMEOUT_MS, # Wait for the other process's writer instead of failing
+    "temp_store": "MEMORY",
+    "cache_size": -config.DB_CACHE_SIZE_KB,
+}, immediate_transactions=True)
+writer = DatabaseWriter(write_engine, batch_size=config.DB_WRITE_BATCH_SIZE)
+
+_CACHE_MISS = object()
+
+class AssignmentCache:
+    """
+    Process-local cache of machine assignments with the work order JSON already parsed.
+
+    Entries are tagged with the `assignments` row of cache_versions. Any process that
+    changes assignments or work orders bumps that row in the same transaction, so a
+    version mismatch on lookup drops the whole cache. Cached dicts are shared between
+    callers and must be treated as read-only.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, machine_id: int, version: int):
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+        entry = self._entries.get(machine_id, _CACHE_MISS)
+        if entry is _CACHE_MISS:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def store(self, machine_id: int, version: int, assignment: Optional[dict]):
+        if version == self._version:
+            self._entries[machine_id] = assignment
+
+    def invalidate(self):
+        self._entries.clear()
+        self._version = None
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "version": self._version}
+
+assignment_cache = AssignmentCache()
+
+async def _get_cache_version(conn, name: str) -> int:
+    result = await conn.execute(text("SELECT version FROM cache_versions WHERE name = :name;"), {"name": name})
+    version = result.scalar()
+    return version if version is not None else 0
+
+async def _bump_cache_version(conn, name: str):
+    """Bumps a cache version inside the caller's transaction."""
+    await conn.execute(text("""
+        INSERT INTO cache_versions (name, version) VALUES (:name, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1;
+    """), {"name": name})
+
+_EVENT_INSERT = text("INSERT INTO events (kind, data) VALUES (:kind, :data)")
+
+async def _publish_event(conn, kind: str, data: dict):
+    """Adds an event for /api/events inside the caller's transaction, so it is only seen if the change commits."""
+    await conn.execute(_EVENT_INSERT, {"kind": kind, "data": json.dumps(data, default=str)})
+
+async def get_dashboard_version() -> int:
+    """
+    The dashboard's state version: bumped in the same transaction as every write that
+    changes what /api/dashboard-data shows (assignments, work orders, prints, printers).
+    """
+    async with engine.connect() as conn:
+        return await _get_cache_version(conn, "dashboard")
+
+async def reserve_serial_block(counter_date: date, count: int, machine_id: Optional[int] = None) -> int:
+    """
+    Reserves `count` consecutive sequence numbers for `counter_date` in one transaction
+    and returns the last one; the caller owns (last - count + 1) .. last.
+
+    With machine_id the per-machine counter is used, otherwise the shared daily counter.
+    Either counter starts above the other's high-water mark for the day, so switching
+    SERIAL_PER_MACHINE mid-day can never hand out a serial that was already printed.
+    """
+    if machine_id is None:
+        stmt_upsert = text("""
+            INSERT INTO serial_number_counter (counter_date, last_sequence)
+            VALUES (:today, (SELECT COALESCE(MAX(last_sequence), 0) FROM serial_number_counter_machine WHERE counter_date = :today) + :count)
+            ON CONFLICT(counter_date) DO UPDATE SET last_sequence = MAX(
+                last_sequence,
+                (SELECT COALESCE(MAX(last_sequence), 0) FROM serial_number_counter_machine WHERE counter_date = :today)
+            ) + :count;
+        """)
+        stmt_select = text("SELECT last_sequence FROM serial_number_counter WHERE counter_date = :today;")
+    else:
+        stmt_upsert = text("""
+            INSERT INTO serial_number_counter_machine (counter_date, machine_id, last_sequence)
+            VALUES (:today, :machine_id, (SELECT COALESCE(MAX(last_sequence), 0) FROM serial_number_counter WHERE counter_date = :today) + :count)
+            ON CONFLICT(counter_date, machine_id) DO UPDATE SET last_sequence = MAX(
+                last_sequence,
+                (SELECT COALESCE(MAX(last_sequence), 0) FROM serial_number_counter WHERE counter_date = :today)
+            ) + :count;
+        """)
+        stmt_select = text("SELECT last_sequence FROM serial_number_counter_machine WHERE counter_date = :today AND machine_id = :machine_id;")
+
+    params = {"today": counter_date, "count": count, "machine_id": machine_id}
+
+    async def reserve(conn):
+        await conn.execute(stmt_upsert, params)
+        result = await conn.execute(stmt_select, params)
+        return result.scalar_one()
+
+    return await writer.execute(reserve)
+
+
+_WORK_ORDER_UPSERT = text("""
+    INSERT INTO work_orders (
+        work_order_no, mcpl_part_code, customer_part_code, customer_name,
+        total_quantity, mfg_process_name, raw_json_data, location,
+        wire_type, guage, main_color, bi_color, work_order_date, content_hash
+    )
+    VALUES (:wo_no, :mcpl, :cust_part, :cust_name, :qty, :process, :raw_json, :location, :wire_type, :guage, :main_color, :bi_color, :work_order_date, :content_hash)
+    ON CONFLICT(work_order_no) DO UPDATE SET
+        mcpl_part_code = excluded.mcpl_part_code,
+        customer_part_code = excluded.customer_part_code,
+        customer_name = excluded.customer_name,
+        total_quantity = excluded.total_quantity,
+        mfg_process_name = excluded.mfg_process_name,
+        raw_json_data = excluded.raw_json_data,
+        location = excluded.location,
+        wire_type = excluded.wire_type,
+        guage = excluded.guage,
+        main_color = excluded.main_color,
+        bi_color = excluded.bi_color,
+        work_order_date = excluded.work_order_date,
+        content_hash = excluded.content_hash,
+        last_fetched_at = CURRENT_TIMESTAMP;
+""")
+
+_WORK_ORDER_HASHES = text("""
+    SELECT work_order_no, content_hash FROM work_orders
+    WHERE work_order_no IN (SELECT value FROM json_each(:work_order_nos));
+""")
+
+def work_order_hash(wo: dict) -> str:
+    """Digest of a NetSuite work order's content, independent of the order of its keys."""
+    canonical = json.dumps(wo, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+async def save_work_orders(work_orders: list) -> dict:
+    """
+    Saves a list of work orders from NetSuite into the local cache. Orders whose content
+    hash matches the cached copy are left alone; new and changed ones are written in one
+    batch. Returns the counts of inserted, updated and unchanged orders.
+    """
+    latest = {}
+    for wo in work_orders:
+        if not wo.get("work_order_no"):
+            logging.warning(f"Skipping a NetSuite work order without a work_order_no: {str(wo)[:200]}")
+            continue
+        latest[wo["work_order_no"]] = wo # An order listed twice is saved as its last copy
+    if not latest:
+        return {"inserted": 0, "updated": 0, "unchanged": 0}
+
+    async def write(conn):
+        stored = dict((await conn.execute(_WORK_ORDER_HASHES, {"work_order_nos": json.dumps(list(latest))})).all())
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+        rows = []
+        for wo_no, wo in latest.items():
+            content_hash = work_order_hash(wo)
+            if wo_no not in stored:
+                counts["inserted"] += 1
+            elif stored[wo_no] != content_hash:
+                counts["updated"] += 1
+            else:
+                counts["unchanged"] += 1
+                continue
+            rows.append({
+                "wo_no": wo_no,
+                "mcpl": wo.get("mcpl_part_code"),
+                "cust_part": wo.get("customer_part_code"),
+                "cust_name": wo.get("customer_name"),
+                "qty": wo.get("total_quantity"),
+                "process": wo.get("mfg_process_name"),
+                "raw_json": json.dumps(wo), # Store the full original JSON
+                "location": wo.get("location"),
+                "wire_type": wo.get("wire_type"),
+                "guage": wo.get("guage"),
+                "main_color": wo.get("main_color"),
+                "bi_color": wo.get("bi_color"),
+                "work_order_date": wo.get("date"), # Assuming 'date' from NetSuite is the work order date
+                "content_hash": content_hash
+            })
+        if rows:
+            await conn.execute(_WORK_ORDER_UPSERT, rows)
+            # Cached assignments embed the work order JSON, so they must be re-read
+            await _bump_cache_version(conn, "assignments")
+            await _bump_cache_version(conn, "dashboard")
+            await _publish_event(conn, "dashboard", {"reason": "work_orders", "count": len(rows)})
+        return counts
+
+    counts = await writer.execute(write)
+    logging.info(f"Saved NetSuite work orders: {counts['inserted']} new, {counts['updated']} changed, {counts['unchanged']} unchanged.")
+    return counts
+
+async def get_sync_cursor(query_key: str) -> Optional[dict]:
+    """The high-water mark of a NetSuite query (see sync_jobs), or None before its first complete sync."""
+    async with engine.connect() as conn:
+        result = await conn.execute(text("""
+            SELECT query_key, high_water, last_synced_at, last_counts FROM sync_cursors WHERE query_key = :query_key;
+        """), {"query_key": query_key})
+        row = result.mappings().first()
+        return dict(row) if row else None
+
+async def save_sync_cursor(query_key: str, high_water: str, counts: dict):
+    """Moves a NetSuite query's high-water mark after a complete sync."""
+    async def write(conn):
+        await conn.execute(text("""
+            INSERT INTO sync_cursors (query_key, high_water, last_counts) VALUES (:query_key, :high_water, :counts)
+            ON CONFLICT(query_key) DO UPDATE SET
+                high_water = excluded.high_water,
+                last_counts = excluded.last_counts,
+                last_synced_at = CURRENT_TIMESTAMP;
+        """), {"query_key": query_key, "high_water": high_water, "counts": json.dumps(counts)})
+
+    await writer.execute(write)
+
+async def get_assignment_for_machine(machine_id: int) -> Optional[dict]:
+    """
+    Gets the currently assigned work order for a specific machine.
+    Served from assignment_cache unless the assignments version has changed.
+    """
+    async with engine.connect() as conn:
+        version = await _get_cache_version(conn, "assignments")
+        cached = assignment_cache.lookup(machine_id, version)
+        if cached is not _CACHE_MISS:
+            return cached
+
+        stmt = text("""
+            SELECT
+                ma.is_printing_active,
+                wo.raw_json_data
+            FROM machine_assignments ma
+            JOIN work_orders wo ON ma.assigned_work_order_id = wo.id
+            WHERE ma.machine_id = :machine_id;
+        """)
+        result = await conn.execute(stmt, {"machine_id": machine_id})
+        row = result.first()
+        assignment = None
+        if row:
+            assignment = {
+                "is_printing_active": row.is_printing_active,
+                "work_order_data": json.loads(row.raw_json_data)
+            }
+        assignment_cache.store(machine_id, version, assignment)
+        return assignment
+
+async def search_work_orders(search: Optional[str] = None, customer: Optional[str] = None, part_code: Optional[str] = None,
+                             wire_type: Optional[str] = None, process: Optional[str] = None, location: Optional[str] = None,
+                             date_from: Optional[date] = None, date_to: Optional[date] = None,
+                             after: Optional[str] = None, limit: int = 50, include_raw: bool = False) -> dict:
+    """
+    Returns one page of cached work orders ordered by work order number, with the cursor
+    of the next page (None on the last one). `after` is the cursor of the previous page,
+    so each page is one index range read however deep the client pages.
+
+    `search` matches words in the full-text index (work_orders_fts). Text filters match
+    anywhere in their field, ignoring case; wire_type must match exactly, and the dates
+    bound work_order_date inclusively.
+    """
+    sql, params = sql_queries.work_order_query(search, customer, part_code, wire_type, process, location,
+                                               date_from, date_to, after, limit, include_raw)
+    async with engine.connect() as conn:
+        result = await conn.execute(text(sql), params)
+        work_orders = [row._asdict() for row in result.all()]
+    next_cursor = None
+    if len(work_orders) > limit:
+        work_orders = work_orders[:limit]
+        next_cursor = work_orders[-1]["work_order_no"]
+    return {"work_orders": work_orders, "next_cursor": next_cursor}
+
+# A machine's assignment as it is now, with the work order's production summary on
+# that machine (in the dashboard's field names), so clients can update it without refetching
+_ASSIGNMENT_EVENT_INSERT = text("""
+    INSERT INTO events (kind, data)
+    SELECT 'assignment', json_object(
+        'machine_id', ma.machine_id,
+        'work_order_id', wo.id,
+        'work_order_no', wo.work_order_no,
+        'mcpl_part_code', wo.mcpl_part_code,
+        'total_quantity', wo.total_quantity,
+        'is_printing_active', json(CASE WHEN :is_active THEN 'true' ELSE 'false' END),
+        'summary', json_object(
+            'total_coils_produced', COALESCE(ps.coil_count, 0),
+            'total_quantity_made', COALESCE(ps.total_length, 0),
+            'recent_coil_serial_number', ps.last_serial_number,
+            'recent_coil_quantity', ps.last_length,
+            'recent_print_status', ps.last_status,
+            'recent_error_message', ps.last_error
+        )
+    )
+    FROM machine_assignments ma
+    LEFT JOIN work_orders wo ON wo.id = ma.assigned_work_order_id
+    LEFT JOIN production_summary ps ON ps.work_order_no = wo.work_order_no AND ps.machine_id = ma.machine_id
+    WHERE ma.machine_id = :machine_id
+""")
+
+async def update_assignment(machine_id: int, work_order_id: int, is_active: bool):
+    """Assigns a work order to a machine and sets its printing status."""
+    async def write(conn):
+        stmt = text("""
+            UPDATE machine_assignments
+            SET assigned_work_order_id = :wo_id, is_printing_active = :is_active
+            WHERE machine_id = :machine_id;
+        """)
+        await conn.execute(stmt, {
+            "wo_id": work_order_id,
+            "is_active": is_active,
+            "machine_id": machine_id
+        })
+        await _bump_cache_version(conn, "assignments")
+        await _bump_cache_version(conn, "dashboard")
+        await conn.execute(_ASSIGNMENT_EVENT_INSERT, {"machine_id": machine_id, "is_active": bool(is_active)})
+    await writer.execute(write)
+    assignment_cache.invalidate()
+    logging.info(f"Updated assignment for machine {machine_id} to WO_ID {work_order_id}, printing: {is_active}")
+    return True
+
+_PRINT_LOG_INSERT = text(sql_queries.PRINT_LOG_INSERT)
+_SUMMARY_ADD = text(sql_queries.SUMMARY_ADD)
+_PRINT_LOG_COMPLETE = text(sql_queries.PRINT_LOG_COMPLETE)
+_SUMMARY_COMPLETE = text(sql_queries.SUMMARY_COMPLETE)
+
+_RAW_LOG_INSERT = text("""
+    INSERT INTO mqtt_raw_log (timestamp, topic, payload)
+    VALUES (:ts, :topic, :payload)
+""")
+
+# Takes the same parameters as _RAW_LOG_INSERT
+_RAW_LOG_EVENT_INSERT = text("""
+    INSERT INTO events (kind, data)
+    VALUES ('mqtt_message', json_object('timestamp', :ts, 'topic', :topic, 'payload', :payload))
+""")
+
+# Deletes up to :limit of the oldest events beyond the newest :keep, oldest first
+_EVENTS_PRUNE = text("""
+    DELETE FROM events
+    WHERE id IN (SELECT id FROM events WHERE id <= (SELECT MAX(id) FROM events) - :keep ORDER BY id LIMIT :limit)
+""")
+
+# A print_log row as it is now, with the production summary it belongs to (in the
+# dashboard's field names), so clients can update a machine without refetching
+_PRINT_EVENT_INSERT = text("""
+    INSERT INTO events (kind, data)
+    SELECT 'print', json_object(
+        'serial_number', pl.serial_number,
+        'machine_id', pl.machine_id,
+        'work_order_no', pl.work_order_no,
+        'actual_length', pl.actual_length,
+        'print_status', pl.print_status,
+        'error_message', pl.error_message,
+        'printer', pl.printer,
+        'route', pl.route,
+        'summary', json_object(
+            'total_coils_produced', ps.coil_count,
+            'total_quantity_made', ps.total_length,
+            'recent_coil_serial_number', ps.last_serial_number,
+            'recent_coil_quantity', ps.last_length,
+            'recent_print_status', ps.last_status,
+            'recent_error_message', ps.last_error
+        )
+    )
+    FROM print_log pl
+    LEFT JOIN production_summary ps ON ps.work_order_no = pl.work_order_no AND ps.machine_id = pl.machine_id
+    WHERE pl.serial_number = :sn
+""")
+
+def _print_log_params(machine_id: int, work_order_no: str, label_data: dict, payload_str: str, status: str,
+                      error_message: Optional[str] = None, zpl_content: Optional[str] = None,
+                      printer: Optional[str] = None, route: Optional[str] = None) -> dict:
+    return {
+        "sn": label_data["serial_number"],
+        "mid": machine_id,
+        "wo": work_order_no,
+        "pid": label_data["product_id"],
+        "len": label_data["actual_length"],
+        "defect": label_data["defect_type"],
+        "payload": payload_str,
+        "status": status,
+        "err": error_message,
+        "zpl": zpl_content,
+        "printer": printer,
+        "route": route
+    }
+
+async def _insert_print_log(conn, params):
+    """
+    Inserts print_log rows and counts them in production_summary, on the caller's
+    transaction. Takes one row's parameters or a list of them (run as executemany).
+    """
+    await conn.execute(_PRINT_LOG_INSERT, params)
+    await conn.execute(_SUMMARY_ADD, params)
+    await _bump_cache_version(conn, "dashboard")
+    await conn.execute(_PRINT_EVENT_INSERT, params)
+
+async def log_print_event(machine_id: int, work_order_no: str, label_data: dict, payload_str: str, is_success: bool, error_message: Optional[str], zpl_content: Optional[str] = None,
+                          printer: Optional[str] = None, route: Optional[str] = None):
+    """Logs the print event to the print_log table, with the printer the label went to and why."""
+    params = _print_log_params(machine_id, work_order_no, label_data, payload_str, "SUCCESS" if is_success else "FAILED",
+                               error_message, zpl_content, printer, route)
+    async def write(conn):
+        await _insert_print_log(conn, params)
+    await writer.execute(write)
+    logging.info(f"Logged print event for S/N: {label_data['serial_number']}")
+
+def record_print_trigger(timestamp: str, topic: str, payload_str: str, machine_id: int, work_order_no: str, label_data: dict) -> asyncio.Future:
+    """
+    Queues the database side of a print trigger on raw_log_writer: the raw message for
+    mqtt_raw_log and the label as a PENDING print_log row, written in its next batch.
+    Returns a future set once that batch is committed, so the label can go to the printer
+    in the meantime; complete_print_event fills in the result.
+    """
+    raw_params = {"ts": timestamp, "topic": topic, "payload": payload_str}
+    print_params = _print_log_params(machine_id, work_order_no, label_data, payload_str, "PENDING")
+    return raw_log_writer.log_trigger(raw_params, print_params)
+
+async def _complete_print_log(conn, params: dict) -> int:
+    """Sets the result of a PENDING print_log row on the caller's transaction. Returns the rows updated."""
+    result = await conn.execute(_PRINT_LOG_COMPLETE, params)
+    if result.rowcount:
+        # Only if it is still the latest label of its work order on that machine
+        await conn.execute(_SUMMARY_COMPLETE, params)
+        await _bump_cache_version(conn, "dashboard")
+        await conn.execute(_PRINT_EVENT_INSERT, params)
+    return result.rowcount
+
+async def complete_print_event(serial_number: str, is_success: bool, error_message: Optional[str], zpl_content: Optional[str] = None,
+                               printer: Optional[str] = None, route: Optional[str] = None):
+    """
+    Sets the result of a PENDING print_log row written by record_print_trigger, in
+    raw_log_writer's next batch (or in the row itself, if that has not been written yet).
+    """
+    params = {
+        "sn": serial_number,
+        "status": "SUCCESS" if is_success else "FAILED",
+        "err": error_message,
+        "zpl": zpl_content,
+        "printer": printer,
+        "route": route
+    }
+    if not await raw_log_writer.log_result(params):
+        logging.warning(f"No pending print_log row for S/N: {serial_number}; print result not recorded.")
+        return
+    logging.info(f"Logged print event for S/N: {serial_number}")
+
+async def fail_pending_print_events() -> int:
+    """
+    Marks labels left PENDING by a previous run as FAILED. Their result was never
+    recorded, so whether they printed is unknown; call this before handling triggers.
+    """
+    params = {"err": "Print result unknown: the service stopped before it was recorded"}
+    async def write(conn):
+        result = await conn.execute(text("""
+            UPDATE print_log
+            SET print_status = 'FAILED', error_message = :err
+            WHERE print_status = 'PENDING'
+        """), params)
+        await conn.execute(text("""
+            UPDATE production_summary
+            SET last_status = 'FAILED', last_error = :err
+            WHERE last_status = 'PENDING'
+        """), params)
+        if result.rowcount:
+            await _bump_cache_version(conn, "dashboard")
+            await _publish_event(conn, "dashboard", {"reason": "pending_prints_failed", "count": result.rowcount, "error": params["err"]})
+        return result.rowcount
+    count = await writer.execute(write)
+    if count:
+        logging.warning(f"Marked {count} print(s) left pending by the previous run as FAILED.")
+    return count
+
+def _print_log_query(columns, machine_id: Optional[int], work_order_no: Optional[str], status: Optional[str],
+                     since: Optional[str], until: Optional[str], after_id: Optional[int], limit: Optional[int] = None):
+    sql, params = sql_queries.print_log_query(columns, machine_id, work_order_no, status, since, until, after_id, limit)
+    return text(sql), params
+
+async def get_print_log_page(columns=PRINT_LOG_DEFAULT_COLUMNS, machine_id: Optional[int] = None, work_order_no: Optional[str] = None,
+                             status: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                             after_id: Optional[int] = None, limit: int = 100) -> dict:
+    """
+    Returns one page of print_log, newest first, and the after_id of the next page
+    (None on the last one). Timestamps are compared as stored (UTC, YYYY-MM-DD HH:MM:SS).
+    """
+    columns = tuple(dict.fromkeys(("id",) + tuple(columns))) # The cursor needs the id
+    stmt, params = _print_log_query(columns, machine_id, work_order_no, status, since, until, after_id, limit + 1)
+    async with engine.connect() as conn:
+        rows = [row._asdict() for row in (await conn.execute(stmt, params)).all()]
+    next_after_id = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after_id = rows[-1]["id"]
+    return {"print_log": rows, "next_after_id": next_after_id}
+
+async def stream_print_log(columns=PRINT_LOG_DEFAULT_COLUMNS, machine_id: Optional[int] = None, work_order_no: Optional[str] = None,
+                           status: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                           after_id: Optional[int] = None, chunk_size: int = 500):
+    """
+    Yields every matching print_log row, newest first, as lists of up to chunk_size
+    dicts. Rows are read from one open cursor in a single read transaction, so the
+    export is consistent and only one chunk is held in memory at a time.
+    """
+    stmt, params = _print_log_query(columns, machine_id, work_order_no, status, since, until, after_id)
+    async with engine.connect() as conn:
+        result = await conn.stream(stmt, params)
+        async for chunk in result.partitions(chunk_size):
+            yield [row._asdict() for row in chunk]
+
+async def get_printers() -> list:
+    """Returns every configured printer."""
+    async with engine.connect() as conn:
+        result = await conn.execute(text("SELECT id, name, transport, address, is_enabled FROM printers ORDER BY id;"))
+        return [dict(row._mapping) for row in result.all()]
+
+async def _printer_names_by_machine(conn, machine_id: Optional[int] = None) -> dict:
+    """
+    The printers each machine (or just machine_id) prints to, in routing order and named as
+    their health is reported; machines without routes use the configured printer, if any.
+    """
+    result = await conn.execute(text("""
+        SELECT ma.machine_id, p.transport, p.address
+        FROM machine_assignments ma
+        LEFT JOIN machine_printer_routes r ON r.machine_id = ma.machine_id
+        LEFT JOIN printers p ON p.id = r.printer_id AND p.is_enabled = 1
+        WHERE :machine_id IS NULL OR ma.machine_id = :machine_id
+        ORDER BY ma.machine_id, r.priority, p.id
+    """), {"machine_id": machine_id})
+    routes = {}
+    for row in result.all():
+        printers = routes.setdefault(row.machine_id, [])
+        if row.transport is not None:
+            printers.append(printer_transport.get_transport(row.transport, row.address).describe())
+    default_printer = printer_transport.get_transport().describe() if config.PRINTER_IP else None
+    return {machine: printers or ([default_printer] if default_printer else []) for machine, printers in routes.items()}
+
+async def upsert_printer(name: str, transport: str, address: str, is_enabled: bool) -> int:
+    """Adds a printer or updates the one with the same name. Returns its id."""
+    async def write(conn):
+        await conn.execute(text("""
+            INSERT INTO printers (name, transport, address, is_enabled)
+            VALUES (:name, :transport, :address, :enabled)
+            ON CONFLICT(name) DO UPDATE SET
+                transport = excluded.transport,
+                address = excluded.address,
+                is_enabled = excluded.is_enabled
+        """), {"name": name, "transport": transport, "address": address, "enabled": int(is_enabled)})
+        result = await conn.execute(text("SELECT id FROM printers WHERE name = :name;"), {"name": name})
+        await _bump_cache_version(conn, "printer_routes")
+        await _bump_cache_version(conn, "dashboard")
+        await _publish_event(conn, "dashboard", {"reason": "printers", "routes": await _printer_names_by_machine(conn)})
+        return result.scalar()
+
+    printer_id = await writer.execute(write)
+    logging.info(f"Saved printer '{name}' ({transport}:{address}, enabled: {is_enabled})")
+    return printer_id
+
+async def set_machine_printer_routes(machine_id: int, routes: list):
+    """Replaces a machine's printer routes with (printer_id, priority) pairs."""
+    async def write(conn):
+        await conn.execute(text("DELETE FROM machine_printer_routes WHERE machine_id = :machine_id;"), {"machine_id": machine_id})
+        if routes:
+            await conn.execute(
+                text("INSERT INTO machine_printer_routes (machine_id, printer_id, priority) VALUES (:machine_id, :printer_id, :priority);"),
+                [{"machine_id": machine_id, "printer_id": printer_id, "priority": priority} for printer_id, priority in routes]
+            )
+        await _bump_cache_version(conn, "printer_routes")
+        await _bump_cache_version(conn, "dashboard")
+        await _publish_event(conn, "dashboard", {"reason": "printer_routes", "machine_id": machine_id,
+                                                 "routes": await _printer_names_by_machine(conn, machine_id)})
+    await writer.execute(write)
+    logging.info(f"Set printer routes for machine {machine_id}: {routes}")
+
+async def get_printer_routes(known_version: Optional[int] = None):
+    """
+    Returns (version, routes) where routes maps machine_id to its enabled printers ordered
+    by priority. routes is None when the version still equals known_version.
+    """
+    async with engine.connect() as conn:
+        version = await _get_cache_version(conn, "printer_routes")
+        if version == known_version:
+            return version, None
+        result = await conn.execute(text("""
+            SELECT r.machine_id, r.priority, p.id AS printer_id, p.name, p.transport, p.address
+            FROM machine_printer_routes r
+            JOIN printers p ON p.id = r.printer_id
+            WHERE p.is_enabled = 1
+            ORDER BY r.machine_id, r.priority, p.id;
+        """))
+        routes = {}
+        for row in result.all():
+            routes.setdefault(row.machine_id, []).append(dict(row._mapping))
+        return version, routes
+
+async def save_printer_status(printer: str, reachable: Optional[bool], paper_out: bool, head_up: bool, paused: bool, error: Optional[str]):
+    """Stores the latest health check of a printer (written by the MQTT service's health monitor)."""
+    params = {
+        "printer": printer,
+        "reachable": None if reachable is None else int(reachable),
+        "paper_out": int(paper_out),
+        "head_up": int(head_up),
+        "paused": int(paused),
+        "error": error
+    }
+    async def write(conn):
+        # Only a change of state is news for the dashboard, not another check with the same result
+        changed = await conn.execute(text("""
+            SELECT NOT EXISTS (
+                SELECT 1 FROM printer_status
+                WHERE printer = :printer AND reachable IS :reachable AND paper_out = :paper_out
+                  AND head_up = :head_up AND paused = :paused AND error_message IS :error
+            )
+        """), params)
+        if changed.scalar():
+            await _bump_cache_version(conn, "dashboard")
+            await _publish_event(conn, "printer_status", params)
+        stmt = text("""
+            INSERT INTO printer_status (printer, reachable, paper_out, head_up, paused, error_message, last_checked)
+            VALUES (:printer, :reachable, :paper_out, :head_up, :paused, :error, CURRENT_TIMESTAMP)
+            ON CONFLICT(printer) DO UPDATE SET
+                reachable = excluded.reachable,
+                paper_out = excluded.paper_out,
+                head_up = excluded.head_up,
+                paused = excluded.paused,
+                error_message = excluded.error_message,
+                last_checked = excluded.last_checked
+        """)
+        await conn.execute(stmt, params)
+    await writer.execute(write)
+
+async def log_raw_mqtt_message(timestamp: str, topic: str, payload: str):
+    """Logs a raw MQTT message to the mqtt_raw_log table."""
+    async def write(conn):
+        params = {"ts": timestamp, "topic": topic, "payload": payload}
+        await conn.execute(_RAW_LOG_INSERT, params)
+        await conn.execute(_RAW_LOG_EVENT_INSERT, params)
+    await writer.execute(write)
+
+class RawMqttLogWriter:
+    """
+    Group-commit writer for mqtt_raw_log and the print_log rows of print triggers.
+
+    Raw messages, trigger labels and print results are buffered in memory and written
+    every `batch_size` entries or `flush_interval` seconds, whichever comes first, as one
+    DatabaseWriter command: the raw messages with a single executemany INSERT, then the
+    labels as PENDING print_log rows, then the results of labels written earlier. A result
+    that arrives while its label is still buffered is folded into it, so the row is
+    inserted once with its final status. The trigger path never waits for a commit. When
+    the buffer is full (or the writer is not running) entries are written on their own.
+
+    Each batch also deletes events beyond the newest `event_retention`, at most twice as
+    many as it added, so the events table stays bounded without commits of its own.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_buffer: int, event_retention: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.event_retention = event_retention
+        self._buffer = []
+        self._labels = {} # serial number -> {"raw", "print", "future", "result"}; kept in trigger order
+        self._results = [] # (params, future) for labels already written
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.counters = {"buffered": 0, "flushed": 0, "batches": 0, "sync_fallback": 0, "failed": 0,
+                         "labels": 0, "results": 0, "folded": 0, "events_pruned": 0}
+
+    async def start(self):
+        """Starts the background flush task on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="mqtt-raw-log-writer")
+            logging.info(f"Raw MQTT log writer started (batch={self.batch_size}, interval={self.flush_interval}s, buffer={self.max_buffer}).")
+
+    def _full(self) -> bool:
+        return self._task is None or len(self._buffer) + len(self._labels) + len(self._results) >= self.max_buffer
+
+    def _wake_if_batch_full(self):
+        if len(self._buffer) + len(self._labels) + len(self._results) >= self.batch_size:
+            self._wakeup.set()
+
+    async def log(self, timestamp: str, topic: str, payload: str):
+        """Queues a raw message for the next batch, or writes it directly if the buffer is full."""
+        if self._full():
+            self.counters["sync_fallback"] += 1
+            await log_raw_mqtt_message(timestamp, topic, payload)
+            return
+
+        self._buffer.append({"ts": timestamp, "topic": topic, "payload": payload})
+        self.counters["buffered"] += 1
+        self._wake_if_batch_full()
+
+    def log_trigger(self, raw_params: dict, print_params: dict) -> asyncio.Future:
+        """Queues a trigger's raw message and PENDING label. Returns a future set once both are committed."""
+        if self._full():
+            self.counters["sync_fallback"] += 1
+            async def write(conn):
+                await conn.execute(_RAW_LOG_INSERT, raw_params)
+                await conn.execute(_RAW_LOG_EVENT_INSERT, raw_params)
+                await _insert_print_log(conn, print_params)
+            return writer.submit(write)
+
+        future = asyncio.get_running_loop().create_future()
+        self._labels[print_params["sn"]] = {"raw": raw_params, "print": print_params, "future": future, "result": None}
+        self.counters["labels"] += 1
+        self._wake_if_batch_full()
+        return future
+
+    def log_result(self, params: dict) -> asyncio.Future:
+        """
+        Queues the result of a label queued by log_trigger. Returns a future for the number
+        of print_log rows it updated (0 if the label is not PENDING), set once committed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        label = self._labels.get(params["sn"])
+        if label is not None and label["result"] is None:
+            label["print"].update(params) # Still buffered: inserted with its final status
+            label["result"] = future
+            self.counters["folded"] += 1
+            return future
+        if self._full():
+            self.counters["sync_fallback"] += 1
+            return writer.submit(lambda conn: _complete_print_log(conn, params))
+
+        self._results.append((params, future))
+        self.counters["results"] += 1
+        self._wake_if_batch_full()
+        return future
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Writes everything currently buffered in one transaction."""
+        if not (self._buffer or self._labels or self._results):
+            return
+        batch, self._buffer = self._buffer, []
+        labels, self._labels = list(self._labels.values()), {}
+        results, self._results = self._results, []
+
+        async def write(conn):
+            if batch:
+                await conn.execute(_RAW_LOG_INSERT, batch) # A list of parameter sets runs as executemany
+                await conn.execute(_RAW_LOG_EVENT_INSERT, batch)
+            outcomes = []
+            if labels:
+                try:
+                    async with conn.begin_nested():
+                        raw = [label["raw"] for label in labels]
+                        await conn.execute(_RAW_LOG_INSERT, raw)
+                        await conn.execute(_RAW_LOG_EVENT_INSERT, raw)
+                        await _insert_print_log(conn, [label["print"] for label in labels])
+                    outcomes = [(None, None)] * len(labels)
+                except Exception:
+                    # One of them is bad: write them one at a time, so only that one fails
+                    outcomes = [await self._isolated(conn, label["print"]["sn"], self._write_label, label) for label in labels]
+            for params, _ in results:
+                outcomes.append(await self._isolated(conn, params["sn"], _complete_print_log, params))
+            added = len(batch) + 2 * len(labels) + len(results) # mqtt_message and print events
+            pruned = await conn.execute(_EVENTS_PRUNE, {"keep": self.event_retention, "limit": 2 * added})
+            self.counters["events_pruned"] += max(pruned.rowcount, 0)
+            return outcomes
+
+        try:
+            outcomes = await writer.execute(write)
+        except Exception as e:
+            # Labels and results fail with the batch; their callers write the finished rows instead
+            outcomes = [(None, e)] * (len(labels) + len(results))
+            # Keep the raw messages for the next attempt as long as they fit next to newer messages
+            room = self.max_buffer - len(self._buffer)
+            requeued = batch[:max(room, 0)]
+            self._buffer = requeued + self._buffer
+            lost = len(batch) - len(requeued)
+            self.counters["failed"] += lost
+            logging.error(f"Failed to flush {len(batch)} raw MQTT message(s) and {len(labels)} label(s) to DB: {e}. "
+                          f"Re-queued {len(requeued)} message(s), lost {lost}.")
+        else:
+            self.counters["flushed"] += len(batch) + len(labels)
+            self.counters["batches"] += 1
+
+        futures = [(label["future"], label["result"]) for label in labels] + [(future, None) for _, future in results]
+        for (future, folded), (count, error) in zip(futures, outcomes):
+            for target, value in ((future, count), (folded, 1)):
+                if target is None or target.done():
+                    continue
+                if error is not None:
+                    target.set_exception(error)
+                else:
+                    target.set_result(value)
+
+    @staticmethod
+    async def _isolated(conn, serial_number: str, work, item) -> tuple:
+        """Runs work(conn, item) in a SAVEPOINT. Returns (result, None) or (None, exception)."""
+        try:
+            async with conn.begin_nested():
+                return await work(conn, item), None
+        except Exception as e:
+            logging.error(f"Failed to write print_log row for S/N {serial_number}: {e}")
+            return None, e
+
+    @staticmethod
+    async def _write_label(conn, label: dict):
+        await conn.execute(_RAW_LOG_INSERT, label["raw"])
+        await conn.execute(_RAW_LOG_EVENT_INSERT, label["raw"])
+        await _insert_print_log(conn, label["print"])
+
+    async def stop(self):
+        """Stops the flush task and writes whatever is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._buffer:
+            logging.error(f"{len(self._buffer)} raw MQTT message(s) could not be written on shutdown.")
+        logging.info(f"Raw MQTT log writer stopped. Stats: {self.counters}")
+
+raw_log_writer = RawMqttLogWriter(
+    batch_size=config.MQTT_RAW_LOG_BATCH_SIZE,
+    flush_interval=config.MQTT_RAW_LOG_FLUSH_MS / 1000,
+    max_buffer=config.MQTT_RAW_LOG_MAX_BUFFER,
+    event_retention=config.EVENTS_RETENTION
+)
+
+async def get_raw_mqtt_log_version() -> int:
+    """The id of the newest raw MQTT message; it changes whenever a message is logged."""
+    async with engine.connect() as conn:
+        result = await conn.execute(text("SELECT MAX(id) FROM mqtt_raw_log;"))
+        return result.scalar() or 0
+
+async def get_recent_raw_mqtt_messages(limit: int = 50) -> list:
+    """Gets the most recent raw MQTT messages from the log."""
+    async with engine.connect() as conn:
+        stmt = text("""
+            SELECT timestamp, topic, payload
+            FROM mqtt_raw_log
+            ORDER BY id DESC
+            LIMIT :limit
+        """)
+        result = await conn.execute(stmt, {"limit": limit})
+        # Return as a list of dicts, but convert RowProxy to dict first
+        return [dict(row._mapping) for row in result.all()]
+
+async def get_event_bounds() -> tuple:
+    """Returns the (oldest, newest) id in the events table, (None, 0) if it is empty."""
+    async with engine.connect() as conn:
+        result = await conn.execute(text("SELECT MIN(id), COALESCE(MAX(id), 0) FROM events;"))
+        return tuple(result.one())
+
+async def get_events_after(after_id: int, limit: int, up_to: Optional[int] = None) -> list:
+    """Returns up to `limit` (id, kind, data) events with ids above after_id (and at most up_to), oldest first."""
+    async with engine.connect() as conn:
+        result = await conn.execute(text("""
+            SELECT id, kind, data
+            FROM events
+            WHERE id > :after_id AND id <= COALESCE(:up_to, id)
+            ORDER BY id
+            LIMIT :limit
+        """), {"after_id": after_id, "up_to": up_to, "limit": limit})
+        return [tuple(row) for row in result.all()]
+
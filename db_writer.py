@@ -0,0 +1,149 @@
+# db_writer.py
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+WriteWork = Callable[[AsyncConnection], Awaitable[Any]]
+
+
+def apply_sqlite_pragmas(engine: AsyncEngine, pragmas: dict, immediate_transactions: bool = False):
+    """
+    Runs the given PRAGMAs on every new connection of the engine.
+
+    With immediate_transactions the driver's own transaction handling is switched off
+    and every transaction starts with BEGIN IMMEDIATE, which takes the write lock up
+    front (waiting up to busy_timeout) instead of failing with "database is locked"
+    when a read transaction later tries to write. It also makes SAVEPOINTs work.
+    """
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        if immediate_transactions:
+            dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value};")
+        cursor.close()
+
+    if immediate_transactions:
+        @event.listens_for(engine.sync_engine, "begin")
+        def on_begin(conn):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+class _WriteCommand:
+    __slots__ = ("work", "future")
+
+    def __init__(self, work: WriteWork, future: asyncio.Future):
+        self.work = work
+        self.future = future
+
+
+class DatabaseWriter:
+    """
+    Single-writer actor for the SQLite database.
+
+    Every write in this process is a command on one queue, run by one task on one
+    long-lived connection, so writes never compete with each other for the file lock.
+    Commands that queue up while a transaction is committing are run together in the
+    next transaction (up to `batch_size`), each inside its own SAVEPOINT: a command
+    that raises is rolled back on its own and only its future gets the exception.
+    Every future resolves after the transaction that contains it has committed.
+    """
+
+    def __init__(self, engine: AsyncEngine, batch_size: int):
+        self.engine = engine
+        self.batch_size = max(1, batch_size)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop = None
+        self._conn: Optional[AsyncConnection] = None
+        self.counters = {"commands": 0, "transactions": 0, "failed": 0}
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            # First use, or a new event loop (e.g. a second asyncio.run()): start over on this loop
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._conn = None
+            self._task = loop.create_task(self._run(), name="db-writer")
+
+    def submit(self, work: WriteWork) -> asyncio.Future:
+        """
+        Queues `work(conn)` and returns a future for its result, set once the work is committed.
+        The work must only use the connection it is given and must not commit itself.
+        """
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait(_WriteCommand(work, future))
+        self.counters["commands"] += 1
+        return future
+
+    async def execute(self, work: WriteWork):
+        """Queues the work and waits until it is committed. Returns its result or raises its exception."""
+        return await self.submit(work)
+
+    async def _connection(self) -> AsyncConnection:
+        if self._conn is None:
+            self._conn = await self.engine.connect()
+        return self._conn
+
+    async def _drop_connection(self):
+        if self._conn is not None:
+            try:
+                await self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _next_batch(self, first: _WriteCommand) -> List[_WriteCommand]:
+        batch = [first]
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = self._next_batch(await self._queue.get())
+            results = []
+            try:
+                conn = await self._connection()
+                async with conn.begin():
+                    for command in batch:
+                        try:
+                            async with conn.begin_nested():
+                                results.append((command, await command.work(conn), None))
+                        except Exception as e:
+                            results.append((command, None, e))
+                self.counters["transactions"] += 1
+            except Exception as e:
+                # The transaction itself failed (e.g. commit), so none of the batch was written
+                logging.error(f"Database write transaction with {len(batch)} command(s) failed: {e}")
+                self.counters["failed"] += len(batch)
+                await self._drop_connection()
+                results = [(command, None, e) for command in batch]
+
+            for command, result, error in results:
+                if command.future.done():
+                    continue
+                if error is not None:
+                    command.future.set_exception(error)
+                else:
+                    command.future.set_result(result)
+            for _ in batch:
+                self._queue.task_done()
+
+    async def stop(self):
+        """Runs the commands already queued, then closes the writer connection."""
+        if self._task is None:
+            return
+        if self._loop is asyncio.get_running_loop() and not self._task.done():
+            await self._queue.join()
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            await self._drop_connection()
+        self._task = None
+        logging.info(f"Database writer stopped. Stats: {self.counters}")
@@ -0,0 +1,143 @@
+# event_stream.py
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Optional, Set
+
+import config
+from db_handler import get_event_bounds, get_events_after
+
+
+class EventSubscription:
+    """One connected client: a bounded queue of (id, kind, data) events waiting to be sent."""
+
+    def __init__(self, buffer_size: int):
+        self.queue = asyncio.Queue(maxsize=buffer_size)
+        self.evicted = False
+
+
+def parse_event_id(value) -> Optional[int]:
+    """Reads a Last-Event-ID value; anything that is not an id means "start from now"."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class EventBroker:
+    """
+    Streams the events table to /api/events clients.
+
+    Both services publish by writing to `events` in the same transaction as the change
+    (see db_handler._publish_event), so this process only follows the table: while
+    anyone is connected, one task reads the new rows every poll_interval and copies
+    them into each client's bounded queue. A client whose queue is full is evicted:
+    its stream ends after what was already queued, and the browser reconnects with
+    Last-Event-ID and resumes from the table. A client that asks for events older than
+    the table still holds, or more than fit in its queue, gets a "reset" event and
+    should reload /api/dashboard-data and /api/mqtt-log.
+    """
+
+    HEARTBEAT_SECONDS = 15 # Keeps idle connections open through proxies
+    RECONNECT_MS = 1000 # Sent as the SSE retry delay
+
+    def __init__(self, poll_interval: float, buffer_size: int, stream_max_age: float):
+        self.poll_interval = poll_interval
+        self.buffer_size = max(1, buffer_size)
+        self.stream_max_age = stream_max_age
+        self._subscribers: Set[EventSubscription] = set()
+        self._last_id = 0
+        self._lock = asyncio.Lock()
+        self._task = None
+        self.counters = {"connected": 0, "sent": 0, "evicted": 0, "resets": 0}
+
+    async def subscribe(self, last_event_id: Optional[int] = None) -> EventSubscription:
+        """Registers a client. With last_event_id, the events it missed are queued first."""
+        subscription = EventSubscription(self.buffer_size)
+        async with self._lock:
+            if self._task is None:
+                # Nobody was following the table, so start from its current end
+                _, self._last_id = await get_event_bounds()
+                self._task = asyncio.create_task(self._run(), name="event-broker")
+            if last_event_id is not None and last_event_id != self._last_id:
+                await self._queue_backlog(subscription, last_event_id)
+            self._subscribers.add(subscription)
+        self.counters["connected"] += 1
+        return subscription
+
+    async def _queue_backlog(self, subscription: EventSubscription, last_event_id: int):
+        oldest, _ = await get_event_bounds()
+        backlog = []
+        if last_event_id < self._last_id and oldest is not None and oldest <= last_event_id + 1:
+            backlog = await get_events_after(last_event_id, self.buffer_size, up_to=self._last_id)
+        if backlog and backlog[-1][0] == self._last_id:
+            for event in backlog:
+                subscription.queue.put_nowait(event)
+        else:
+            # Pruned, too many to queue, or an id from another database: start over from now
+            subscription.queue.put_nowait((self._last_id, "reset", "{}"))
+            self.counters["resets"] += 1
+
+    def unsubscribe(self, subscription: EventSubscription):
+        self._subscribers.discard(subscription)
+
+    async def _run(self):
+        delay = self.poll_interval
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                async with self._lock:
+                    if not self._subscribers:
+                        self._task = None
+                        return
+                    # At most one buffer per read, so a burst alone never evicts a client that keeps up
+                    events = await get_events_after(self._last_id, self.buffer_size)
+                    for event in events:
+                        self._fan_out(event)
+                    if events:
+                        self._last_id = events[-1][0]
+                # Catch up quickly after a full read, once the streams have had a moment to send it
+                delay = self.poll_interval / 10 if len(events) == self.buffer_size else self.poll_interval
+            except Exception as e:
+                logging.error(f"Failed to read events for /api/events: {e}")
+
+    def _fan_out(self, event: tuple):
+        for subscription in list(self._subscribers):
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscription.evicted = True
+                self._subscribers.discard(subscription)
+                self.counters["evicted"] += 1
+                logging.warning(f"Disconnected a slow /api/events client ({self.buffer_size} events queued); it will resume on reconnect.")
+
+    async def stream(self, subscription: EventSubscription) -> AsyncIterator[str]:
+        """
+        Yields the client's events in text/event-stream format. The stream ends after
+        stream_max_age seconds (or on eviction) and the client reconnects, so open streams
+        never hold up a server shutdown for long.
+        """
+        closes_at = time.monotonic() + self.stream_max_age
+        try:
+            yield f"retry: {self.RECONNECT_MS}\n\n"
+            while not (subscription.evicted and subscription.queue.empty()):
+                remaining = closes_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event_id, kind, data = await asyncio.wait_for(subscription.queue.get(), timeout=min(remaining, self.HEARTBEAT_SECONDS))
+                except asyncio.TimeoutError:
+                    if time.monotonic() < closes_at:
+                        yield ": keep-alive\n\n"
+                    continue
+                self.counters["sent"] += 1
+                yield f"id: {event_id}\nevent: {kind}\ndata: {data}\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+
+broker = EventBroker(
+    poll_interval=config.EVENTS_POLL_INTERVAL_MS / 1000,
+    buffer_size=config.EVENTS_CLIENT_BUFFER,
+    stream_max_age=config.EVENTS_STREAM_MAX_AGE
+)
@@ -0,0 +1,134 @@
+# ingest_queue.py
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Callable, Dict
+
+
+class MachineIngestQueue:
+    """
+    Bounded per-machine ingest stage for MQTT print triggers.
+
+    Every key (the MQTT topic, i.e. one autocoiler) gets its own bounded
+    asyncio.Queue and a dedicated worker, so triggers from the same machine are
+    handled strictly in arrival order. A global semaphore caps how many handlers
+    run at the same time across all machines.
+    """
+
+    def __init__(self, handler: Callable[..., Awaitable[None]], maxsize: int, max_concurrency: int, put_timeout: float):
+        self._handler = handler
+        self._maxsize = maxsize
+        self._max_concurrency = max_concurrency
+        self._put_timeout = put_timeout
+        self._loop = None
+        self._semaphore = None
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._accepting = False
+        self._counter_lock = threading.Lock()
+        self.counters = {
+            "received": 0,   # messages handed to submit_threadsafe()
+            "processed": 0,  # handler finished without raising
+            "failed": 0,     # handler raised
+            "overflow": 0,   # queue was full on arrival, caller was held back
+            "dropped": 0,    # message discarded (still full after put_timeout, or shutting down)
+        }
+
+    def _count(self, name: str):
+        with self._counter_lock:
+            self.counters[name] += 1
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Binds the queue to the event loop that will run the workers."""
+        self._loop = loop
+        self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        self._accepting = True
+
+    def submit_threadsafe(self, key: str, *args) -> bool:
+        """
+        Hands a message over from the paho network thread.
+
+        Blocks the calling thread for at most put_timeout seconds while the
+        machine's queue is full (backpressure towards the broker), then drops
+        the message. Returns True if the message was queued.
+        """
+        self._count("received")
+        if not self._accepting or self._loop is None or self._loop.is_closed():
+            self._count("dropped")
+            logging.error(f"Ingest queue is not accepting messages. Dropped message for {key}.")
+            return False
+
+        future = asyncio.run_coroutine_threadsafe(self._put(key, args), self._loop)
+        try:
+            # _put() bounds itself with put_timeout; the extra second only guards against a stalled loop.
+            return future.result(timeout=self._put_timeout + 1)
+        except Exception as e:
+            future.cancel()
+            self._count("dropped")
+            logging.error(f"Could not hand message for {key} to the event loop: {e!r}. Message dropped.")
+            return False
+
+    async def _put(self, key: str, args: tuple) -> bool:
+        if not self._accepting:
+            self._count("dropped")
+            logging.error(f"Ingest queue is draining. Dropped message for {key}.")
+            return False
+
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = asyncio.Queue(maxsize=self._maxsize)
+            self._queues[key] = queue
+            self._workers[key] = asyncio.create_task(self._worker(key, queue), name=f"ingest-{key}")
+
+        if queue.full():
+            self._count("overflow")
+            logging.warning(f"Ingest queue for {key} is full ({self._maxsize}). Applying backpressure.")
+            try:
+                await asyncio.wait_for(queue.put(args), timeout=self._put_timeout)
+            except asyncio.TimeoutError:
+                self._count("dropped")
+                logging.error(f"Ingest queue for {key} still full after {self._put_timeout}s. Message dropped.")
+                return False
+        else:
+            queue.put_nowait(args)
+        return True
+
+    async def _worker(self, key: str, queue: asyncio.Queue):
+        """Processes one machine's messages in order, under the global concurrency cap."""
+        while True:
+            args = await queue.get()
+            try:
+                async with self._semaphore:
+                    await self._handler(*args)
+                self._count("processed")
+            except Exception as e:
+                self._count("failed")
+                logging.error(f"Ingest worker for {key} failed to process a message: {e}")
+            finally:
+                queue.task_done()
+
+    def stats(self) -> dict:
+        """Returns the counters plus the current depth of every machine queue."""
+        with self._counter_lock:
+            stats = dict(self.counters)
+        stats["queue_depths"] = {key: queue.qsize() for key, queue in self._queues.items()}
+        return stats
+
+    async def drain(self, timeout: float):
+        """Stops accepting new messages, waits for queued ones to finish, then stops the workers."""
+        self._accepting = False
+        if self._queues:
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(queue.join() for queue in self._queues.values())),
+                    timeout=timeout
+                )
+                logging.info("Ingest queues drained.")
+            except asyncio.TimeoutError:
+                pending = sum(queue.qsize() for queue in self._queues.values())
+                logging.warning(f"Ingest drain timed out after {timeout}s with {pending} message(s) still queued.")
+
+        for task in self._workers.values():
+            task.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        logging.info(f"Ingest queue stopped. Stats: {self.stats()}")
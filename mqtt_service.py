@@ -1,188 +1,259 @@
-# mqtt_service.py
-import paho.mqtt.client as mqtt_client
-from paho.mqtt.enums import CallbackAPIVersion
-import logging
-import asyncio
-import json
-import time
-# from collections import deque # No longer needed
-
-import config
-from db_handler import get_assignment_for_machine, log_print_event, log_raw_mqtt_message # Import new function
-from label_printer import print_coil_label, generate_serial_number
-
-# Global deque to store recent MQTT messages - REMOVED
-# MQTT_LOG_MAX_LENGTH = 50
-# mqtt_message_log = deque(maxlen=MQTT_LOG_MAX_LENGTH)
-# mqtt_log_lock = asyncio.Lock() # To ensure thread-safe appends to the deque - REMOVED
-
-def connect_mqtt():
-    """Connects to the MQTT broker and returns the client instance."""
-    def on_connect(client, userdata, flags, rc, properties=None):
-        if rc == 0:
-            logging.info(f"Connected to MQTT Broker. Subscribing to topics: {config.MQTT_PRINT_TOPICS}")
-            for topic_filter in config.MQTT_PRINT_TOPICS:
-                client.subscribe(topic_filter)
-                logging.info(f"Subscribed to {topic_filter}")
-        else:
-            logging.error(f"Failed to connect to MQTT, return code {rc}")
-
-    if not config.MQTT_BROKER_HOST:
-        logging.error("MQTT_BROKER_HOST is not set in the configuration.")
-        return None
-
-    client = mqtt_client.Client(callback_api_version=CallbackAPIVersion.VERSION2, client_id=f"python-mqtt-listener-{int(time.time())}")
-    if config.MQTT_USERNAME and config.MQTT_PASSWORD:
-        client.username_pw_set(config.MQTT_USERNAME, config.MQTT_PASSWORD)
-    
-    client.on_connect = on_connect
-    
-    try:
-        client.connect(config.MQTT_BROKER_HOST, config.MQTT_BROKER_PORT)
-    except Exception as e:
-        logging.error(f"Error connecting to MQTT broker: {e}")
-        return None
-        
-    return client
-
-async def on_message_received(topic: str, payload_str: str):
-    """Callback for when a message is received from MQTT."""
-    # Log to database instead of in-memory deque
-    current_timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
-    try:
-        # We call this first to ensure the raw message is logged even if subsequent processing fails
-        await log_raw_mqtt_message(current_timestamp, topic, payload_str)
-    except Exception as e:
-        logging.error(f"Failed to log raw MQTT message to DB: {e}")
-        # Decide if you want to return or continue processing if DB log fails
-        # For now, we'll log the error and continue attempting to process for printing
-
-    logging.info(f"Received from topic `{topic}`: {payload_str}") # Standard logging continues
-    
-    try: # This try is for the main message processing logic
-        data = json.loads(payload_str).get("d", {})
-        # The machine ID is the last part of the topic for Print_AutoCoiler
-        # Extract machine_id from the end of the topic string (e.g., "malhotra/Print_AutoCoiler1" -> 1)
-        try:
-            machine_id_str = topic[-1] # Get the last character
-            if not machine_id_str.isdigit(): # Basic validation if it's not a digit from the topic name
-                 # Fallback or more robust parsing if needed, e.g. regex, or check against a known list of full topic names
-                 # For now, we'll try to find a digit at the end of the topic string
-                 import re
-                 match = re.search(r'\d+$', topic)
-                 if match:
-                     machine_id_str = match.group(0)
-                 else: # If no digit found at the end, this parsing will fail.
-                      logging.error(f"Could not parse machine_id from topic: {topic}")
-                      return
-            machine_id = int(machine_id_str)
-        except ValueError:
-            logging.error(f"Could not parse machine_id from topic: {topic}. Expected a number at the end.")
-            return
-        except IndexError:
-            logging.error(f"Topic string too short to parse machine_id: {topic}")
-            return
-        
-        # 1. Check for Active Assignment
-        assignment = await get_assignment_for_machine(machine_id)
-
-        if not assignment or not assignment['is_printing_active']:
-            logging.warning(f"No active assignment for machine {machine_id}. Ignoring print trigger.")
-            return
-
-        # 2. We have an active assignment, proceed with printing
-        work_order_details = assignment['work_order_data'] # This will be the full JSON for the WO
-        
-        # 3. Generate Serial Number
-        serial_number = await generate_serial_number(machine_id)
-
-        # 4. Determine Defect Type
-        defect_type = "None"
-        if data.get('spark', [False])[0]: defect_type = "Spark"
-        if data.get('diameter', [False])[0]: defect_type = "Diameter"
-        # ... add more logic if needed
-
-        # 5. Assemble Label Data
-        label_data = {
-            "serial_number": serial_number,
-            "product_id": work_order_details.get("mcpl_part_code", "N/A"),
-            "customer_product_code": work_order_details.get("customer_part_code", "N/A"),
-            "customer_name": work_order_details.get("customer_name", "N/A"),
-            "actual_length": data.get('pre_coil_length', [0])[0],
-            "defect_type": defect_type
-        }
-        
-        # 6. Print and Log
-        # Run the synchronous print_coil_label in a thread pool executor
-        loop = asyncio.get_running_loop()
-        # print_coil_label now returns: (success_status, error_message, zpl_code)
-        print_ok, error_msg, zpl_code = await loop.run_in_executor(None, print_coil_label, label_data)
-        
-        await log_print_event(
-            machine_id=machine_id,
-            work_order_no=work_order_details.get("work_order_no"),
-            label_data=label_data,
-            payload_str=payload_str,
-            is_success=print_ok,
-            error_message=error_msg,
-            zpl_content=zpl_code # Pass the ZPL code
-        )
-
-    except Exception as e:
-        logging.error(f"Error processing MQTT message on topic {topic}: {e}")
-    
-def main():
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - MQTT - %(levelname)s - %(message)s')
-    logging.info("Starting MQTT Listener Service...")
-    client = connect_mqtt()
-
-    if not client:
-        logging.error("Could not create MQTT client. Exiting.")
-        return
-    
-    loop = asyncio.get_event_loop()
-    client.user_data_set(loop) # Make the loop accessible in callbacks via userdata
-
-    def on_message_wrapper(client, userdata, msg):
-        event_loop = userdata # Retrieve the loop passed via userdata
-        asyncio.run_coroutine_threadsafe(
-            on_message_received(msg.topic, msg.payload.decode()),
-            event_loop
-        )
-
-    client.on_message = on_message_wrapper
-    client.loop_start() # Starts a new thread for the MQTT network loop
-
-    try:
-        # Run the asyncio event loop in the main thread
-        loop.run_forever()
-    except KeyboardInterrupt:
-        logging.info("Shutting down MQTT service (KeyboardInterrupt)...")
-    finally:
-        logging.info("Stopping MQTT client loop...")
-        client.loop_stop()
-        logging.info("MQTT client loop stopped.")
-        
-        # Gracefully stop the asyncio event loop
-        # Gather all remaining tasks and cancel them
-        if loop.is_running():
-            logging.info("Stopping asyncio event loop...")
-            tasks = asyncio.all_tasks(loop=loop)
-            for task in tasks:
-                task.cancel()
-            # Allow tasks to be cancelled
-            # loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True)) # This might hang if tasks don't handle cancellation well
-            # A simpler stop for this script:
-            loop.call_soon_threadsafe(loop.stop)
-            # loop.stop() # This should be called from within the loop or via call_soon_threadsafe
-            # Wait a bit for loop to stop if call_soon_threadsafe was used
-            # time.sleep(1) # Give it a moment
-            if not loop.is_closed(): # Check if it's not already closed
-                 # Ensure all tasks are done before closing loop, or close might raise errors
-                 # For this script, a direct stop might be okay if on_message_received tasks are short-lived
-                 # or handle cancellation properly.
-                 pass # loop.close() # Can be problematic if tasks are still pending
-            logging.info("Asyncio event loop stopped.")
-
-if __name__ == '__main__':
+# mqtt_service.py
+import paho.mqtt.client as mqtt_client
+from paho.mqtt.enums import CallbackAPIVersion
+import logging
+import asyncio
+import json
+import time
+# from collections import deque # No longer needed
+
+import config
+from db_handler import get_assignment_for_machine, log_print_event, record_print_trigger, complete_print_event, fail_pending_print_events, raw_log_writer, assignment_cache, writer as db_writer
+from label_printer import spool_coil_label, generate_serial_number
+from ingest_queue import MachineIngestQueue
+import printer_transport
+import print_spool
+import printer_health
+from printer_routing import printer_router
+
+# Global deque to store recent MQTT messages - REMOVED
+# MQTT_LOG_MAX_LENGTH = 50
+# mqtt_message_log = deque(maxlen=MQTT_LOG_MAX_LENGTH)
+# mqtt_log_lock = asyncio.Lock() # To ensure thread-safe appends to the deque - REMOVED
+
+# Tasks waiting for a spooled label's print result so it can be written to print_log
+pending_print_logs = set()
+
+def connect_mqtt():
+    """Connects to the MQTT broker and returns the client instance."""
+    def on_connect(client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            logging.info(f"Connected to MQTT Broker. Subscribing to topics: {config.MQTT_PRINT_TOPICS}")
+            for topic_filter in config.MQTT_PRINT_TOPICS:
+                client.subscribe(topic_filter)
+                logging.info(f"Subscribed to {topic_filter}")
+        else:
+            logging.error(f"Failed to connect to MQTT, return code {rc}")
+
+    if not config.MQTT_BROKER_HOST:
+        logging.error("MQTT_BROKER_HOST is not set in the configuration.")
+        return None
+
+    client = mqtt_client.Client(callback_api_version=CallbackAPIVersion.VERSION2, client_id=f"python-mqtt-listener-{int(time.time())}")
+    if config.MQTT_USERNAME and config.MQTT_PASSWORD:
+        client.username_pw_set(config.MQTT_USERNAME, config.MQTT_PASSWORD)
+    
+    client.on_connect = on_connect
+    
+    try:
+        client.connect(config.MQTT_BROKER_HOST, config.MQTT_BROKER_PORT)
+    except Exception as e:
+        logging.error(f"Error connecting to MQTT broker: {e}")
+        return None
+        
+    return client
+
+async def on_message_received(topic: str, payload_str: str):
+    """Callback for when a message is received from MQTT."""
+    # Log to database instead of in-memory deque
+    current_timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+    # A print trigger queues its raw message with its print_log row; every other
+    # message goes to the batched raw log writer when handling ends
+    raw_logged = False
+
+    logging.info(f"Received from topic `{topic}`: {payload_str}") # Standard logging continues
+    
+    try: # This try is for the main message processing logic
+        data = json.loads(payload_str).get("d", {})
+        # The machine ID is the last part of the topic for Print_AutoCoiler
+        # Extract machine_id from the end of the topic string (e.g., "malhotra/Print_AutoCoiler1" -> 1)
+        try:
+            machine_id_str = topic[-1] # Get the last character
+            if not machine_id_str.isdigit(): # Basic validation if it's not a digit from the topic name
+                 # Fallback or more robust parsing if needed, e.g. regex, or check against a known list of full topic names
+                 # For now, we'll try to find a digit at the end of the topic string
+                 import re
+                 match = re.search(r'\d+$', topic)
+                 if match:
+                     machine_id_str = match.group(0)
+                 else: # If no digit found at the end, this parsing will fail.
+                      logging.error(f"Could not parse machine_id from topic: {topic}")
+                      return
+            machine_id = int(machine_id_str)
+        except ValueError:
+            logging.error(f"Could not parse machine_id from topic: {topic}. Expected a number at the end.")
+            return
+        except IndexError:
+            logging.error(f"Topic string too short to parse machine_id: {topic}")
+            return
+        
+        # 1. Check for Active Assignment
+        assignment = await get_assignment_for_machine(machine_id)
+
+        if not assignment or not assignment['is_printing_active']:
+            logging.warning(f"No active assignment for machine {machine_id}. Ignoring print trigger.")
+            return
+
+        # 2. We have an active assignment, proceed with printing
+        work_order_details = assignment['work_order_data'] # This will be the full JSON for the WO
+        
+        # 3. Generate Serial Number
+        serial_number = await generate_serial_number(machine_id)
+
+        # 4. Determine Defect Type
+        defect_type = "None"
+        if data.get('spark', [False])[0]: defect_type = "Spark"
+        if data.get('diameter', [False])[0]: defect_type = "Diameter"
+        # ... add more logic if needed
+
+        # 5. Assemble Label Data
+        label_data = {
+            "serial_number": serial_number,
+            "product_id": work_order_details.get("mcpl_part_code", "N/A"),
+            "customer_product_code": work_order_details.get("customer_part_code", "N/A"),
+            "customer_name": work_order_details.get("customer_name", "N/A"),
+            "actual_length": data.get('pre_coil_length', [0])[0],
+            "defect_type": defect_type
+        }
+        work_order_no = work_order_details.get("work_order_no")
+
+        # 6. The raw message and the label as PENDING go into the raw log writer's next
+        # batch; not awaited, so the label goes to the printer while it commits
+        recorded = record_print_trigger(current_timestamp, topic, payload_str, machine_id, work_order_no, label_data)
+        raw_logged = True
+
+        # 7. Queue for printing; the print result is written to the PENDING row once the
+        # spool reports it, so this machine's next trigger does not wait on the printer
+        try:
+            outcome, zpl_code = await spool_coil_label(label_data, machine_id)
+        except Exception as e:
+            outcome, zpl_code = asyncio.get_running_loop().create_future(), None
+            outcome.set_result((False, f"Failed to queue label for printing: {e}", None, None))
+            logging.error(f"Failed to queue S/N {serial_number} for printing: {e}")
+        task = asyncio.create_task(log_print_outcome(
+            recorded,
+            outcome,
+            machine_id=machine_id,
+            work_order_no=work_order_no,
+            label_data=label_data,
+            payload_str=payload_str,
+            zpl_content=zpl_code,
+            received_at=current_timestamp,
+            topic=topic
+        ))
+        pending_print_logs.add(task)
+        task.add_done_callback(pending_print_logs.discard)
+
+    except Exception as e:
+        logging.error(f"Error processing MQTT message on topic {topic}: {e}")
+    finally:
+        if not raw_logged:
+            try:
+                # Queued for the next batch insert; only waits on the DB if the writer's buffer is full
+                await raw_log_writer.log(current_timestamp, topic, payload_str)
+            except Exception as e:
+                logging.error(f"Failed to log raw MQTT message to DB: {e}")
+    
+async def log_print_outcome(recorded: asyncio.Future, outcome: asyncio.Future, machine_id: int, work_order_no: str, label_data: dict,
+                            payload_str: str, zpl_content: str, received_at: str, topic: str):
+    """
+    Waits for a spooled label's result and records it on the label's PENDING print_log row
+    (in the row itself if that is still waiting for its batch). If the trigger's own batch
+    failed, the raw message and the finished row are written instead.
+    """
+    serial_number = label_data.get('serial_number')
+    try:
+        print_ok, error_msg, printer, route = await outcome
+        try:
+            await complete_print_event(serial_number, print_ok, error_msg, zpl_content, printer, route)
+        except Exception as e:
+            logging.error(f"Failed to record print result for S/N {serial_number}: {e}")
+        try:
+            await recorded # Committed no later than the result
+            return
+        except Exception as e:
+            logging.error(f"Failed to record print trigger for S/N {serial_number}: {e}")
+        await raw_log_writer.log(received_at, topic, payload_str)
+        await log_print_event(
+            machine_id=machine_id,
+            work_order_no=work_order_no,
+            label_data=label_data,
+            payload_str=payload_str,
+            is_success=print_ok,
+            error_message=error_msg,
+            zpl_content=zpl_content, # Pass the ZPL code
+            printer=printer,
+            route=route
+        )
+    except Exception as e:
+        logging.error(f"Failed to log print result for S/N {serial_number}: {e}")
+
+async def _start_printers():
+    if config.PRINTER_IP:
+        printer_health.start_monitors([printer_transport.get_transport()])
+    await printer_router.refresh() # Also starts monitoring every routed printer
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - MQTT - %(levelname)s - %(message)s')
+    logging.info("Starting MQTT Listener Service...")
+    client = connect_mqtt()
+
+    if not client:
+        logging.error("Could not create MQTT client. Exiting.")
+        return
+    
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    # Bounded per-machine queues: triggers from one machine are handled in order,
+    # and at most MQTT_INGEST_MAX_CONCURRENCY handlers touch the database at once.
+    ingest = MachineIngestQueue(
+        handler=on_message_received,
+        maxsize=config.MQTT_INGEST_QUEUE_SIZE,
+        max_concurrency=config.MQTT_INGEST_MAX_CONCURRENCY,
+        put_timeout=config.MQTT_INGEST_PUT_TIMEOUT
+    )
+    ingest.start(loop)
+    # Labels the previous run never got a result for; must run before new triggers are recorded
+    loop.run_until_complete(fail_pending_print_events())
+    loop.run_until_complete(raw_log_writer.start())
+    # Poll the printers in the background so the print path can fail fast or fail over while one is down
+    loop.run_until_complete(_start_printers())
+    client.user_data_set(ingest) # Make the ingest queue accessible in callbacks via userdata
+
+    def on_message_wrapper(client, userdata, msg):
+        # Runs on the paho network thread; blocks briefly if this machine's queue is full
+        userdata.submit_threadsafe(msg.topic, msg.topic, msg.payload.decode())
+
+    client.on_message = on_message_wrapper
+    client.loop_start() # Starts a new thread for the MQTT network loop
+
+    try:
+        # Run the asyncio event loop in the main thread
+        loop.run_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down MQTT service (KeyboardInterrupt)...")
+    finally:
+        logging.info("Stopping MQTT client loop...")
+        client.loop_stop()
+        logging.info("MQTT client loop stopped.")
+
+        # No new messages can arrive now; let the workers finish what is already queued
+        logging.info("Draining ingest queues...")
+        loop.run_until_complete(ingest.drain(config.MQTT_INGEST_DRAIN_TIMEOUT))
+        # Send whatever is still spooled, then record the remaining print results
+        printer_router.stop()
+        loop.run_until_complete(print_spool.drain_all(config.PRINT_SPOOL_DRAIN_TIMEOUT))
+        if pending_print_logs:
+            loop.run_until_complete(asyncio.gather(*pending_print_logs, return_exceptions=True))
+        loop.run_until_complete(printer_health.stop_all())
+        loop.run_until_complete(raw_log_writer.stop())
+        loop.run_until_complete(db_writer.stop()) # Commits anything still queued
+        logging.info(f"Assignment cache stats: {assignment_cache.stats()}")
+        printer_transport.close_all()
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+        logging.info("Asyncio event loop stopped.")
+
+if __name__ == '__main__':
     main()
\ No newline at end of file
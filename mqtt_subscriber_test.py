@@ -1,32 +1,32 @@
-import os
-import paho.mqtt.client as mqtt
-from dotenv import load_dotenv
-
-load_dotenv()
-
-MQTT_BROKER_HOST = os.getenv("MQTT_BROKER_HOST", "localhost")
-MQTT_BROKER_PORT = int(os.getenv("MQTT_BROKER_PORT", 1883))
-MQTT_BROKER_USERNAME = os.getenv("MQTT_BROKER_USERNAME", "artemis")
-MQTT_BROKER_PASSWORD = os.getenv("MQTT_BROKER_PASSWORD", "artemis")
-
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        print(f"Connected to MQTT Broker at {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}!")
-        client.subscribe("#") # Subscribe to all topics
-        print("Subscribed to all topics (#). Waiting for messages...")
-    else:
-        print(f"Failed to connect, return code {rc}\n")
-
-def on_message(client, userdata, msg):
-    print(f"Topic: {msg.topic} | Payload: {msg.payload.decode()}")
-
-client = mqtt.Client()
-client.username_pw_set(MQTT_BROKER_USERNAME, MQTT_BROKER_PASSWORD)
-client.on_connect = on_connect
-client.on_message = on_message
-
-try:
-    client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, 60)
-    client.loop_forever()
-except Exception as e:
+import os
+import paho.mqtt.client as mqtt
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MQTT_BROKER_HOST = os.getenv("MQTT_BROKER_HOST", "localhost")
+MQTT_BROKER_PORT = int(os.getenv("MQTT_BROKER_PORT", 1883))
+MQTT_BROKER_USERNAME = os.getenv("MQTT_BROKER_USERNAME", "artemis")
+MQTT_BROKER_PASSWORD = os.getenv("MQTT_BROKER_PASSWORD", "artemis")
+
+def on_connect(client, userdata, flags, rc):
+    if rc == 0:
+        print(f"Connected to MQTT Broker at {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}!")
+        client.subscribe("#") # Subscribe to all topics
+        print("Subscribed to all topics (#). Waiting for messages...")
+    else:
+        print(f"Failed to connect, return code {rc}\n")
+
+def on_message(client, userdata, msg):
+    print(f"Topic: {msg.topic} | Payload: {msg.payload.decode()}")
+
+client = mqtt.Client()
+client.username_pw_set(MQTT_BROKER_USERNAME, MQTT_BROKER_PASSWORD)
+client.on_connect = on_connect
+client.on_message = on_message
+
+try:
+    client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, 60)
+    client.loop_forever()
+except Exception as e:
     print(f"An error occurred: {e}")
\ No newline at end of file
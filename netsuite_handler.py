@@ -1,375 +1,696 @@
-import requests
-import json
-import sys
-import subprocess
-import os
-from datetime import datetime
-from dotenv import load_dotenv
-
-load_dotenv() # Load environment variables from .env file
-
-# ===============================================================================
-# CONFIGURATION SECTION
-# ===============================================================================
-# NetSuite account configuration
-ACCOUNT_ID = os.getenv("ACCOUNT_ID")
-if not ACCOUNT_ID:
-    raise ValueError("ACCOUNT_ID not found in .env file")
-
-# Your integration credentials (from your partner's successful example)
-CONSUMER_KEY = os.getenv("CONSUMER_KEY")
-if not CONSUMER_KEY:
-    raise ValueError("CONSUMER_KEY not found in .env file")
-
-# Certificate information
-CERTIFICATE_ID = os.getenv("CERTIFICATE_ID")
-if not CERTIFICATE_ID:
-    raise ValueError("CERTIFICATE_ID not found in .env file")
-
-# RESTlet information
-script_id_str = os.getenv("SCRIPT_ID")
-if not script_id_str:
-    raise ValueError("SCRIPT_ID not found in .env file")
-SCRIPT_ID = int(script_id_str)
-
-deploy_id_str = os.getenv("DEPLOY_ID")
-if not deploy_id_str:
-    raise ValueError("DEPLOY_ID not found in .env file")
-DEPLOY_ID = int(deploy_id_str)
-CREATED_AT_MIN = os.getenv("CREATED_AT_MIN")
-if not CREATED_AT_MIN:
-    raise ValueError("CREATED_AT_MIN not found in .env file")
-
-# NetSuite endpoints
-TOKEN_URL = f"https://{ACCOUNT_ID}.suitetalk.api.netsuite.com/services/rest/auth/oauth2/v1/token"
-RESTLET_URL = f"https://{ACCOUNT_ID}.restlets.api.netsuite.com/app/site/hosting/restlet.nl"
-
-# Node.js script path
-JWT_GENERATOR_PATH = "jwt_generator.js" # This path remains local to the Python script
-
-# ===============================================================================
-# UTILITY FUNCTIONS - Helper functions for logging and debugging
-# ===============================================================================
-
-def log_section(title):
-    """Print a section header with title."""
-    width = 80
-    print("\n" + "=" * width)
-    print(f" {title} ".center(width, "="))
-    print("=" * width)
-
-def log_step(step_num, description):
-    """Print a step header."""
-    print(f"\n[STEP {step_num}] {description}")
-    print("-" * 80)
-
-def log_info(message):
-    """Print an info message."""
-    print(f"[INFO] {message}")
-
-def log_warning(message):
-    """Print a warning message."""
-    print(f"[WARNING] {message}")
-
-def log_error(message):
-    """Print an error message."""
-    print(f"[ERROR] {message}")
-
-def log_success(message):
-    """Print a success message."""
-    print(f"[SUCCESS] {message}")
-
-def log_json(label, data):
-    """Print JSON data with proper formatting."""
-    print(f"[JSON] {label}:")
-    print(json.dumps(data, indent=2))
-
-def log_request(method, url, headers, data=None):
-    """Log details of a request being made."""
-    print(f"[REQUEST] {method} {url}")
-    print("Request Headers:")
-    for key, value in headers.items():
-        print(f"  {key}: {value}")
-    
-    if data:
-        if isinstance(data, dict):
-            print("Request Data (JSON):")
-            print(json.dumps(data, indent=2))
-        else:
-            # For form data, don't print actual JWT which could be very long
-            if "client_assertion" in data:
-                sanitized = data.replace(data.split("client_assertion=")[1], "[JWT_CONTENT]")
-                print(f"Request Data (Form): {sanitized}")
-            else:
-                print(f"Request Data: {data}")
-
-def log_response(response):
-    """Log details of a response received."""
-    print(f"[RESPONSE] Status Code: {response.status_code}")
-    print("Response Headers:")
-    for key, value in response.headers.items():
-        print(f"  {key}: {value}")
-    
-    if response.text:
-        try:
-            json_data = response.json()
-            print("Response Body (JSON):")
-            print(json.dumps(json_data, indent=2))
-        except:
-            print(f"Response Body: {response.text}")
-
-# ===============================================================================
-# JWT GENERATION - Generate JWT using Node.js
-# ===============================================================================
-
-def check_nodejs_installed():
-    """Check if Node.js is installed."""
-    try:
-        result = subprocess.run(['node', '--version'], 
-                                stdout=subprocess.PIPE, 
-                                stderr=subprocess.PIPE,
-                                text=True)
-        if result.returncode == 0:
-            log_success(f"Node.js is installed: {result.stdout.strip()}")
-            return True
-        else:
-            log_error("Node.js check failed")
-            return False
-    except FileNotFoundError:
-        log_error("Node.js is not installed or not in PATH")
-        return False
-
-def generate_jwt():
-    """Generate JWT using Node.js script."""
-    log_step(2, "Generating JWT using Node.js")
-    
-    if not os.path.exists(JWT_GENERATOR_PATH):
-        log_error(f"Node.js JWT generator script not found: {JWT_GENERATOR_PATH}")
-        return None
-    
-    try:
-        result = subprocess.run(['node', JWT_GENERATOR_PATH], 
-                                stdout=subprocess.PIPE, 
-                                stderr=subprocess.PIPE,
-                                text=True)
-        
-        if result.returncode == 0:
-            jwt = result.stdout.strip()
-            log_success(f"JWT generated successfully using Node.js")
-            log_info(f"JWT length: {len(jwt)}")
-            log_info(f"JWT:{jwt}")
-            #log_info(f"JWT last 50 chars: ...{jwt[-50:]}")
-            return jwt
-        else:
-            log_error(f"Node.js script failed with error: {result.stderr}")
-            return None
-    except Exception as e:
-        log_error(f"Error running Node.js script: {e}")
-        return None
-
-# ===============================================================================
-# OAUTH AUTHENTICATION - Get access token
-# ===============================================================================
-
-def get_access_token():
-    """Get an access token using client credentials grant type with JWT assertion."""
-    log_step(3, "Requesting access token with JWT")
-    
-    jwt = generate_jwt()
-    if not jwt:
-        log_error("Failed to generate JWT - cannot proceed")
-        return None
-    
-    # Format data exactly as it appears in the Postman request
-    data = f"grant_type=client_credentials&client_assertion_type=urn%3Aietf%3Aparams%3Aoauth%3Aclient-assertion-type%3Ajwt-bearer&client_assertion={jwt}"
-    
-    headers = {
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
-    
-    log_request("POST", TOKEN_URL, headers, data)
-    
-    try:
-        response = requests.post(TOKEN_URL, headers=headers, data=data)
-        log_response(response)
-        
-        if response.status_code == 200:
-            token_data = response.json()
-            access_token = token_data.get("access_token")
-            expires_in = token_data.get("expires_in")
-            token_type = token_data.get("token_type")
-            
-            log_success(f"Access token obtained (expires in {expires_in} seconds)")
-            log_info(f"Token type: {token_type}")
-            log_info(f"Access token first 20 chars: {access_token[:20]}...")
-            
-            return access_token
-        else:
-            log_error(f"Failed to get access token. Status code: {response.status_code}")
-            return None
-    except Exception as e:
-        log_error(f"Exception getting access token: {e}")
-        return None
-
-# ===============================================================================
-# RESTLET CONNECTION - Test connection to RESTlet
-# ===============================================================================
-
-def test_connection(access_token):
-    """Test connection to NetSuite RESTlet using the access token."""
-    log_step(4, "Testing connection to RESTlet")
-    
-    if not access_token:
-        log_error("No access token available - cannot connect to RESTlet")
-        return False
-    
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    
-    params = {
-        "script": SCRIPT_ID,
-        "deploy": DEPLOY_ID,
-        "created_at_min": CREATED_AT_MIN
-    }
-    
-    payload = {
-        "Status": "Connection"
-    }
-    
-    # Build the full URL with parameters
-    url = f"{RESTLET_URL}?script={SCRIPT_ID}&deploy={DEPLOY_ID}&created_at_min={CREATED_AT_MIN}"
-    log_info(f"DEBUG: RESTLET_URL (POST): {RESTLET_URL}")
-    log_info(f"DEBUG: Constructed URL (POST): {url}")
-    log_request("POST", url, headers, payload)
-    
-    try:
-        response = requests.post(
-            RESTLET_URL, 
-            headers=headers, 
-            params=params, 
-            data=json.dumps(payload)
-        )
-        
-        log_response(response)
-        
-        if response.status_code == 200:
-            log_success("Connection to RESTlet successful!")
-            return True
-        else:
-            log_error(f"Connection to RESTlet failed with status code: {response.status_code}")
-            return False
-    except Exception as e:
-        log_error(f"Exception testing connection: {e}")
-        return False
-
-async def get_restlet_data(access_token, created_at_min_date):
-    """Send a GET request to NetSuite RESTlet and display the response."""
-    log_step(5, f"Sending GET request to RESTlet for created_at_min={created_at_min_date}")
-
-    if not access_token:
-        log_error("No access token available - cannot send GET request to RESTlet")
-        return False
-
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-
-    # Build the full URL with parameters for GET request
-    url = f"{RESTLET_URL}?script={SCRIPT_ID}&deploy={DEPLOY_ID}&created_at_min={created_at_min_date}"
-    log_info(f"DEBUG: RESTLET_URL (GET): {RESTLET_URL}")
-    log_info(f"DEBUG: Constructed URL (GET): {url}")
-    log_request("GET", url, headers) # No payload for GET request
-
-    try:
-        response = requests.get(
-            url,
-            headers=headers
-        )
-
-        log_response(response)
-
-        if response.status_code == 200:
-            log_success(f"GET request to RESTlet successful for created_at_min={created_at_min_date}!")
-            
-            # Save the work orders to the database
-            from db_handler import save_work_orders
-            import asyncio
-            
-            work_order_data = response.json()
-            all_work_orders = work_order_data.get("Work_order_list", [])
-            
-            await save_work_orders(all_work_orders)
-            
-            return True
-        else:
-            log_error(f"GET request to RESTlet failed with status code: {response.status_code}")
-            return False
-    except Exception as e:
-        log_error(f"Exception sending GET request: {e}")
-        return False
-
-# ===============================================================================
-# MAIN EXECUTION
-# ===============================================================================
-
-async def main(created_at_min=None):
-    """Main execution function."""
-    log_section("NETSUITE API CONNECTION TEST (NODE.JS JWT APPROACH)")
-    log_info(f"Account ID: {ACCOUNT_ID}")
-    log_info(f"Certificate ID: {CERTIFICATE_ID}")
-    log_info(f"RESTlet: script={SCRIPT_ID}, deploy={DEPLOY_ID}")
-    
-    # Step 1: Check if Node.js is installed
-    log_step(1, "Checking Node.js installation")
-    if not check_nodejs_installed():
-        log_error("Node.js is required to run this script")
-        log_info("Please install Node.js from https://nodejs.org/")
-        return False
-    
-    # Step 2 & 3: Generate JWT and get access token
-    access_token = get_access_token()
-    
-    if not access_token:
-        log_error("Failed to get access token - cannot proceed")
-        return False
-    
-    # Step 4: Test POST connection to RESTlet
-    post_success = test_connection(access_token)
-    
-    # Step 5: Get user input for created_at_min and send GET request to RESTlet
-    get_success = False
-    if post_success: # Only proceed with GET if POST was successful
-        if not created_at_min:
-            log_warning("No date entered for GET request. Skipping GET request.")
-        else:
-            get_success = await get_restlet_data(access_token, created_at_min)
-    
-    if post_success and get_success:
-        log_section("CONNECTION TEST SUMMARY")
-        log_success("All steps completed successfully (POST and GET)!")
-        log_info("Your connection to NetSuite RESTlet is working properly")
-        return True
-    else:
-        log_section("CONNECTION TEST SUMMARY")
-        log_error("Connection test failed (POST or GET)")
-        log_info("Check the error messages above for troubleshooting")
-        return False
- 
-if __name__ == "__main__":
-    try:
-        # When running as a script, we need to run the async main function
-        import asyncio
-        success = asyncio.run(main())
-        if success:
-            sys.exit(0)
-        else:
-            sys.exit(1)
-    except KeyboardInterrupt:
-        log_warning("Process interrupted by user")
-        sys.exit(1)
-    except Exception as e:
-        log_error(f"Unexpected error: {e}")
+import httpx
+import asyncio
+import base64
+import json
+import random
+import sys
+import subprocess
+import os
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv() # Load environment variables from .env file
+
+# ===============================================================================
+# CONFIGURATION SECTION
+# ===============================================================================
+# NetSuite account configuration
+ACCOUNT_ID = os.getenv("ACCOUNT_ID")
+if not ACCOUNT_ID:
+    raise ValueError("ACCOUNT_ID not found in .env file")
+
+# Your integration credentials (from your partner's successful example)
+CONSUMER_KEY = os.getenv("CONSUMER_KEY")
+if not CONSUMER_KEY:
+    raise ValueError("CONSUMER_KEY not found in .env file")
+
+# Certificate information
+CERTIFICATE_ID = os.getenv("CERTIFICATE_ID")
+if not CERTIFICATE_ID:
+    raise ValueError("CERTIFICATE_ID not found in .env file")
+
+# RESTlet information
+script_id_str = os.getenv("SCRIPT_ID")
+if not script_id_str:
+    raise ValueError("SCRIPT_ID not found in .env file")
+SCRIPT_ID = int(script_id_str)
+
+deploy_id_str = os.getenv("DEPLOY_ID")
+if not deploy_id_str:
+    raise ValueError("DEPLOY_ID not found in .env file")
+DEPLOY_ID = int(deploy_id_str)
+CREATED_AT_MIN = os.getenv("CREATED_AT_MIN")
+if not CREATED_AT_MIN:
+    raise ValueError("CREATED_AT_MIN not found in .env file")
+
+# NetSuite endpoints
+TOKEN_URL = f"https://{ACCOUNT_ID}.suitetalk.api.netsuite.com/services/rest/auth/oauth2/v1/token"
+RESTLET_URL = f"https://{ACCOUNT_ID}.restlets.api.netsuite.com/app/site/hosting/restlet.nl"
+# Names the work order query in sync_cursors; another account or deployment keeps its own cursor
+SYNC_CURSOR_KEY = f"work_orders:{ACCOUNT_ID}:{SCRIPT_ID}:{DEPLOY_ID}"
+
+# Private key matching CERTIFICATE_ID, for signing the JWT in-process
+PRIVATE_KEY_PATH = os.getenv("PRIVATE_KEY_PATH")
+
+# Node.js script path, used only when the JWT cannot be signed in-process
+JWT_GENERATOR_PATH = "jwt_generator.js" # This path remains local to the Python script
+
+# Seconds before expiry that a cached access token is replaced
+TOKEN_REFRESH_MARGIN = int(os.getenv("NS_TOKEN_REFRESH_MARGIN", 300))
+
+# HTTP client settings
+HTTP_TIMEOUT = float(os.getenv("NS_HTTP_TIMEOUT", 60)) # Seconds to wait for NetSuite to answer
+RETRY_ATTEMPTS = int(os.getenv("NS_RETRY_ATTEMPTS", 4)) # Tries per request on 429/5xx or a network error
+RETRY_BACKOFF = float(os.getenv("NS_RETRY_BACKOFF", 1)) # Upper bound of the first random delay, doubled on each further attempt
+RETRY_BACKOFF_MAX = float(os.getenv("NS_RETRY_BACKOFF_MAX", 30))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Work order sync settings
+SYNC_CHUNK_SIZE = int(os.getenv("NS_SYNC_CHUNK_SIZE", 500)) # Work orders saved per transaction while a response streams in
+PAGE_MARKER = os.getenv("NS_PAGE_MARKER", "next_page") # Response field naming the next page, sent back as a parameter of the same name
+
+# ===============================================================================
+# UTILITY FUNCTIONS - Helper functions for logging and debugging
+# ===============================================================================
+
+def log_section(title):
+    """Print a section header with title."""
+    width = 80
+    print("\n" + "=" * width)
+    print(f" {title} ".center(width, "="))
+    print("=" * width)
+
+def log_step(step_num, description):
+    """Print a step header."""
+    print(f"\n[STEP {step_num}] {description}")
+    print("-" * 80)
+
+def log_info(message):
+    """Print an info message."""
+    print(f"[INFO] {message}")
+
+def log_warning(message):
+    """Print a warning message."""
+    print(f"[WARNING] {message}")
+
+def log_error(message):
+    """Print an error message."""
+    print(f"[ERROR] {message}")
+
+def log_success(message):
+    """Print a success message."""
+    print(f"[SUCCESS] {message}")
+
+def log_json(label, data):
+    """Print JSON data with proper formatting."""
+    print(f"[JSON] {label}:")
+    print(json.dumps(data, indent=2))
+
+def log_request(method, url, headers, data=None):
+    """Log details of a request being made."""
+    print(f"[REQUEST] {method} {url}")
+    print("Request Headers:")
+    for key, value in headers.items():
+        print(f"  {key}: {value}")
+    
+    if data:
+        if isinstance(data, dict):
+            print("Request Data (JSON):")
+            print(json.dumps(data, indent=2))
+        else:
+            # For form data, don't print actual JWT which could be very long
+            if "client_assertion" in data:
+                sanitized = data.replace(data.split("client_assertion=")[1], "[JWT_CONTENT]")
+                print(f"Request Data (Form): {sanitized}")
+            else:
+                print(f"Request Data: {data}")
+
+def log_response(response):
+    """Log details of a response received."""
+    print(f"[RESPONSE] Status Code: {response.status_code}")
+    print("Response Headers:")
+    for key, value in response.headers.items():
+        print(f"  {key}: {value}")
+    
+    if response.text:
+        try:
+            json_data = response.json()
+            print("Response Body (JSON):")
+            print(json.dumps(json_data, indent=2))
+        except:
+            print(f"Response Body: {response.text}")
+
+def log_response_summary(response, work_orders, fields):
+    """Log a summary of a streamed RESTlet response (the body itself can be very large)."""
+    print(f"[RESPONSE] Status Code: {response.status_code}, {response.headers.get('Content-Type')}, "
+          f"{response.num_bytes_downloaded} bytes, {work_orders} work order(s)")
+    if fields:
+        print(f"Other fields: {json.dumps(fields, default=str)[:500]}")
+
+# ===============================================================================
+# HTTP CLIENT - One pooled async client, with retries
+# ===============================================================================
+
+_http_client = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """The shared client: connections to NetSuite are kept alive between requests."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=10),
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5)
+        )
+    return _http_client
+
+async def close_http_client():
+    """Closes the shared client's connections (on shutdown)."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+def _retry_delay(attempt: int, retry_after=None) -> float:
+    """Seconds to wait before the next attempt: Retry-After if NetSuite sent one, else full jitter."""
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), RETRY_BACKOFF_MAX)
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * (2 ** (attempt - 1))))
+
+async def send_request(method, url, stream=False, **kwargs) -> httpx.Response:
+    """
+    Sends a request on the shared client. 429 and 5xx responses and network errors are
+    retried up to RETRY_ATTEMPTS times, after a random delay so that retries from
+    several callers do not arrive together. Returns the last response, or raises the
+    last network error. With stream=True the body is not read yet and the caller
+    must close the response.
+    """
+    client = get_http_client()
+    for attempt in range(1, RETRY_ATTEMPTS + 1):
+        try:
+            response = await client.send(client.build_request(method, url, **kwargs), stream=stream)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == RETRY_ATTEMPTS:
+                return response
+            await response.aclose()
+            delay = _retry_delay(attempt, response.headers.get("Retry-After"))
+            log_warning(f"{method} {url} returned {response.status_code}; retrying in {delay:.1f}s (attempt {attempt}/{RETRY_ATTEMPTS})")
+        except httpx.TransportError as e:
+            if attempt == RETRY_ATTEMPTS:
+                raise
+            delay = _retry_delay(attempt)
+            log_warning(f"{method} {url} failed: {e!r}; retrying in {delay:.1f}s (attempt {attempt}/{RETRY_ATTEMPTS})")
+        await asyncio.sleep(delay)
+
+# ===============================================================================
+# JWT GENERATION - Sign the JWT in-process (Node.js as a fallback)
+# ===============================================================================
+
+try:
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding
+except ImportError: # Without the cryptography package, jwt_generator.js signs the JWT
+    serialization = None
+
+JWT_LIFETIME = 3600 # Seconds, as in jwt_generator.js
+
+_private_key = None
+_nodejs_installed = None # Checked once per process, and only if Node.js is needed
+
+def _base64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _load_private_key():
+    """Reads the private key once per process."""
+    global _private_key
+    if _private_key is None:
+        with open(PRIVATE_KEY_PATH, "rb") as key_file:
+            _private_key = serialization.load_pem_private_key(key_file.read(), password=None)
+    return _private_key
+
+def sign_jwt():
+    """Signs the client assertion with PS256, with the same header and claims as jwt_generator.js."""
+    now = int(time.time())
+    header = {"alg": "PS256", "typ": "JWT", "kid": CERTIFICATE_ID}
+    payload = {
+        "iss": CONSUMER_KEY,
+        "scope": ["restlets", "rest_webservices"],
+        "iat": now,
+        "exp": now + JWT_LIFETIME,
+        "aud": TOKEN_URL
+    }
+    signing_input = ".".join(_base64url(json.dumps(part, separators=(",", ":")).encode("utf-8")) for part in (header, payload))
+    signature = _load_private_key().sign(
+        signing_input.encode("ascii"),
+        # PS256 (RFC 7518): RSASSA-PSS with SHA-256, MGF1 and a salt as long as the digest
+        padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=32),
+        hashes.SHA256()
+    )
+    return f"{signing_input}.{_base64url(signature)}"
+
+def check_nodejs_installed():
+    """Check if Node.js is installed."""
+    try:
+        result = subprocess.run(['node', '--version'], 
+                                stdout=subprocess.PIPE, 
+                                stderr=subprocess.PIPE,
+                                text=True)
+        if result.returncode == 0:
+            log_success(f"Node.js is installed: {result.stdout.strip()}")
+            return True
+        else:
+            log_error("Node.js check failed")
+            return False
+    except FileNotFoundError:
+        log_error("Node.js is not installed or not in PATH")
+        return False
+
+def generate_jwt():
+    """Generate the JWT client assertion, in-process when possible and otherwise with Node.js."""
+    log_step(2, "Generating JWT")
+
+    if serialization is not None and PRIVATE_KEY_PATH:
+        try:
+            jwt = sign_jwt()
+            log_success("JWT signed in-process (PS256)")
+            log_info(f"JWT length: {len(jwt)}")
+            return jwt
+        except Exception as e:
+            log_warning(f"In-process JWT signing failed: {e}. Falling back to Node.js.")
+    else:
+        log_info("cryptography package or PRIVATE_KEY_PATH not available; using Node.js")
+    return generate_jwt_with_node()
+
+def generate_jwt_with_node():
+    """Generate JWT using Node.js script."""
+    global _nodejs_installed
+    if _nodejs_installed is None:
+        _nodejs_installed = check_nodejs_installed()
+    if not _nodejs_installed:
+        log_error("Node.js is required to sign the JWT without the cryptography package")
+        log_info("Please install Node.js from https://nodejs.org/ or run: pip install cryptography")
+        return None
+
+    if not os.path.exists(JWT_GENERATOR_PATH):
+        log_error(f"Node.js JWT generator script not found: {JWT_GENERATOR_PATH}")
+        return None
+    
+    try:
+        result = subprocess.run(['node', JWT_GENERATOR_PATH], 
+                                stdout=subprocess.PIPE, 
+                                stderr=subprocess.PIPE,
+                                text=True)
+        
+        if result.returncode == 0:
+            jwt = result.stdout.strip()
+            log_success(f"JWT generated successfully using Node.js")
+            log_info(f"JWT length: {len(jwt)}")
+            log_info(f"JWT:{jwt}")
+            #log_info(f"JWT last 50 chars: ...{jwt[-50:]}")
+            return jwt
+        else:
+            log_error(f"Node.js script failed with error: {result.stderr}")
+            return None
+    except Exception as e:
+        log_error(f"Error running Node.js script: {e}")
+        return None
+
+# ===============================================================================
+# OAUTH AUTHENTICATION - Get access token
+# ===============================================================================
+
+async def get_access_token():
+    """
+    Get an access token using client credentials grant type with JWT assertion.
+    Returns the token response (access_token, expires_in, ...) or None.
+    """
+    log_step(3, "Requesting access token with JWT")
+    
+    jwt = await asyncio.to_thread(generate_jwt) # The Node.js fallback runs a subprocess
+    if not jwt:
+        log_error("Failed to generate JWT - cannot proceed")
+        return None
+    
+    # Format data exactly as it appears in the Postman request
+    data = f"grant_type=client_credentials&client_assertion_type=urn%3Aietf%3Aparams%3Aoauth%3Aclient-assertion-type%3Ajwt-bearer&client_assertion={jwt}"
+    
+    headers = {
+        "Content-Type": "application/x-www-form-urlencoded"
+    }
+    
+    log_request("POST", TOKEN_URL, headers, data)
+    
+    try:
+        response = await send_request("POST", TOKEN_URL, headers=headers, content=data)
+        log_response(response)
+        
+        if response.status_code == 200:
+            token_data = response.json()
+            access_token = token_data.get("access_token")
+            expires_in = token_data.get("expires_in")
+            token_type = token_data.get("token_type")
+            
+            log_success(f"Access token obtained (expires in {expires_in} seconds)")
+            log_info(f"Token type: {token_type}")
+            log_info(f"Access token first 20 chars: {access_token[:20]}...")
+            
+            return token_data
+        else:
+            log_error(f"Failed to get access token. Status code: {response.status_code}")
+            return None
+    except Exception as e:
+        log_error(f"Exception getting access token: {e}")
+        return None
+
+class AccessTokenCache:
+    """
+    Keeps the NetSuite access token until `refresh_margin` seconds before it expires,
+    so syncs within the hour reuse it instead of signing a JWT and exchanging it again.
+    Concurrent callers share one token request.
+    """
+
+    def __init__(self, refresh_margin: int):
+        self.refresh_margin = refresh_margin
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+        self.counters = {"hits": 0, "requests": 0}
+
+    def _valid(self) -> bool:
+        return self._token is not None and time.monotonic() < self._expires_at
+
+    async def get(self):
+        """Returns a valid access token, requesting a new one if needed, or None on failure."""
+        if self._valid():
+            self.counters["hits"] += 1
+            log_info("Using cached access token")
+            return self._token
+        async with self._lock:
+            if not self._valid(): # Another caller may have refreshed it while we waited
+                self.counters["requests"] += 1
+                token_data = await get_access_token()
+                if not token_data:
+                    return None
+                lifetime = int(token_data.get("expires_in") or JWT_LIFETIME)
+                self._token = token_data["access_token"]
+                self._expires_at = time.monotonic() + lifetime - min(self.refresh_margin, lifetime / 2)
+            return self._token
+
+    def invalidate(self):
+        """Drops the cached token, e.g. after NetSuite rejected it."""
+        self._token = None
+
+token_cache = AccessTokenCache(TOKEN_REFRESH_MARGIN)
+
+# ===============================================================================
+# RESPONSE PARSING - Read Work_order_list as it arrives
+# ===============================================================================
+
+WORK_ORDER_LIST_KEY = "Work_order_list"
+_JSON_WHITESPACE = " \t\r\n"
+_JSON_DELIMITERS = _JSON_WHITESPACE + ",:]}"
+_decoder = json.JSONDecoder()
+
+def _decode_value(buffer, pos, eof):
+    """Decodes the JSON value at buffer[pos]; returns (value, end), or None until more text arrives."""
+    try:
+        value, end = _decoder.raw_decode(buffer, pos)
+    except json.JSONDecodeError:
+        if eof:
+            raise
+        return None
+    if not eof and (end == len(buffer) or buffer[end] not in _JSON_DELIMITERS):
+        return None # A number may continue in the next chunk ("1." decodes as 1)
+    return value, end
+
+async def iter_work_order_list(chunks, fields: dict):
+    """
+    Yields the work orders in a RESTlet response's Work_order_list one at a time while
+    `chunks` (an async iterator of text) delivers the body. Only the order being read is
+    held, never the whole list. The response's other top-level fields, such as the page
+    marker, are small; they are stored in `fields`.
+    """
+    chunks = chunks.__aiter__()
+    buffer, pos, eof = "", 0, False
+    state, key = "start", None
+    while state != "end":
+        while pos < len(buffer) and buffer[pos] in _JSON_WHITESPACE:
+            pos += 1
+        char = buffer[pos] if pos < len(buffer) else None
+        progressed = char is not None
+        if char is None:
+            pass
+        elif state == "start":
+            if char != "{":
+                raise ValueError(f"Expected a JSON object from the RESTlet, got {buffer[pos:pos + 50]!r}")
+            pos, state = pos + 1, "key"
+        elif state in ("key", "item") and char == ",":
+            pos += 1
+        elif state == "key" and char == "}":
+            pos, state = pos + 1, "end"
+        elif state == "item" and char == "]":
+            pos, state = pos + 1, "key"
+        elif state == "colon":
+            if char != ":":
+                raise ValueError(f"Expected ':' after {key!r} in the RESTlet response")
+            pos += 1
+            state = "list" if key == WORK_ORDER_LIST_KEY else "value"
+        elif state == "list" and char == "[":
+            pos, state = pos + 1, "item"
+        else:
+            # A key, a work order, or another field's value (including a Work_order_list that is not a list)
+            decoded = _decode_value(buffer, pos, eof)
+            progressed = decoded is not None
+            if progressed:
+                value, pos = decoded
+                if state == "key":
+                    key, state = value, "colon"
+                elif state == "item":
+                    yield value
+                else:
+                    fields[key], state = value, "key"
+
+        if not progressed:
+            # Nothing more can be read from the buffer: drop what was read and fetch the next chunk
+            if eof:
+                raise ValueError("The RESTlet response ended before its JSON object was complete")
+            try:
+                buffer = buffer[pos:] + await chunks.__anext__()
+            except StopAsyncIteration:
+                buffer, eof = buffer[pos:], True
+            pos = 0
+
+# ===============================================================================
+# RESTLET CONNECTION - Test connection to RESTlet
+# ===============================================================================
+
+async def test_connection(access_token):
+    """Test connection to NetSuite RESTlet using the access token (python netsuite_handler.py without a date)."""
+    log_step(4, "Testing connection to RESTlet")
+    
+    if not access_token:
+        log_error("No access token available - cannot connect to RESTlet")
+        return False
+    
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+    
+    params = {
+        "script": SCRIPT_ID,
+        "deploy": DEPLOY_ID,
+        "created_at_min": CREATED_AT_MIN
+    }
+    
+    payload = {
+        "Status": "Connection"
+    }
+    
+    # Build the full URL with parameters
+    url = f"{RESTLET_URL}?script={SCRIPT_ID}&deploy={DEPLOY_ID}&created_at_min={CREATED_AT_MIN}"
+    log_info(f"DEBUG: RESTLET_URL (POST): {RESTLET_URL}")
+    log_info(f"DEBUG: Constructed URL (POST): {url}")
+    log_request("POST", url, headers, payload)
+    
+    try:
+        response = await send_request(
+            "POST",
+            RESTLET_URL,
+            headers=headers,
+            params=params,
+            content=json.dumps(payload)
+        )
+        
+        log_response(response)
+        
+        if response.status_code == 200:
+            log_success("Connection to RESTlet successful!")
+            return True
+        else:
+            log_error(f"Connection to RESTlet failed with status code: {response.status_code}")
+            return False
+    except Exception as e:
+        log_error(f"Exception testing connection: {e}")
+        return False
+
+def _no_progress(phase, **counts):
+    pass
+
+async def _open_restlet_get(access_token, params):
+    """
+    Opens a streamed GET to the RESTlet. If NetSuite rejects the token (401), it is
+    replaced once and the request repeated. Returns (response, access_token); the caller
+    closes the response.
+    """
+    for attempt in range(2):
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json"
+        }
+        log_request("GET", f"{RESTLET_URL}?{httpx.QueryParams(params)}", headers) # No payload for GET request
+        response = await send_request("GET", RESTLET_URL, stream=True, headers=headers, params=params)
+        if response.status_code != 401 or attempt == 1:
+            return response, access_token
+        await response.aclose()
+        log_warning("Access token was rejected; requesting a new one.")
+        token_cache.invalidate()
+        access_token = await token_cache.get()
+        if not access_token:
+            return response, None
+
+async def get_restlet_data(access_token, created_at_min_date, progress=None):
+    """
+    Send GET requests to NetSuite RESTlet and save the returned work orders.
+
+    The body is parsed as it arrives and saved SYNC_CHUNK_SIZE orders at a time, so
+    memory use does not grow with the size of the response. While a response names a
+    next page in its PAGE_MARKER field, that page is requested in turn.
+    progress(phase, **counts), if given, is told when the sync moves on (see sync_jobs).
+    """
+    progress = progress or _no_progress
+    log_step(5, f"Sending GET request to RESTlet for created_at_min={created_at_min_date}")
+
+    if not access_token:
+        log_error("No access token available - cannot send GET request to RESTlet")
+        return False
+
+    # Save the work orders to the database
+    from db_handler import save_work_orders
+
+    totals = {"pages": 0, "received": 0, "inserted": 0, "updated": 0, "unchanged": 0}
+
+    async def save(chunk):
+        for key, count in (await save_work_orders(chunk)).items():
+            totals[key] += count
+        progress("saving", **totals)
+
+    params = {
+        "script": SCRIPT_ID,
+        "deploy": DEPLOY_ID,
+        "created_at_min": created_at_min_date
+    }
+
+    try:
+        while True:
+            response, access_token = await _open_restlet_get(access_token, params)
+            try:
+                if response.status_code != 200:
+                    log_error(f"GET request to RESTlet failed with status code: {response.status_code}")
+                    log_info(f"Response Body: {(await response.aread())[:1000]!r}")
+                    return False
+                totals["pages"] += 1
+                fields, chunk, received = {}, [], 0
+                async for wo in iter_work_order_list(response.aiter_text(), fields):
+                    received += 1
+                    totals["received"] += 1
+                    chunk.append(wo)
+                    if len(chunk) >= SYNC_CHUNK_SIZE:
+                        await save(chunk)
+                        chunk = []
+                if chunk:
+                    await save(chunk)
+                log_response_summary(response, received, fields)
+            finally:
+                await response.aclose()
+
+            next_page = fields.get(PAGE_MARKER)
+            if next_page in (None, "", False):
+                break
+            if next_page == params.get(PAGE_MARKER):
+                log_error(f"RESTlet returned the same {PAGE_MARKER} ({next_page}) twice; stopping.")
+                return False
+            params[PAGE_MARKER] = next_page
+
+        log_success(f"GET request to RESTlet successful for created_at_min={created_at_min_date}! {totals}")
+        return True
+    except Exception as e:
+        log_error(f"Exception sending GET request: {e}")
+        return False
+
+# ===============================================================================
+# MAIN EXECUTION
+# ===============================================================================
+
+async def main(created_at_min=None, progress=None):
+    """Main execution function."""
+    log_section("NETSUITE API CONNECTION TEST")
+    log_info(f"Account ID: {ACCOUNT_ID}")
+    log_info(f"Certificate ID: {CERTIFICATE_ID}")
+    log_info(f"RESTlet: script={SCRIPT_ID}, deploy={DEPLOY_ID}")
+    
+    # Steps 2 & 3: Generate JWT and get access token, unless a cached one is still valid
+    progress = progress or _no_progress
+    progress("authenticating")
+    access_token = await token_cache.get()
+    
+    if not access_token:
+        log_error("Failed to get access token - cannot proceed")
+        return False
+    
+    if created_at_min:
+        # Step 5: Fetch the work orders; a failed fetch reports its own cause, so no test POST first
+        progress("fetching")
+        success = await get_restlet_data(access_token, created_at_min, progress)
+        log_section("SYNC SUMMARY")
+        if success:
+            log_success(f"Work orders created since {created_at_min} were fetched and saved.")
+        else:
+            log_error("Fetching work orders failed")
+            log_info("Check the error messages above for troubleshooting")
+        return success
+
+    # Step 4: Without a date, only test the POST connection to the RESTlet
+    log_warning("No date entered for GET request. Testing the connection only.")
+    post_success = await test_connection(access_token)
+    if not post_success:
+        token_cache.invalidate() # The next refresh starts with a new token
+    
+    log_section("CONNECTION TEST SUMMARY")
+    if post_success:
+        log_success("Connection test completed successfully (POST)!")
+        log_info("Your connection to NetSuite RESTlet is working properly")
+        return True
+    else:
+        log_error("Connection test failed (POST)")
+        log_info("Check the error messages above for troubleshooting")
+        return False
+ 
+if __name__ == "__main__":
+    try:
+        # When running as a script, we need to run the async main function
+        async def run():
+            try:
+                return await main()
+            finally:
+                await close_http_client()
+        success = asyncio.run(run())
+        if success:
+            sys.exit(0)
+        else:
+            sys.exit(1)
+    except KeyboardInterrupt:
+        log_warning("Process interrupted by user")
+        sys.exit(1)
+    except Exception as e:
+        log_error(f"Unexpected error: {e}")
         sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,229 @@
+# print_spool.py
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import config
+import printer_health
+from printer_transport import PrinterTransport, PrinterUnreachableError, UncertainDeliveryError, get_transport
+
+
+class PrintJob:
+    """
+    One label waiting in a spool. `outcome` resolves to (success, error_message, accepted):
+    accepted is False only if the label never reached the printer (it could not be
+    connected to, or its health monitor reported a problem), so it is safe to send elsewhere.
+    """
+
+    def __init__(self, serial_no: str, data: bytes, outcome: asyncio.Future):
+        self.serial_no = serial_no
+        self.data = data
+        self.outcome = outcome
+
+
+class PrinterSpool:
+    """
+    Asynchronous spool for one printer.
+
+    Jobs are queued and sent by a single worker, in order, on a dedicated thread so
+    a slow or offline printer never ties up the default executor. Labels that arrive
+    within `coalesce_window` seconds of each other are sent as one write of several
+    ^XA...^XZ blocks. A write that failed before any data was sent is retried with
+    exponential backoff up to `max_attempts` times before every job in the batch is
+    reported as failed. If it failed part-way, the labels that were started may have
+    printed: they are reported as failed without being resent, so no serial number
+    prints twice, and only the labels after them are retried. While the printer's health
+    monitor reports a problem, jobs fail straight away.
+    """
+
+    def __init__(self, transport: PrinterTransport, maxsize: int, coalesce_window: float, max_batch: int,
+                 max_attempts: int, backoff_initial: float, backoff_max: float):
+        self.transport = transport
+        self.coalesce_window = coalesce_window
+        self.max_batch = max(1, max_batch)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"spool-{transport.address}")
+        self._worker_task: Optional[asyncio.Task] = None
+        self._in_flight: List[PrintJob] = []
+        self.counters = {"jobs": 0, "writes": 0, "coalesced": 0, "retries": 0, "succeeded": 0, "failed": 0, "uncertain": 0}
+
+    def _ensure_worker(self):
+        if self._worker_task is None or self._worker_task.done():
+            self._worker_task = asyncio.create_task(self._worker(), name=f"spool-{self.transport.address}")
+
+    async def submit(self, serial_no: str, data: bytes, recall: Optional[bytes] = None) -> asyncio.Future:
+        """
+        Queues a label and returns a future for its final (success, error_message, accepted).
+        `recall` is the label's stored-format recall, sent instead of `data` if this printer holds the format.
+        """
+        self._ensure_worker()
+        outcome = asyncio.get_running_loop().create_future()
+        problem = self.problem()
+        if problem:
+            self.counters["jobs"] += 1
+            self.counters["failed"] += 1
+            logging.error(f"{problem}. S/N: {serial_no} not sent.")
+            outcome.set_result((False, problem, False))
+            return outcome
+        data = self.transport.label_bytes(data, recall)
+        await self._queue.put(PrintJob(serial_no, data, outcome)) # Waits only if the spool is full
+        self.counters["jobs"] += 1
+        return outcome
+
+    def depth(self) -> int:
+        """Labels queued or being sent."""
+        return self._queue.qsize() + len(self._in_flight)
+
+    def problem(self) -> Optional[str]:
+        """The printer's known problem from its health monitor, if any."""
+        monitor = printer_health.get_monitor(self.transport)
+        return monitor.problem() if monitor else None
+
+    async def _collect_batch(self) -> List[PrintJob]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.coalesce_window
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _send(self, payload: bytes, job_name: str, monitor):
+        """Writes to the printer, holding off the health monitor's ~HS poll (it would wait for the transport lock)."""
+        if monitor:
+            monitor.sending += 1
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self.transport.send, payload, job_name)
+        finally:
+            if monitor:
+                monitor.sending -= 1
+
+    @staticmethod
+    def _job_name(jobs: List[PrintJob]) -> str:
+        return f"ZPL_Coil_{jobs[0].serial_no}" if len(jobs) == 1 else f"ZPL_Coil_{jobs[0].serial_no}_+{len(jobs) - 1}"
+
+    def _finish(self, jobs: List[PrintJob], error_message: Optional[str], accepted: bool):
+        if error_message is None:
+            self.counters["succeeded"] += len(jobs)
+            logging.info(f"Sent {sum(len(job.data) for job in jobs)} bytes ({len(jobs)} label(s)) to {self.transport.describe()}: {', '.join(job.serial_no for job in jobs)}")
+        else:
+            self.counters["failed"] += len(jobs)
+            logging.error(f"{error_message} S/N: {', '.join(job.serial_no for job in jobs)}")
+        for job in jobs:
+            if not job.outcome.done():
+                job.outcome.set_result((error_message is None, error_message, accepted))
+            self._queue.task_done()
+
+    async def _worker(self):
+        while True:
+            batch = await self._collect_batch()
+            self._in_flight = batch
+            self.counters["writes"] += 1
+            self.counters["coalesced"] += len(batch) - 1
+            monitor = printer_health.get_monitor(self.transport)
+            pending = batch
+            error_message = None
+            error = None # The last attempt's exception
+            accepted = False # Set once an attempt got as far as writing to the printer
+            for attempt in range(1, self.max_attempts + 1):
+                if attempt > 1:
+                    self.counters["retries"] += 1
+                    delay = min(self.backoff_max, self.backoff_initial * (2 ** (attempt - 2)))
+                    logging.warning(f"Print attempt {attempt - 1} for {self._job_name(pending)} failed ({error}); retrying in {delay:.1f}s.")
+                    await asyncio.sleep(delay)
+                    error = None
+                problem = self.problem()
+                if problem:
+                    error_message = problem # Known to be down: no point waiting for a write timeout
+                    break
+                try:
+                    await self._send(b"".join(job.data for job in pending), self._job_name(pending), monitor)
+                    if monitor:
+                        monitor.record_send(True)
+                    self._finish(pending, None, True)
+                    pending = []
+                    break
+                except UncertainDeliveryError as e:
+                    # Every label that was started may have printed; only the ones after it can be sent again
+                    started, offset = 0, 0
+                    while started < len(pending) and offset < e.sent:
+                        offset += len(pending[started].data)
+                        started += 1
+                    self.counters["uncertain"] += started
+                    self._finish(pending[:started], f"Write to printer {self.transport.describe()} failed part-way, so the label may have printed; "
+                                                    f"it was not resent. Check the printer before reprinting. Error: {e}", True)
+                    pending = pending[started:]
+                    error, accepted = e, False # None of the remaining labels was written
+                    error_message = f"Failed to send ZPL to printer {self.transport.describe()} after {attempt} attempt(s). Error: {e}"
+                    if not pending:
+                        break
+                except Exception as e:
+                    error, accepted = e, accepted or not isinstance(e, PrinterUnreachableError)
+                    error_message = f"Failed to send ZPL to printer {self.transport.describe()} after {attempt} attempt(s). Error: {e}"
+
+            if monitor and isinstance(error, OSError):
+                monitor.record_send(False, str(error))
+            if pending:
+                self._finish(pending, error_message, accepted)
+            self._in_flight = []
+
+    async def drain(self, timeout: float):
+        """Waits for queued jobs to finish, then stops the worker and its thread."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Spool for {self.transport.describe()} still had {self._queue.qsize()} job(s) after {timeout}s.")
+        if self._worker_task is not None:
+            self._worker_task.cancel()
+            await asyncio.gather(self._worker_task, return_exceptions=True)
+            self._worker_task = None
+        # Anything left behind is reported as failed so print_log still gets a final status
+        for job in self._in_flight:
+            if not job.outcome.done(): # It may have been part of a write that was cut short
+                job.outcome.set_result((False, "Print service stopped while the label was being sent.", True))
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            if not job.outcome.done():
+                job.outcome.set_result((False, "Print service stopped before the label was sent.", False))
+        self._executor.shutdown(wait=False)
+        logging.info(f"Spool for {self.transport.describe()} stopped. Stats: {self.counters}")
+
+
+_spools: Dict[Tuple[str, str], PrinterSpool] = {}
+
+
+def get_spool(kind: Optional[str] = None, address: Optional[str] = None) -> PrinterSpool:
+    """Returns the spool for a printer (default: the configured one), creating it on first use."""
+    transport = get_transport(kind, address)
+    key = (transport.kind, transport.address)
+    spool = _spools.get(key)
+    if spool is None:
+        spool = PrinterSpool(
+            transport,
+            maxsize=config.PRINT_SPOOL_QUEUE_SIZE,
+            coalesce_window=config.PRINT_SPOOL_COALESCE_MS / 1000,
+            max_batch=config.PRINT_SPOOL_MAX_BATCH,
+            max_attempts=config.PRINT_RETRY_ATTEMPTS,
+            backoff_initial=config.PRINT_RETRY_BACKOFF,
+            backoff_max=config.PRINT_RETRY_BACKOFF_MAX
+        )
+        _spools[key] = spool
+    return spool
+
+
+async def drain_all(timeout: float):
+    """Drains every spool (used on shutdown)."""
+    await asyncio.gather(*(spool.drain(timeout) for spool in _spools.values()))
+    _spools.clear()
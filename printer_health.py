@@ -0,0 +1,173 @@
+# printer_health.py
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, Optional
+
+import config
+from db_handler import save_printer_status
+from printer_transport import PrinterTransport
+
+_STX = b"\x02"
+_ETX = b"\x03"
+
+
+def parse_host_status(reply: bytes) -> dict:
+    """
+    Parses a ~HS reply (three STX...ETX strings) into the flags the print path cares about.
+    Raises ValueError if the reply is incomplete.
+    """
+    strings = []
+    for frame in reply.split(_ETX)[:3]:
+        start = frame.find(_STX)
+        if start == -1:
+            raise ValueError(f"Malformed ~HS reply: {reply!r}")
+        strings.append(frame[start + 1:].decode("ascii", errors="replace").split(","))
+    if len(strings) < 2 or len(strings[0]) < 3 or len(strings[1]) < 3:
+        raise ValueError(f"Incomplete ~HS reply: {reply!r}")
+    return {
+        "paper_out": strings[0][1] == "1",
+        "paused": strings[0][2] == "1",
+        "head_up": strings[1][2] == "1",
+    }
+
+
+class PrinterHealthMonitor:
+    """
+    Polls one printer with ~HS and caches what it reports.
+
+    The print path calls `problem()` before sending, so labels for a printer known to be
+    unreachable, out of paper, paused or with its head open fail (or are diverted) at
+    once instead of waiting for a write timeout. Send results update the cached state
+    between polls.
+
+    A poll takes the transport's lock, so it is skipped while the print spool is sending;
+    the send result stands in for it. Skips stop once the flags are three intervals old,
+    so a printer running out of paper mid-run is still noticed. The state is saved to
+    printer_status for the dashboard when it changes, and otherwise every `heartbeat`
+    seconds so the dashboard can tell a quiet printer from a stopped service.
+    """
+
+    def __init__(self, transport: PrinterTransport, interval: float, timeout: float, heartbeat: float):
+        self.transport = transport
+        self.printer = transport.describe()
+        self.interval = interval
+        self.timeout = timeout
+        self.reachable: Optional[bool] = None # None until the first poll
+        self.paper_out = False
+        self.head_up = False
+        self.paused = False
+        self.error: Optional[str] = None
+        self.heartbeat = heartbeat
+        self.checked_at = 0.0
+        self.polled_at = 0.0
+        self.sending = 0 # Sends in progress, counted by the print spool
+        self._task: Optional[asyncio.Task] = None
+
+    def problem(self) -> Optional[str]:
+        """Why the printer cannot print right now, or None if it can (or its state is unknown/stale)."""
+        if self.reachable is None or time.monotonic() - self.checked_at > self.interval * 3:
+            return None
+        if not self.reachable:
+            return f"Printer {self.printer} is unreachable: {self.error}"
+        flags = [name for name, is_set in (("paper out", self.paper_out), ("head open", self.head_up), ("paused", self.paused)) if is_set]
+        if flags:
+            return f"Printer {self.printer} is not ready: {', '.join(flags)}"
+        return None
+
+    def as_dict(self) -> dict:
+        return {
+            "printer": self.printer,
+            "reachable": self.reachable,
+            "paper_out": self.paper_out,
+            "head_up": self.head_up,
+            "paused": self.paused,
+            "error": self.error,
+        }
+
+    def record_send(self, success: bool, error: Optional[str] = None):
+        """Folds the result of a label write into the cached state."""
+        if success:
+            self.reachable = True
+            self.error = None
+        else:
+            self.reachable = False
+            self.error = error
+        self.checked_at = time.monotonic()
+
+    def poll(self):
+        """Queries the printer once (blocking) and updates the cached state."""
+        try:
+            flags = parse_host_status(self.transport.query(b"~HS", self.timeout, frames=3))
+            self.reachable = True
+            self.paper_out = flags["paper_out"]
+            self.paused = flags["paused"]
+            self.head_up = flags["head_up"]
+            self.error = None
+        except Exception as e:
+            self.reachable = False
+            self.error = str(e) or type(e).__name__
+        self.checked_at = self.polled_at = time.monotonic()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        previous = saved = None
+        saved_at = 0.0
+        while True:
+            if not self.sending or time.monotonic() - self.polled_at >= self.interval * 3:
+                await loop.run_in_executor(None, self.poll)
+            state = self.as_dict()
+            if state != previous:
+                problem = self.problem()
+                if problem:
+                    logging.warning(problem)
+                elif previous is not None:
+                    logging.info(f"Printer {self.printer} is ready.")
+                previous = state
+            if state != saved or time.monotonic() - saved_at >= self.heartbeat:
+                try:
+                    await save_printer_status(**state)
+                    saved, saved_at = state, time.monotonic()
+                except Exception as e:
+                    logging.error(f"Failed to save status of printer {self.printer}: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=f"health-{self.printer}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+_monitors: Dict[str, PrinterHealthMonitor] = {}
+
+
+def get_monitor(transport: PrinterTransport) -> Optional[PrinterHealthMonitor]:
+    """The running monitor for a printer, or None if it is not being monitored."""
+    return _monitors.get(transport.describe())
+
+
+def start_monitors(transports: Iterable[PrinterTransport]):
+    """Starts a monitor for every printer that can answer ~HS. Must be called from the event loop."""
+    if config.PRINTER_HEALTH_INTERVAL <= 0:
+        return
+    for transport in transports:
+        if transport.describe() in _monitors:
+            continue
+        if type(transport).query is PrinterTransport.query:
+            logging.info(f"Printer {transport.describe()} cannot report its status; health monitoring skipped.")
+            continue
+        monitor = PrinterHealthMonitor(transport, config.PRINTER_HEALTH_INTERVAL, config.PRINTER_HEALTH_TIMEOUT,
+                                        config.PRINTER_STATUS_HEARTBEAT)
+        _monitors[monitor.printer] = monitor
+        monitor.start()
+        logging.info(f"Monitoring printer {monitor.printer} every {monitor.interval}s.")
+
+
+async def stop_all():
+    await asyncio.gather(*(monitor.stop() for monitor in _monitors.values()))
+    _monitors.clear()
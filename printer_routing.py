@@ -0,0 +1,134 @@
+# printer_routing.py
+import asyncio
+import itertools
+import logging
+import time
+from typing import List, Optional, Tuple
+
+import config
+import printer_health
+from db_handler import get_printer_routes
+from print_spool import get_spool
+from printer_transport import PrinterTransport, get_transport
+
+
+class PrinterRouter:
+    """
+    Picks the printer for each label from the machine_printer_routes table.
+
+    A machine's printers are grouped by priority. Within the first group that has a
+    healthy printer, the label goes to the one with the shortest spool queue (ties
+    taken in turn), so printers serving the same cell share the load. Printers the
+    health monitor reports as down are skipped. A label that never reached its printer
+    (it could not connect, or the health monitor reported a problem) is handed to the
+    next candidate; one that failed after being written to the printer may have printed,
+    so it is reported as failed there rather than printed again elsewhere. Machines
+    without routes use the configured PRINTER_TRANSPORT / PRINTER_IP printer.
+
+    The routes' version is read at most every `check_interval` seconds, so most labels
+    are routed without a database read.
+    """
+
+    def __init__(self, check_interval: float):
+        self.check_interval = check_interval
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._routes: dict = {}
+        self._turn = itertools.count()
+        self._deliveries = set()
+        self._stopping = False
+
+    async def refresh(self) -> dict:
+        """Reloads the routes if they changed and starts health monitors for newly routed printers."""
+        if self._version is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return self._routes
+        version, routes = await get_printer_routes(self._version)
+        self._checked_at = time.monotonic()
+        if routes is not None:
+            self._version = version
+            self._routes = routes
+            transports = [get_transport(printer["transport"], printer["address"]) for printers in routes.values() for printer in printers]
+            printer_health.start_monitors(transports)
+            logging.info(f"Loaded printer routes (version {version}) for {len(routes)} machine(s).")
+        return self._routes
+
+    async def candidates(self, machine_id: int) -> List[Tuple[PrinterTransport, str]]:
+        """The printers to try for a label from this machine, in order, each with the reason it was picked."""
+        routes = (await self.refresh()).get(machine_id)
+        if not routes:
+            if not config.PRINTER_IP:
+                return []
+            return [(get_transport(), "default")]
+
+        tiers = {}
+        for printer in routes:
+            tiers.setdefault(printer["priority"], []).append(get_transport(printer["transport"], printer["address"]))
+
+        turn = next(self._turn)
+        ordered = []
+        skipped = []
+        for tier_index, priority in enumerate(sorted(tiers)):
+            tier = tiers[priority]
+            healthy = []
+            for transport in tier:
+                monitor = printer_health.get_monitor(transport)
+                problem = monitor.problem() if monitor else None
+                if problem:
+                    skipped.append(f"{transport.describe()} ({problem})")
+                else:
+                    healthy.append(transport)
+            # Shortest queue first; equal queues are rotated so they take turns
+            healthy.sort(key=lambda t: (get_spool(t.kind, t.address).depth(), (tier.index(t) - turn) % len(tier)))
+            for transport in healthy:
+                if tier_index == 0 and not skipped:
+                    reason = "balanced" if len(tier) > 1 else "primary"
+                else:
+                    reason = f"fallback, skipped {', '.join(skipped)}"
+                ordered.append((transport, reason))
+
+        if not ordered:
+            # Nothing healthy: use the primary so the label fails with the printer's own problem
+            ordered.append((tiers[min(tiers)][0], f"no healthy printer, skipped {', '.join(skipped)}"))
+        return ordered
+
+    async def submit(self, machine_id: int, serial_no: str, data: bytes, recall: Optional[bytes] = None) -> asyncio.Future:
+        """
+        Queues a label on the chosen printer's spool and returns a future that resolves to
+        (success, error_message, printer, route) once it printed or every candidate failed.
+        Each printer gets `recall` instead of `data` if it holds the stored format.
+        """
+        loop = asyncio.get_running_loop()
+        result = loop.create_future()
+        candidates = await self.candidates(machine_id)
+        if not candidates:
+            result.set_result((False, "No printer is routed to this machine and PRINTER_IP is not set.", None, None))
+            return result
+
+        transport, route = candidates[0]
+        outcome = await get_spool(transport.kind, transport.address).submit(serial_no, data, recall)
+        task = asyncio.create_task(self._deliver(result, outcome, candidates, serial_no, data, recall))
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+        return result
+
+    async def _deliver(self, result: asyncio.Future, outcome: asyncio.Future, candidates: list, serial_no: str, data: bytes, recall: Optional[bytes]):
+        transport, route = candidates[0]
+        try:
+            success, error_message, accepted = await outcome
+            for next_transport, _ in candidates[1:]:
+                if success or accepted or self._stopping:
+                    break
+                logging.warning(f"S/N: {serial_no} failed on {transport.describe()} ({error_message}); failing over to {next_transport.describe()}.")
+                route = f"failover from {transport.describe()}: {error_message}"
+                transport = next_transport
+                success, error_message, accepted = await (await get_spool(transport.kind, transport.address).submit(serial_no, data, recall))
+        except Exception as e:
+            success, error_message = False, f"Print routing failed: {e}"
+        result.set_result((success, error_message, transport.describe(), route))
+
+    def stop(self):
+        """Stops failing over, so labels left over at shutdown are not queued on another printer."""
+        self._stopping = True
+
+
+printer_router = PrinterRouter(check_interval=config.PRINTER_ROUTES_CHECK_INTERVAL)
@@ -0,0 +1,293 @@
+# printer_transport.py
+import logging
+import select
+import socket
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import config
+from zpl_templates import session_preamble
+
+
+class PrinterUnreachableError(ConnectionError):
+    """The printer could not be reached, so none of the data was sent to it."""
+
+
+class UncertainDeliveryError(OSError):
+    """
+    A write failed after part of the data had gone to the printer, so some labels may
+    have printed. Resending them could print the same serial numbers twice.
+    """
+
+    def __init__(self, message: str, sent: int):
+        super().__init__(message)
+        self.sent = sent # Bytes that may have reached the printer
+
+
+class PrinterTransport:
+    """Sends raw ZPL bytes to one printer. Implementations must be safe to call from several threads."""
+
+    kind = "base"
+    # Whether the transport notices a printer restart, so stored formats can be sent again
+    supports_stored_formats = False
+
+    def __init__(self, address: str):
+        self.address = address
+        # Bumped every time a new connection to the printer is opened
+        self.generation = 0
+        # Sent ahead of the first label on every new connection (printer setup and stored formats)
+        self.preamble = b""
+
+    def describe(self) -> str:
+        return f"{self.kind}:{self.address}"
+
+    def label_bytes(self, full: bytes, recall: Optional[bytes]) -> bytes:
+        """Picks what to send for a label: the stored-format recall if this printer holds the format, else the full label."""
+        return recall if recall is not None and self.preamble else full
+
+    def send(self, data: bytes, job_name: str) -> int:
+        """
+        Sends one ZPL payload and returns the number of bytes written. Raises
+        PrinterUnreachableError if nothing was sent and UncertainDeliveryError if the write
+        failed part-way; other errors mean the printer was reached but took none of the data.
+        """
+        raise NotImplementedError
+
+    def query(self, command: bytes, timeout: float, frames: int) -> bytes:
+        """
+        Sends a status command (e.g. ~HS) and returns the reply once `frames` ETX-terminated
+        strings have arrived. Raises NotImplementedError if the printer cannot answer.
+        """
+        raise NotImplementedError(f"{self.kind} printers cannot be queried for status")
+
+    def close(self):
+        pass
+
+
+class Win32PrintTransport(PrinterTransport):
+    """
+    Windows shared printer via win32print (pywin32). Every send is a separate spooler job.
+    The spooler gives no sign of a printer restart, after which recalled stored formats
+    would print blank, so these printers always get full labels. Once the job has been
+    started, a failure may still leave it in the spooler, so it counts as uncertain.
+    """
+
+    kind = "win32"
+
+    def send(self, data: bytes, job_name: str) -> int:
+        import win32print # Windows-only (pywin32); imported here so other transports work without it
+
+        try:
+            hPrinter = win32print.OpenPrinter(self.address)
+        except Exception as e:
+            raise PrinterUnreachableError(f"Cannot open printer {self.address}: {e}") from e
+        self.generation += 1
+        try:
+            # The StartDocPrinter pDocInfo level 1 expects a tuple: (pDocName, pOutputFile, pDatatype)
+            # pOutputFile can be an empty string to print to the device. pDatatype "RAW" for ZPL.
+            doc_info_level_1 = (job_name, "", "RAW")
+            try:
+                win32print.StartDocPrinter(hPrinter, 1, doc_info_level_1)
+            except Exception as e:
+                raise PrinterUnreachableError(f"Cannot start a print job on {self.address}: {e}") from e
+            try:
+                win32print.StartPagePrinter(hPrinter)
+                bytes_written = win32print.WritePrinter(hPrinter, data)
+                win32print.EndPagePrinter(hPrinter)
+            except Exception as e:
+                raise UncertainDeliveryError(f"Print job on {self.address} failed after it was started: {e}", len(data)) from e
+            finally:
+                win32print.EndDocPrinter(hPrinter)
+        finally:
+            win32print.ClosePrinter(hPrinter)
+        if bytes_written < len(data):
+            raise UncertainDeliveryError(f"Printer {self.address} took {bytes_written} of {len(data)} bytes", bytes_written)
+        return bytes_written
+
+
+class RawTcpTransport(PrinterTransport):
+    """
+    Network Zebra on a raw TCP port (9100) over one persistent connection.
+
+    The socket is checked before every write and replaced when the printer has
+    closed it. Failed connection attempts back off exponentially up to
+    `backoff_max`, so an offline printer fails fast instead of stalling every label.
+    A restarted printer drops the connection, so the preamble is resent whenever
+    a new connection opens.
+
+    Writes count the bytes handed to the socket. A write that fails before any of them
+    is retried once on a new connection if the failed one was pooled (idle connections
+    can be dropped without notice); one that fails part-way is never resent here.
+    """
+
+    kind = "tcp"
+    supports_stored_formats = True
+
+    def __init__(self, host: str, port: int, connect_timeout: float, write_timeout: float,
+                 backoff_initial: float = 0.5, backoff_max: float = 30.0):
+        super().__init__(f"{host}:{port}")
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.write_timeout = write_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._next_attempt = 0.0
+
+    def _connect(self) -> socket.socket:
+        now = time.monotonic()
+        if now < self._next_attempt:
+            raise PrinterUnreachableError(f"Printer {self.address} unreachable, next reconnect attempt in {self._next_attempt - now:.1f}s")
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        except OSError as e:
+            self._failures += 1
+            delay = min(self.backoff_max, self.backoff_initial * (2 ** (self._failures - 1)))
+            self._next_attempt = time.monotonic() + delay
+            raise PrinterUnreachableError(f"Cannot connect to printer {self.address}: {e}") from e
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.preamble:
+            try:
+                sock.settimeout(self.write_timeout)
+                sock.sendall(self.preamble)
+            except OSError as e:
+                sock.close() # No label bytes have been sent yet
+                raise PrinterUnreachableError(f"Printer {self.address} did not take the session preamble: {e}") from e
+        self._failures = 0
+        self._next_attempt = 0.0
+        self.generation += 1
+        logging.info(f"Opened printer connection to {self.address} (generation {self.generation}, {len(self.preamble)} preamble bytes)")
+        return sock
+
+    def _is_healthy(self, sock: socket.socket) -> bool:
+        """A writable socket is readable only if the printer sent data or closed the connection."""
+        try:
+            readable, _, errored = select.select([sock], [], [sock], 0)
+            if errored:
+                return False
+            if readable:
+                # Unsolicited bytes (e.g. a late status reply) are discarded; b"" means the peer closed
+                sock.setblocking(False)
+                try:
+                    return sock.recv(4096) != b""
+                finally:
+                    sock.setblocking(True)
+            return True
+        except OSError:
+            return False
+
+    def _get_socket(self) -> socket.socket:
+        if self._sock is not None and not self._is_healthy(self._sock):
+            logging.warning(f"Printer connection to {self.address} was closed, reconnecting.")
+            self._drop()
+        if self._sock is None:
+            self._sock = self._connect()
+        return self._sock
+
+    def _drop(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def send(self, data: bytes, job_name: str) -> int:
+        with self._lock:
+            for attempt in (1, 2):
+                generation = self.generation
+                sock = self._get_socket()
+                pooled = self.generation == generation
+                sent = 0
+                try:
+                    sock.settimeout(self.write_timeout)
+                    while sent < len(data):
+                        sent += sock.send(data[sent:])
+                    return sent
+                except OSError as e:
+                    self._drop()
+                    if sent:
+                        raise UncertainDeliveryError(f"Write to printer {self.address} failed after {sent} of {len(data)} bytes: {e}", sent) from e
+                    # A pooled connection can fail on its first write after an idle period; retry once on a fresh one
+                    if attempt == 2 or not pooled:
+                        raise
+                    logging.warning(f"Write to printer {self.address} failed before any data was sent ({e}), retrying on a new connection.")
+
+    def query(self, command: bytes, timeout: float, frames: int) -> bytes:
+        with self._lock:
+            sock = self._get_socket()
+            try:
+                sock.settimeout(timeout)
+                sock.sendall(command)
+                reply = b""
+                deadline = time.monotonic() + timeout
+                while reply.count(b"\x03") < frames:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"No complete status reply from {self.address} within {timeout}s")
+                    sock.settimeout(remaining)
+                    chunk = sock.recv(1024)
+                    if not chunk:
+                        raise ConnectionError(f"Printer {self.address} closed the connection")
+                    reply += chunk
+                return reply
+            except OSError:
+                self._drop()
+                raise
+
+    def close(self):
+        with self._lock:
+            self._drop()
+
+
+_transports: Dict[Tuple[str, str], PrinterTransport] = {}
+_transports_lock = threading.Lock()
+
+
+def create_transport(kind: str, address: str) -> PrinterTransport:
+    """Builds a transport for a printer address: a share name for win32, "host" or "host:port" for tcp."""
+    if kind == "win32":
+        transport = Win32PrintTransport(address)
+    elif kind == "tcp":
+        host, _, port = address.partition(":")
+        transport = RawTcpTransport(
+            host,
+            int(port) if port else config.PRINTER_PORT,
+            connect_timeout=config.PRINTER_CONNECT_TIMEOUT,
+            write_timeout=config.PRINTER_WRITE_TIMEOUT,
+            backoff_max=config.PRINTER_RECONNECT_BACKOFF_MAX
+        )
+    else:
+        raise ValueError(f"Unknown printer transport '{kind}'. Expected 'win32' or 'tcp'.")
+    if config.PRINTER_STORED_FORMATS and transport.supports_stored_formats:
+        transport.preamble = session_preamble()
+    return transport
+
+
+def get_transport(kind: Optional[str] = None, address: Optional[str] = None) -> PrinterTransport:
+    """
+    Returns the shared transport for a printer, creating it on first use.
+    Defaults to PRINTER_TRANSPORT / PRINTER_IP from the configuration.
+    """
+    kind = (kind or config.PRINTER_TRANSPORT).lower()
+    address = address or config.PRINTER_IP
+    key = (kind, address)
+    with _transports_lock:
+        transport = _transports.get(key)
+        if transport is None:
+            transport = create_transport(kind, address)
+            _transports[key] = transport
+        return transport
+
+
+def close_all():
+    """Closes every pooled printer connection (used on shutdown)."""
+    with _transports_lock:
+        for transport in _transports.values():
+            transport.close()
+        _transports.clear()
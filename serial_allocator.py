@@ -0,0 +1,61 @@
+# serial_allocator.py
+import asyncio
+import logging
+from datetime import date
+from typing import Callable, Dict, Optional, Tuple
+
+import config
+from db_handler import reserve_serial_block
+
+
+class _SequenceBlock:
+    """A reserved range of sequence numbers for one day."""
+
+    def __init__(self, counter_date: date, first: int, last: int):
+        self.counter_date = counter_date
+        self.next = first
+        self.last = last
+
+
+class SerialAllocator:
+    """
+    Hands out daily serial sequences from blocks reserved in serial_number_counter.
+
+    One transaction reserves `block_size` numbers and moves the persisted high-water
+    mark past them, so the rest of the block is served from memory. Numbers left in a
+    block when the process stops (or when the day rolls over) are skipped, never reused.
+    With `per_machine` each machine reserves from its own counter row, so coilers do
+    not contend with each other.
+    """
+
+    def __init__(self, block_size: int, per_machine: bool, today: Callable[[], date] = date.today):
+        self.block_size = max(1, block_size)
+        self.per_machine = per_machine
+        self._today = today
+        self._blocks: Dict[Optional[int], _SequenceBlock] = {}
+        self._locks: Dict[Optional[int], asyncio.Lock] = {}
+        self.reservations = 0
+
+    async def next_sequence(self, machine_id: int) -> Tuple[date, int]:
+        """Returns the (date, sequence) pair to use for the next serial number."""
+        key = machine_id if self.per_machine else None
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            today = self._today()
+            block = self._blocks.get(key)
+            if block is None or block.counter_date != today or block.next > block.last:
+                # Reserve a fresh block; a new day always starts a new block
+                last = await reserve_serial_block(today, self.block_size, key)
+                block = _SequenceBlock(today, last - self.block_size + 1, last)
+                self._blocks[key] = block
+                self.reservations += 1
+                logging.debug(f"Reserved serial block {block.next}-{block.last} for {today} (machine key: {key})")
+            sequence = block.next
+            block.next += 1
+            return today, sequence
+
+
+serial_allocator = SerialAllocator(
+    block_size=config.SERIAL_BLOCK_SIZE,
+    per_machine=config.SERIAL_PER_MACHINE
+)
@@ -0,0 +1,147 @@
+# sql_queries.py
+# The SQL of the hot queries, shared by db_handler (which runs it) and create_db.py
+# (whose --check-plans explains exactly these statements). Plain strings and the
+# standard library only, so create_db.py can import it without the service's config.
+import re
+from datetime import date
+from typing import Optional
+
+# Every print_log write and result goes through these
+PRINT_LOG_INSERT = """
+    INSERT INTO print_log (
+        serial_number, machine_id, work_order_no, product_id,
+        actual_length, defect_type, mqtt_payload,
+        print_status, error_message, zpl_content, printer, route
+    )
+    VALUES (:sn, :mid, :wo, :pid, :len, :defect, :payload, :status, :err, :zpl, :printer, :route)
+"""
+
+# Adds a new print_log row to its work order's running totals in production_summary;
+# takes the row's own parameters, so it can run as executemany after the inserts
+SUMMARY_ADD = """
+    INSERT INTO production_summary (
+        work_order_no, machine_id, coil_count, total_length,
+        last_print_id, last_serial_number, last_length, last_status, last_error
+    )
+    VALUES (:wo, :mid, 1, COALESCE(:len, 0), (SELECT id FROM print_log WHERE serial_number = :sn), :sn, :len, :status, :err)
+    ON CONFLICT(work_order_no, machine_id) DO UPDATE SET
+        coil_count = coil_count + 1,
+        total_length = total_length + COALESCE(excluded.last_length, 0),
+        last_print_id = excluded.last_print_id,
+        last_serial_number = excluded.last_serial_number,
+        last_length = excluded.last_length,
+        last_status = excluded.last_status,
+        last_error = excluded.last_error
+"""
+
+# Parameters: sn, status, err, zpl, printer, route
+PRINT_LOG_COMPLETE = """
+    UPDATE print_log
+    SET print_status = :status, error_message = :err, zpl_content = :zpl, printer = :printer, route = :route
+    WHERE serial_number = :sn AND print_status = 'PENDING'
+"""
+
+# Only if it is still the latest label of its work order on that machine
+SUMMARY_COMPLETE = """
+    UPDATE production_summary
+    SET last_status = :status, last_error = :err
+    WHERE (work_order_no, machine_id) = (SELECT work_order_no, machine_id FROM print_log WHERE serial_number = :sn)
+      AND last_serial_number = :sn
+"""
+
+# Columns a print_log page or export may ask for; the payload and ZPL blobs are left out unless named
+PRINT_LOG_COLUMNS = (
+    "id", "serial_number", "machine_id", "work_order_no", "product_id", "actual_length", "defect_type",
+    "print_timestamp", "print_status", "error_message", "printer", "route", "mqtt_payload", "zpl_content"
+)
+PRINT_LOG_DEFAULT_COLUMNS = PRINT_LOG_COLUMNS[:-2]
+PRINT_LOG_STATUSES = ("PENDING", "SUCCESS", "FAILED")
+FAILED_PRINT_COLUMNS = ("id", "serial_number", "work_order_no", "machine_id", "print_timestamp", "error_message", "zpl_content")
+
+def print_log_query(columns, machine_id: Optional[int] = None, work_order_no: Optional[str] = None, status: Optional[str] = None,
+                    since: Optional[str] = None, until: Optional[str] = None, after_id: Optional[int] = None,
+                    limit: Optional[int] = None):
+    """Builds the SELECT for print_log rows newest first, with its parameters."""
+    conditions = []
+    params = {}
+    for name, value, condition in (
+        ("machine_id", machine_id, "machine_id = :machine_id"),
+        ("work_order_no", work_order_no, "work_order_no = :work_order_no"),
+        ("status", status, "print_status = :status"),
+        ("since", since, "print_timestamp >= :since"),
+        ("until", until, "print_timestamp < :until"),
+        ("after_id", after_id, "id < :after_id"), # Keyset cursor: the last id of the previous page
+    ):
+        if value is not None:
+            conditions.append(condition)
+            params[name] = value
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    limit_clause = ""
+    if limit is not None:
+        limit_clause = "LIMIT :limit"
+        params["limit"] = limit
+    return f"SELECT {', '.join(columns)} FROM print_log {where} ORDER BY id DESC {limit_clause}", params
+
+# The work order fields the dashboard shows; raw_json_data (the whole NetSuite record) only on request
+WORK_ORDER_COLUMNS = """
+    id, work_order_no, mcpl_part_code, customer_part_code, customer_name, total_quantity,
+    mfg_process_name, location, wire_type, guage, main_color, bi_color, work_order_date, last_fetched_at
+"""
+
+def _contains(value: str) -> str:
+    """A LIKE pattern (with ESCAPE '\\') matching text that contains value."""
+    return "%" + re.sub(r"([\\%_])", r"\\\1", value) + "%"
+
+def _fts_query(search: str) -> Optional[str]:
+    """Turns free text into an FTS5 query: every word must match, as a word prefix."""
+    words = re.findall(r"\w+", search)
+    return " ".join(f'"{word}"*' for word in words) or None
+
+def work_order_query(search: Optional[str] = None, customer: Optional[str] = None, part_code: Optional[str] = None,
+                     wire_type: Optional[str] = None, process: Optional[str] = None, location: Optional[str] = None,
+                     date_from: Optional[date] = None, date_to: Optional[date] = None,
+                     after: Optional[str] = None, limit: int = 50, include_raw: bool = False):
+    """
+    Builds the SELECT for one page of work orders ordered by work order number (one row
+    more than limit, to tell whether there is a next page), with its parameters.
+    """
+    conditions = []
+    params = {"limit": limit + 1}
+    fts_query = _fts_query(search) if search else None
+    if fts_query:
+        conditions.append("id IN (SELECT rowid FROM work_orders_fts WHERE work_orders_fts MATCH :fts_query)")
+        params["fts_query"] = fts_query
+    if customer:
+        conditions.append("customer_name LIKE :customer ESCAPE '\\'")
+        params["customer"] = _contains(customer)
+    if part_code:
+        conditions.append("(mcpl_part_code LIKE :part_code ESCAPE '\\' OR customer_part_code LIKE :part_code ESCAPE '\\')")
+        params["part_code"] = _contains(part_code)
+    if wire_type:
+        conditions.append("wire_type = :wire_type COLLATE NOCASE")
+        params["wire_type"] = wire_type
+    if process:
+        conditions.append("mfg_process_name LIKE :process ESCAPE '\\'")
+        params["process"] = _contains(process)
+    if location:
+        conditions.append("location LIKE :location ESCAPE '\\'")
+        params["location"] = _contains(location)
+    if date_from:
+        conditions.append("work_order_day >= :date_from")
+        params["date_from"] = date_from.isoformat()
+    if date_to:
+        conditions.append("work_order_day <= :date_to")
+        params["date_to"] = date_to.isoformat()
+    if after is not None:
+        conditions.append("work_order_no > :after")
+        params["after"] = after
+
+    columns = WORK_ORDER_COLUMNS + (", raw_json_data" if include_raw else "")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"""
+        SELECT {columns}
+        FROM work_orders
+        {where}
+        ORDER BY work_order_no
+        LIMIT :limit
+    """, params
@@ -0,0 +1,215 @@
+# sync_jobs.py
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+import config
+import netsuite_handler
+from db_handler import get_sync_cursor, save_sync_cursor
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class SyncJob:
+    """One NetSuite sync: its window, the phase it has reached and what it has counted so far."""
+
+    def __init__(self, created_at_min: Optional[str], trigger: str):
+        self.id = uuid.uuid4().hex
+        self.created_at_min = created_at_min # None: incremental, from the sync cursor
+        self.window = created_at_min # The created_at_min actually fetched
+        self.trigger = trigger # "manual", "scheduled" or "full"
+        self.phase = "queued"
+        self.counts = {}
+        self.error = None
+        self.submitted_at = _now()
+        self.started_at = None
+        self.finished_at = None
+        self._started = None
+        self._finished = None
+        self.task = None
+
+    @property
+    def active(self) -> bool:
+        return self.phase not in ("done", "failed")
+
+    def progress(self, phase: str, **counts):
+        """Called by netsuite_handler as the sync moves on."""
+        self.phase = phase
+        self.counts.update(counts)
+
+    def to_dict(self) -> dict:
+        if self._started is None:
+            duration = None
+        else:
+            duration = round((self._finished or time.monotonic()) - self._started, 3)
+        return {
+            "job_id": self.id,
+            "created_at_min": self.created_at_min,
+            "incremental": self.created_at_min is None,
+            "window": self.window,
+            "trigger": self.trigger,
+            "phase": self.phase,
+            "counts": self.counts,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration_seconds": duration,
+        }
+
+
+class SyncJobManager:
+    """
+    Runs NetSuite syncs as background jobs, one at a time.
+
+    submit() returns at once with a job to poll. A request for a window that a queued or
+    running job already covers gets that job back instead of starting another sync, so a
+    double click costs one fetch. The last HISTORY jobs are kept for the status endpoint.
+
+    A job without created_at_min is incremental: it fetches from the query's sync cursor,
+    the date the last complete sync started (less CURSOR_OVERLAP_DAYS, for orders entered
+    around midnight or in another time zone), or lookback_days back before the first one.
+    A successful sync whose window starts no later than that moves the cursor to the day
+    it started. Orders fetched again are skipped by their content hash. With an interval, a
+    scheduler submits an incremental sync every interval minutes.
+
+    The RESTlet only filters on the creation date, so an incremental sync never sees an
+    order created before its window that was changed later. Every full_sync_interval hours
+    the scheduler fetches the last full_sync_days of orders instead, which picks those
+    changes up; when the last one ran is kept in sync_cursors, so restarts do not put it off.
+    """
+
+    HISTORY = 50
+    CURSOR_OVERLAP_DAYS = 1
+
+    def __init__(self, interval: float, lookback_days: int, full_sync_interval: float = 0, full_sync_days: int = 0):
+        self.interval = interval
+        self.lookback_days = lookback_days
+        self.full_sync_interval = full_sync_interval
+        self.full_sync_days = full_sync_days
+        self._jobs: "OrderedDict[str, SyncJob]" = OrderedDict()
+        self._lock = asyncio.Lock()
+        self._scheduler = None
+        self.counters = {"submitted": 0, "coalesced": 0, "succeeded": 0, "failed": 0}
+
+    def submit(self, created_at_min: Optional[str] = None, trigger: str = "manual") -> Tuple[SyncJob, bool]:
+        """Queues a sync of the orders created since created_at_min (None: since the cursor). Returns (job, coalesced)."""
+        for job in self._jobs.values():
+            if job.active and job.created_at_min == created_at_min:
+                self.counters["coalesced"] += 1
+                return job, True
+        job = SyncJob(created_at_min, trigger)
+        job.task = asyncio.create_task(self._run(job), name=f"netsuite-sync-{job.id}")
+        self._jobs[job.id] = job
+        self.counters["submitted"] += 1
+        self._trim()
+        return job, False
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(self._jobs) - self.HISTORY)]:
+            del self._jobs[job_id]
+
+    async def _run(self, job: SyncJob):
+        async with self._lock: # One sync at a time; later jobs wait as "queued"
+            job.started_at, job._started = _now(), time.monotonic()
+            try:
+                started_on = date.today()
+                cursor = await get_sync_cursor(netsuite_handler.SYNC_CURSOR_KEY)
+                if cursor:
+                    incremental_from = date.fromisoformat(cursor["high_water"]) - timedelta(days=self.CURSOR_OVERLAP_DAYS)
+                else:
+                    incremental_from = started_on - timedelta(days=self.lookback_days)
+                job.window = job.window or incremental_from.isoformat()
+                success = await netsuite_handler.main(created_at_min=job.window, progress=job.progress)
+                if not success:
+                    job.error = f"NetSuite sync failed in phase '{job.phase}'; see the API log."
+                else:
+                    if self._covers(job.window, incremental_from):
+                        # Everything since the cursor has been fetched; a later window would leave a gap
+                        await save_sync_cursor(netsuite_handler.SYNC_CURSOR_KEY, started_on.isoformat(), job.counts)
+                    if job.trigger == "full":
+                        await save_sync_cursor(self._full_sync_key(), job.started_at, job.counts)
+            except asyncio.CancelledError:
+                job.error = "Cancelled at shutdown."
+                raise
+            except Exception as e:
+                job.error = f"NetSuite sync failed in phase '{job.phase}': {e}"
+                logging.error(f"NetSuite sync job {job.id} failed: {e}")
+            finally:
+                job.finished_at, job._finished = _now(), time.monotonic()
+                job.phase = "failed" if job.error else "done"
+                self.counters["failed" if job.error else "succeeded"] += 1
+        logging.info(f"NetSuite sync job {job.id} ({job.trigger}, created_at_min={job.window}) {job.phase} "
+                     f"in {job._finished - job._started:.1f}s: {job.counts}")
+
+    @staticmethod
+    def _covers(window: str, incremental_from: date) -> bool:
+        try:
+            return date.fromisoformat(window) <= incremental_from
+        except ValueError: # Not a YYYY-MM-DD date, so the window cannot be compared
+            return False
+
+    @staticmethod
+    def _full_sync_key() -> str:
+        return f"{netsuite_handler.SYNC_CURSOR_KEY}:full"
+
+    async def _full_sync_window(self) -> Optional[str]:
+        """The created_at_min of a full sync if one is due, else None (an incremental sync)."""
+        if self.full_sync_interval <= 0 or self.full_sync_days <= 0:
+            return None
+        last = await get_sync_cursor(self._full_sync_key())
+        if last and datetime.now(timezone.utc) - datetime.fromisoformat(last["high_water"]) < timedelta(hours=self.full_sync_interval):
+            return None
+        return (date.today() - timedelta(days=self.full_sync_days)).isoformat()
+
+    def get(self, job_id: str) -> Optional[SyncJob]:
+        return self._jobs.get(job_id)
+
+    def recent(self) -> list:
+        """The kept jobs, newest first."""
+        return [job.to_dict() for job in reversed(self._jobs.values())]
+
+    def start_scheduler(self):
+        """Starts the periodic incremental sync if an interval is configured."""
+        if self.interval > 0 and self._scheduler is None:
+            self._scheduler = asyncio.create_task(self._schedule(), name="netsuite-sync-scheduler")
+            logging.info(f"Syncing NetSuite work orders every {self.interval:g} minute(s).")
+            if self.full_sync_interval > 0 and self.full_sync_days > 0:
+                logging.info(f"Resyncing the last {self.full_sync_days} day(s) of work orders every {self.full_sync_interval:g} hour(s).")
+
+    async def _schedule(self):
+        while True:
+            try:
+                window = await self._full_sync_window()
+                job, _ = self.submit(window, trigger="full" if window else "scheduled")
+                await asyncio.shield(job.task) # The next interval starts once this sync is over
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Scheduled NetSuite sync failed: {e}")
+            await asyncio.sleep(self.interval * 60)
+
+    async def stop(self):
+        """Stops the scheduler and cancels syncs still running or queued."""
+        tasks = [job.task for job in self._jobs.values() if job.active]
+        if self._scheduler is not None:
+            tasks.append(self._scheduler)
+            self._scheduler = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+sync_jobs = SyncJobManager(
+    interval=config.NETSUITE_SYNC_INTERVAL,
+    lookback_days=config.NETSUITE_SYNC_LOOKBACK_DAYS,
+    full_sync_interval=config.NETSUITE_FULL_SYNC_INTERVAL,
+    full_sync_days=config.NETSUITE_FULL_SYNC_DAYS
+)
@@ -0,0 +1,226 @@
+# zpl_templates.py
+import operator
+import re
+from typing import Dict, Iterable, List, Sequence
+
+# ^FH uses "_" as the hex indicator: any of these characters in field data must be sent as _XX
+_FH_ESCAPES = {"_": "_5F", "^": "_5E", "~": "_7E"}
+_FH_ESCAPE_RE = re.compile(r"[_^~]")
+_SLOT_RE = re.compile(r"\{(\w+)\}")
+_LABEL_BLOCK_RE = re.compile(r"\^XA.*?\^XZ", re.S)
+# An ^FD...^FS field whose data contains at least one {name} placeholder
+_VARIABLE_FIELD_RE = re.compile(r"\^FD([^\^]*\{\w+\}[^\^]*)\^FS")
+_SAVE_SETTINGS_RE = re.compile(r"\^JUS")
+
+
+def escape_field(value) -> str:
+    """Escapes a field value for use after ^FH so it cannot terminate or inject ZPL commands."""
+    text = str(value)
+    if "_" in text or "^" in text or "~" in text:
+        return _FH_ESCAPE_RE.sub(lambda m: _FH_ESCAPES[m.group(0)], text)
+    return text
+
+
+class ZplTemplate:
+    """
+    A ZPL layout compiled once into static segments and field slots.
+
+    The source is plain ZPL with {name} placeholders. Surrounding whitespace is
+    stripped from every line when compiling, so rendering a label only escapes the
+    field values and joins them with the static segments.
+    """
+
+    def __init__(self, name: str, source: str, encoding: str = "utf-8"):
+        self.name = name
+        self.encoding = encoding
+        lines = [line.strip() for line in source.strip().splitlines()]
+        compiled = "\n".join(line for line in lines if line) + "\n"
+
+        self.segments: List[str] = []
+        self.slots: List[str] = []
+        position = 0
+        for match in _SLOT_RE.finditer(compiled):
+            self.segments.append(compiled[position:match.start()])
+            self.slots.append(match.group(1))
+            position = match.end()
+        self.segments.append(compiled[position:])
+        self.fields = frozenset(self.slots)
+        self.static_bytes = sum(len(segment.encode(encoding)) for segment in self.segments)
+        # Looks up the values of all slots in one call (itemgetter returns a bare value for a single key)
+        self._lookup = operator.itemgetter(*self.slots) if len(self.slots) > 1 else None
+
+    def _slot_values(self, values: Dict[str, object]) -> Sequence[str]:
+        if self._lookup is not None:
+            slot_values = self._lookup(values)
+        else:
+            slot_values = [values[slot] for slot in self.slots]
+        try:
+            probe = "".join(slot_values) # All values run together, to look for characters to escape in one pass
+        except TypeError:
+            slot_values = [str(value) for value in slot_values]
+            probe = "".join(slot_values)
+        # Field data rarely needs escaping, so only escape value by value when the probe finds something
+        if "_" in probe or "^" in probe or "~" in probe:
+            slot_values = [escape_field(value) for value in slot_values]
+        return slot_values
+
+    def render(self, values: Dict[str, object]) -> bytes:
+        """Returns the label as bytes. Raises KeyError if a field value is missing."""
+        # Static segments at the even positions, field values between them
+        parts = [""] * (len(self.segments) + len(self.slots))
+        parts[0::2] = self.segments
+        parts[1::2] = self._slot_values(values)
+        return "".join(parts).encode(self.encoding)
+
+
+class StoredFormat:
+    """
+    A layout split into the parts a printer session sends once and the part sent per label.
+
+    - setup: every ^XA...^XZ block before the label itself (printer configuration),
+      without ^JUS: it is applied per connection, not saved to flash.
+    - download: the label stored on the printer with ^DF; each variable ^FD field
+      becomes an ^FN field. Static text and the ^GFA logo stay in the stored format.
+    - recall: an ^XF label that fills in the ^FN fields, rendered like any ZplTemplate.
+
+    Fields with identical data (e.g. the part number in the barcode and as text)
+    share one ^FN number, so the value is only sent once.
+    """
+
+    def __init__(self, name: str, source: str, device: str = "R:"):
+        self.name = name
+        self.path = f"{device}{name.upper()}.ZPL"
+        lines = [line.strip() for line in source.strip().splitlines()]
+        compiled = "\n".join(line for line in lines if line)
+        blocks = _LABEL_BLOCK_RE.findall(compiled)
+        if not blocks:
+            raise ValueError(f"Layout '{name}' has no ^XA...^XZ label.")
+
+        field_numbers: Dict[str, int] = {}
+
+        def to_field_number(match) -> str:
+            number = field_numbers.setdefault(match.group(1), len(field_numbers) + 1)
+            return f"^FN{number}^FS"
+
+        label_body = _VARIABLE_FIELD_RE.sub(to_field_number, blocks[-1][len("^XA"):-len("^XZ")])
+        # The setup goes out on every new connection: apply it without ^JUS, which would
+        # write the printer's flash each time
+        setup_blocks = [_SAVE_SETTINGS_RE.sub("", block) for block in blocks[:-1]]
+        self.setup = "".join(block + "\n" for block in setup_blocks).encode("utf-8")
+        self.download = f"^XA^DF{self.path}^FS{label_body}^XZ\n".encode("utf-8")
+        recall_fields = "\n".join(f"^FN{number}^FH^FD{data}^FS" for data, number in field_numbers.items())
+        # ^CI28 so the field data is read as UTF-8, as in the full layout
+        self.recall = ZplTemplate(f"{name}:recall", f"^XA^XF{self.path}^FS^CI28\n{recall_fields}\n^CI27^XZ")
+
+    def render(self, values: Dict[str, object]) -> bytes:
+        """Returns the per-label recall. Only valid once `setup` and `download` reached the printer."""
+        return self.recall.render(values)
+
+_LAYOUTS: Dict[str, ZplTemplate] = {}
+_STORED_FORMATS: Dict[str, StoredFormat] = {}
+
+
+def register_layout(name: str, source: str, stored: bool = False) -> ZplTemplate:
+    """
+    Compiles and registers a named layout, replacing any previous layout with that name.
+    With stored=True a StoredFormat is registered as well, for printer sessions.
+    """
+    template = ZplTemplate(name, source)
+    _LAYOUTS[name] = template
+    if stored:
+        _STORED_FORMATS[name] = StoredFormat(name, source)
+    return template
+
+
+def get_layout(name: str) -> ZplTemplate:
+    """Returns a registered layout. Raises KeyError for unknown names."""
+    return _LAYOUTS[name]
+
+
+def get_stored_format(name: str) -> StoredFormat:
+    """Returns a registered stored format. Raises KeyError for unknown names."""
+    return _STORED_FORMATS[name]
+
+
+def layout_names() -> Iterable[str]:
+    return tuple(_LAYOUTS)
+
+
+def session_preamble() -> bytes:
+    """
+    Everything a printer needs before it can print recalled labels: each stored
+    format's setup block and ^DF download. Sent when a printer connection opens.
+    """
+    setup = b""
+    downloads = b""
+    for stored_format in _STORED_FORMATS.values():
+        if stored_format.setup not in setup:
+            setup += stored_format.setup
+        downloads += stored_format.download
+    return setup + downloads
+
+
+# --- Built-in layouts ---
+
+# Coil label: a direct translation of the ZPL from the original Java code, including
+# the printer setup header. Every {field} sits inside an ^FH field.
+COIL_LABEL_ZPL = """
+^XA~TA000~JSN^LT0^MNW^MTT^PON^PMN^LH0,0^JMA^PRA,8~SD15^JUS^LRN^CI27^PA0,1,1,0^XZ
+^XA
+^MMT
+^PW799
+^LL400
+^LS0
+^FO17,43^GB690,351,2^FS
+^FT31,73^A0N,23,23^FH^CI28^FD{description}^FS^CI27
+^FT257,73^A0N,23,25^FH^CI28^FD{type_str}^FS^CI27
+^FT31,132^A0N,23,23^FH^CI28^FDSIZE^FS^CI27
+^FT257,130^A0N,23,23^FH^CI28^FD{size_str} {size_uom}^FS^CI27
+^FT31,161^A0N,23,23^FH^CI28^FDCOLOUR^FS^CI27
+^FT257,161^A0N,23,23^FH^CI28^FD{color}^FS^CI27
+^FT31,217^A0N,23,23^FH^CI28^FDCUSTOMER^FS^CI27
+^FT255,217^A0N,23,23^FH^CI28^FD{client_name}^FS^CI27
+^FT31,187^A0N,23,23^FH^CI28^FDLOT NO^FS^CI27
+^FT257,187^A0N,23,23^FH^CI28^FD{lot_no}^FS^CI27
+^FT31,246^A0N,23,23^FH^CI28^FDCOIL LENGTH^FS^CI27
+^FT257,246^A0N,23,19^FH^CI28^FD{length} {length_uom}{qa_text}^FS^CI27
+^FT31,306^A0N,23,23^FH^CI28^FDP.O No^FS^CI27
+^FT255,306^A0N,23,23^FH^CI28^FD{po_no}^FS^CI27
+^FT31,277^A0N,23,23^FH^CI28^FDOPERATOR^FS^CI27
+^FT257,275^A0N,23,23^FH^CI28^FD{operator_name}^FS^CI27
+^FT32,367^A0N,20,13^FH^CI28^FDMfg By^FS^CI27
+^BY1,3,50^FT477,105^BCN,,N,N^FH^FD{fg_part_no}^FS
+^FT257,96^A0N,23,20^FH^CI28^FD{fg_part_no}^FS^CI27
+^FT31,337^A0N,23,23^FH^CI28^FDDATE^FS^CI27
+^FT257,337^A0N,23,23^FH^CI28^FD{print_date}^FS^CI27
+^FT257,370^A0N,23,23^FH^CI28^FD{serial_no}^FS^CI27
+^FT31,103^A0N,23,23^FH^CI28^FDFG PART NO^FS^CI27
+^FT480,390^BQN,2,4^FH^FDPLAP{fg_part_no}|Q{length}|S{serial_no}|D{print_date}|L{lot_no}^FS
+^BY1,3,41^FT480,180^BCN,,N,N^FH^FD{length} {length_uom}^FS
+^FO248,54^GB0,335,3^FS
+^FO708,84^GFA,257,3540,12,:Z64:eJztlzEOwjAMRV2CVIklNyA7l8jR2qNk7iXIcTpmRCgCYsexu7AxMDhLn37V99qxAJetnRXohHc7HcE3fMGPdvOb3/zmN7/5zW9+85vf/H/sv213ZPozoJXveEZ8YmaubXfMj8YTc0ER8468dM7IsXOSLIe96Eeg0u5EPwKlv7PqOZA7R9F//95Z9D3wZJ5UT4F98CJ6CqTBQfQYGHoMVNmd6DFQDiz6FsjKMSkHRbiuyufDfuLrBxF0zD0=:0104^FS
+^FT712,28^A0N,20,20^FH^CI28^FDINSERT^FS^CI27
+^FT723,49^A0N,20,20^FH^CI28^FDTHIS^FS^CI27
+^FT723,70^A0N,20,20^FH^CI28^FDWAY^FS^CI27
+^FT78,370^A0N,27,20^FH^CI28^FDMCPL - {plant_code}^FS^CI27
+^FT408,33^A0N,25,25^FH^CI28^FDFINISH GOODS BARCODE^FS^CI27
+^FT62,33^A0N,25,25^FH^CI28^FDMALHOTRA CABLES^FS^CI27
+^PQ1,0,1,Y
+^XZ
+"""
+
+# Test label for checking a printer's alignment and connection
+TEST_LABEL_ZPL = """
+^XA
+^PW799
+^LL400
+^FO17,43^GB690,351,2^FS
+^FT62,100^A0N,40,40^FH^CI28^FDPRINTER TEST^FS^CI27
+^FT62,170^A0N,25,25^FH^CI28^FD{printer_name}^FS^CI27
+^FT62,220^A0N,25,25^FH^CI28^FD{timestamp}^FS^CI27
+^PQ1,0,1,Y
+^XZ
+"""
+
+register_layout("coil", COIL_LABEL_ZPL, stored=True)
+register_layout("test", TEST_LABEL_ZPL)